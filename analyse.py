@@ -1,8 +1,5 @@
 import streamlit as st
 import pandas as pd
-import pyarrow.parquet as pq
-import pyarrow as pa
-import boto3
 import io
 from datetime import date, datetime, timedelta
 
@@ -13,12 +10,10 @@ from datetime import date, datetime, timedelta
 PARQUET_KEY = "calc/bil/bil_time.parquet"
 FINN_BASE_URL = "https://www.finn.no/mobility/item/"
 
-from config import (
-    AWS_KEY,
-    AWS_SECRET,
-    AWS_REGION,
-    S3_BUCKET_NAME,
-)
+from rekordrask_parquet import hent_salgshendelser
+
+# Grupperingsnavn -> kolonne i hendelsestabellen (verdien fra bilens første snapshot)
+HENDELSE_KOLONNE = {"Merke": "foerst_Merke", "Modell": "foerst_Modell", "År": "foerst_Årstall", "Drivstoff": "foerst_Drivstoff"}
 GRUPPERINGSNIVAAER = {
     "1. Produsent": ["Merke"],
     "2. Produsent + Modell": ["Merke", "Modell"],
@@ -31,40 +26,17 @@ GRUPPERINGSNIVAAER = {
 # 2. BAKEND LOGIKK
 # ======================================================
 
-def _get_s3_client():
-    return boto3.client (
-        "s3",
-        aws_access_key_id=AWS_KEY,
-        aws_secret_access_key=AWS_SECRET,
-        region_name=AWS_REGION,
-    )
-
-
 @st.cache_data (ttl=3600)
-def last_data_fra_s3():
+def last_salgshendelser():
+    # Én rad per FinnKode (første gang sett, salg, første snapshots felt som tekst),
+    # oppdatert inkrementelt fra snapshot-filen – se rekordrask_parquet
     try:
-        s3 = _get_s3_client ()
-        obj = s3.get_object (Bucket=S3_BUCKET_NAME, Key=PARQUET_KEY)
-        data = obj["Body"].read ()
-        table = pq.read_table (pa.BufferReader (data))
-        df = table.to_pandas ()
-        df.columns = [str (c).strip () for c in df.columns]
-
-        if "snapshot_time" in df.columns:
-            df["snapshot_time"] = pd.to_datetime (df["snapshot_time"], errors="coerce")
-        else:
-            return pd.DataFrame ()
-        return df
+        return hent_salgshendelser (bakgrunn=False)
     except Exception as e:
         st.error (f"Feil ved henting: {e}")
         return pd.DataFrame ()
 
 
-def _is_sold_strict(pris_val) -> bool:
-    if pd.isna (pris_val): return False
-    return "solgt" in str (pris_val).lower ()
-
-
 def _extract_numeric(val):
     if pd.isna (val): return 0
     s = str (val).strip ().replace (" ", "").replace ("\xa0", "").replace ("kr", "")
@@ -74,84 +46,68 @@ def _extract_numeric(val):
         return 0
 
 
+def _forst(hend: pd.DataFrame, col: str, mangler: str) -> pd.Series:
+    # Tekst fra første snapshot; `mangler` der kolonnen ikke fantes i snapshotene
+    verdier = hend[col] if col in hend.columns else pd.Series (None, index=hend.index, dtype=object)
+    return verdier.astype (object).where (verdier.notna (), mangler)
+
+
+def _dag(tid: pd.Series) -> pd.Series:
+    # Lokal dato som Timestamp (midnatt), for sammenligning med startdato
+    if tid.dt.tz is not None:
+        tid = tid.dt.tz_localize (None)
+    return tid.dt.normalize ()
+
+
 @st.cache_data (ttl=3600)
 def analyser_markedet(startdato: date, max_timer: float, grupperings_kolonner: list):
-    df = last_data_fra_s3 ()
-    if df.empty: return pd.DataFrame (), pd.DataFrame ()
-
-    cols = df.columns
-    c_merke = next ((c for c in ["Merke", "produsent"] if c in cols), "Merke")
-    c_modell = next ((c for c in ["Modell", "modell", "Info"] if c in cols), "Modell")
-    c_pris = next ((c for c in ["Pris", "pris_num"] if c in cols), None)
-    c_aar = next ((c for c in ["Årstall", "årstall"] if c in cols), "Årstall")
-    c_driv = next ((c for c in ["Drivstoff", "drivstoff"] if c in cols), "Drivstoff")
-    c_forh = next ((c for c in ["Forhandler type", "selger"] if c in cols), "Ukjent")
-
-    col_map = {"Merke": c_merke, "Modell": c_modell, "År": c_aar, "Drivstoff": c_driv}
-    df_group_cols = [col_map.get (k, k) for k in grupperings_kolonner]
-
-    stats_data = {}
-    sold_cars_list = []
-
-    # Grupper per FinnKode
-    for finnkode, grp in df.groupby ("FinnKode"):
-        g = grp.sort_values ("snapshot_time")
-        if g.empty: continue
-
-        # Vi ignorerer biler som ble solgt FØR startdato
-        if g.iloc[-1]["snapshot_time"].date () < startdato:
-            continue
-
-        first_row = g.iloc[0]
-
-        # Lag gruppenøkkel
-        group_values = []
-        for col in df_group_cols:
-            val = str (first_row.get (col, "Ukjent"))
-            group_values.append (val)
-        group_key = tuple (group_values)
-
-        if group_key not in stats_data:
-            stats_data[group_key] = {"Total": 0, "Solgt": 0, "SumTimer": 0.0, "SumPris": 0}
-
-        stats_data[group_key]["Total"] += 1
-
-        if not c_pris or c_pris not in g.columns: continue
-
-        sold_rows = g[g[c_pris].apply (_is_sold_strict)]
-
-        if not sold_rows.empty:
-            sale_row = sold_rows.iloc[0]
-            first_time = first_row["snapshot_time"]
-            sale_time = sale_row["snapshot_time"]
-
-            if sale_time.date () >= startdato:
-                timer_ute = (sale_time - first_time).total_seconds () / 3600.0
-                if timer_ute < 0: timer_ute = 0
-
-                if timer_ute <= max_timer:
-                    stats_data[group_key]["Solgt"] += 1
-                    stats_data[group_key]["SumTimer"] += timer_ute
-
-                    # Prøv å hente pris fra den første raden (før den ble "Solgt")
-                    # Hvis den ble importert som "Solgt" direkte, vil prisen være 0.
-                    pris = _extract_numeric (first_row.get (c_pris))
-                    stats_data[group_key]["SumPris"] += pris
-
-                    sold_cars_list.append ({
-                        "FinnKode": str (finnkode),
-                        "Link": f"{FINN_BASE_URL}{finnkode}",
-                        "GruppeKey": group_key,
-                        "Merke": str (first_row.get (c_merke, "")),
-                        "Modell": str (first_row.get (c_modell, "")),
-                        "Forhandler": str (first_row.get (c_forh, "")),
-                        "Salgspris": pris,
-                        "Timer til salg": round (timer_ute, 1),
-                        "Salgsdato": sale_time.date ()
-                    })
+    hend = last_salgshendelser ()
+    if hend.empty: return pd.DataFrame (), pd.DataFrame ()
+
+    start = pd.Timestamp (startdato)
+
+    # Vi ignorerer biler som forsvant FØR startdato
+    hend = hend[_dag (hend["sist_sett"]) >= start]
+    if hend.empty: return pd.DataFrame (), pd.DataFrame ()
+
+    # Gruppenøkkel per bil, fra første snapshot
+    gruppe = pd.DataFrame (index=hend.index)
+    for navn in grupperings_kolonner:
+        gruppe[navn] = _forst (hend, HENDELSE_KOLONNE.get (navn, navn), "Ukjent")
+    gruppe_key = list (zip (*(gruppe[navn] for navn in grupperings_kolonner)))
+
+    # Solgt (strengt: 'Solgt' i prisfeltet) etter startdato og innen max_timer
+    salgstid = hend["solgt_tekst_tid"]
+    timer_ute = ((salgstid - hend["foerste_sett"]).dt.total_seconds () / 3600.0).clip (lower=0)
+    raskt = salgstid.notna () & (_dag (salgstid) >= start) & (timer_ute <= max_timer)
+
+    # Prøv å hente pris fra den første raden (før den ble "Solgt")
+    # Hvis den ble importert som "Solgt" direkte, vil prisen være 0.
+    pris = pd.Series (0, index=hend.index, dtype="int64")
+    pris[raskt] = _forst (hend[raskt], "foerst_Pris", None).map (_extract_numeric).astype ("int64")
+
+    gruppe["Total"] = 1
+    gruppe["Solgt"] = raskt.astype (int)
+    gruppe["SumTimer"] = timer_ute.where (raskt, 0.0)
+    gruppe["SumPris"] = pris.where (raskt, 0)
+    stats_data = gruppe.groupby (grupperings_kolonner, sort=False)[["Total", "Solgt", "SumTimer", "SumPris"]].sum ()
+
+    solgte = hend[raskt]
+    sold_cars_list = pd.DataFrame ({
+        "FinnKode": solgte.index.astype (str),
+        "Link": FINN_BASE_URL + solgte.index.astype (str),
+        "GruppeKey": [k for k, r in zip (gruppe_key, raskt) if r],
+        "Merke": _forst (solgte, "foerst_Merke", "").to_numpy (),
+        "Modell": _forst (solgte, "foerst_Modell", "").to_numpy (),
+        "Forhandler": _forst (solgte, "foerst_Forhandler", "").to_numpy (),
+        "Salgspris": pris[raskt].to_numpy (),
+        "Timer til salg": [round (t, 1) for t in timer_ute[raskt]],
+        "Salgsdato": _dag (salgstid[raskt]).dt.date.to_numpy (),
+    }) if len (solgte) else pd.DataFrame ()
 
     stats_rows = []
-    for key, val in stats_data.items ():
+    for key, val in stats_data.iterrows ():
+        key = key if isinstance (key, tuple) else (key,)
         if val["Solgt"] > 0:
             avg_time = val["SumTimer"] / val["Solgt"]
             avg_price = val["SumPris"] / val["Solgt"]
@@ -159,8 +115,8 @@ def analyser_markedet(startdato: date, max_timer: float, grupperings_kolonner: l
 
             row = dict (zip (grupperings_kolonner, key))
             row.update ({
-                "Totalt observert": val["Total"],
-                "Antall Raskt Solgt": val["Solgt"],
+                "Totalt observert": int (val["Total"]),
+                "Antall Raskt Solgt": int (val["Solgt"]),
                 "Andel Solgt (%)": round (andel, 1),
                 "Snitt Timer": round (avg_time, 1),
                 "Snitt Pris": int (avg_price),
@@ -168,7 +124,7 @@ def analyser_markedet(startdato: date, max_timer: float, grupperings_kolonner: l
             })
             stats_rows.append (row)
 
-    return pd.DataFrame (stats_rows), pd.DataFrame (sold_cars_list)
+    return pd.DataFrame (stats_rows), sold_cars_list
 
 
 # ======================================================
@@ -5,6 +5,7 @@ from bolig_routes import bolig_bp
 from fritidsbolig_routes import fritids_bp
 from bil_routes import bil_bp
 from gemini_routes import gemini_bp  # <-- 1. LEGG TIL DENNE LINJEN
+from listing_datasett import start_forhaandslasting
 
 app = Flask(__name__)
 
@@ -14,6 +15,9 @@ app.register_blueprint(fritids_bp)
 app.register_blueprint(bil_bp)
 app.register_blueprint(gemini_bp)  # <-- 2. LEGG TIL DENNE LINJEN
 
+# Last bolig/fritidsbolig i bakgrunnen så første bruker slipper kald S3-lasting
+start_forhaandslasting()
+
 
 @app.route("/")
 def forside():
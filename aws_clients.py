@@ -0,0 +1,94 @@
+# aws_clients.py
+"""
+Felles, langlivede boto3-klienter for hele appen.
+
+Å lage en klient koster titalls millisekunder og kaster bort
+connection-poolen (TCP/TLS), så vi lager én per prosess og tjeneste og
+gjenbruker den. boto3-klienter er trådsikre etter at de er laget; selve
+opprettelsen skjer under lås. Sessions er ikke trådsikre, så de holdes
+per tråd.
+
+Alt er knyttet til prosess-ID: etter fork (gunicorn --preload) lager hver
+worker sine egne klienter i stedet for å dele sockets med master.
+"""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+from config import (
+    AWS_KEY,
+    AWS_SECRET,
+    AWS_REGION,
+    AWS_MAX_POOL_CONNECTIONS,
+    AWS_MAX_ATTEMPTS,
+)
+
+_BOTO_CONFIG = Config(
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+    retries={"total_max_attempts": AWS_MAX_ATTEMPTS, "mode": "adaptive"},
+    connect_timeout=5,
+    read_timeout=60,
+)
+
+_lock = threading.Lock()
+_pid = None
+_base_session = None
+_clients: dict = {}
+_thread_local = threading.local()
+
+
+def _ny_session() -> boto3.Session:
+    return boto3.Session(
+        aws_access_key_id=AWS_KEY,
+        aws_secret_access_key=AWS_SECRET,
+        region_name=AWS_REGION,
+    )
+
+
+def _sjekk_fork():
+    # Kalles med _lock holdt
+    global _pid, _base_session
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _base_session = _ny_session()
+        _clients.clear()
+
+
+def get_client(service: str):
+    """Delt klient for `service` (f.eks. 's3', 'athena') i denne prosessen."""
+    client = _clients.get(service)
+    if client is not None and _pid == os.getpid():
+        return client
+
+    with _lock:
+        _sjekk_fork()
+        client = _clients.get(service)
+        if client is None:
+            client = _clients[service] = _base_session.client(service, config=_BOTO_CONFIG)
+        return client
+
+
+def _etter_fork():
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_etter_fork)
+
+
+def get_s3_client():
+    return get_client("s3")
+
+
+def get_boto3_session() -> boto3.Session:
+    """
+    boto3.Session for biblioteker som vil lage egne klienter (awswrangler).
+    Én per tråd, siden en Session ikke er trådsikker.
+    """
+    session = getattr(_thread_local, "session", None)
+    if session is None or getattr(_thread_local, "pid", None) != os.getpid():
+        session = _thread_local.session = _ny_session()
+        _thread_local.pid = os.getpid()
+    return session
@@ -0,0 +1,49 @@
+# bench_parquet_sidecar.py
+"""
+Sammenligner UTF-16 CSV mot Parquet-sidecar på en oppskalert kopi av
+eksempelfilen i repoet (bytes som må hentes fra S3 og tid for å laste).
+
+    python bench_parquet_sidecar.py [skalering]
+"""
+import io
+import sys
+import time
+
+import pandas as pd
+
+from parquet_sidecar import dataframe_til_parquet, les_utf16_csv
+
+EKSEMPEL_CSV = "biler_siste_18-11-2025_23.csv"
+
+
+def _tid(fn, runder=5):
+    tider = []
+    for _ in range(runder):
+        t0 = time.perf_counter()
+        fn()
+        tider.append(time.perf_counter() - t0)
+    return sorted(tider)[len(tider) // 2]
+
+
+def main(skalering: int = 20):
+    # Eksempelfilen har én ødelagt linje fra skraperen; den hoppes over her
+    df = pd.read_csv(EKSEMPEL_CSV, encoding="utf-16", sep=";", on_bad_lines="skip")
+
+    stor = pd.concat([df] * skalering, ignore_index=True)
+    # Unike FinnKoder per kopi, så komprimeringen ikke blir urealistisk god
+    stor["FinnKode"] = stor["FinnKode"].astype("int64") + (stor.index // len(df)) * 10**9
+    csv_bytes = stor.to_csv(sep=";", index=False).encode("utf-16")
+    parquet_bytes = dataframe_til_parquet(les_utf16_csv(csv_bytes))
+
+    t_csv = _tid(lambda: les_utf16_csv(csv_bytes))
+    t_parquet = _tid(lambda: pd.read_parquet(io.BytesIO(parquet_bytes)))
+
+    print(f"Rader:            {len(stor):>12,}")
+    print(f"CSV (UTF-16):     {len(csv_bytes) / 1e6:>9.2f} MB  {t_csv * 1000:>8.1f} ms")
+    print(f"Parquet (zstd):   {len(parquet_bytes) / 1e6:>9.2f} MB  {t_parquet * 1000:>8.1f} ms")
+    print(f"Bytes:            {len(csv_bytes) / len(parquet_bytes):>9.1f}x mindre")
+    print(f"Lastetid:         {t_csv / t_parquet:>9.1f}x raskere")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,142 @@
+# bench_rekordrask_logic.py
+"""
+Sammenligner den gamle solgt-visningen (kopi, groupby min/max, full
+sortering + drop_duplicates og merge tilbake) mot bygg_visning_for_solgte
+med én groupby, på syntetiske timefil-rader, og sjekker at resultatet er
+identisk.
+
+Biler som ble sett sist i samme timefil har samme tidspunkt. Den gamle
+løsningen ga dem i rekkefølgen en ustabil sortering tilfeldigvis ga; nå
+kommer de i rekkefølgen de ble sett. Derfor sammenlignes radene sortert på
+FinnKode, og det sjekkes i tillegg at de nyeste fortsatt kommer først.
+
+    python bench_rekordrask_logic.py [antall_biler] [rader_per_bil]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from rekordrask_logic import FINN_BASE_URL, FINN_KODE_KOLONNE_NAVN, bygg_visning_for_solgte
+
+
+def _syntetiske_rader(antall_biler: int, per_bil: int, seed: int = 0) -> pd.DataFrame:
+    """Én rad per bil per timefil den var med i, med litt endrede attributter underveis."""
+    rng = np.random.default_rng(seed)
+    n = antall_biler * per_bil
+
+    bil = np.repeat(np.arange(antall_biler), per_bil)
+    time_nr = np.tile(np.arange(per_bil), antall_biler)
+    forste = rng.integers(0, 24 * 30, antall_biler)
+    tid = pd.Timestamp("2025-10-01 00:05", tz="Europe/Oslo") + pd.to_timedelta(forste[bil] + time_nr, unit="h")
+
+    pris = rng.integers(50_000, 900_000, antall_biler)[bil] - time_nr * 100
+    df = pd.DataFrame(
+        {
+            FINN_KODE_KOLONNE_NAVN: (100_000_000 + rng.permutation(antall_biler))[bil].astype(str),
+            "Merke": rng.choice(["Tesla", "Volvo", "Toyota", "BMW"], antall_biler)[bil],
+            "Modell": rng.choice(["Model 3", "XC60", "RAV4", "i4"], antall_biler)[bil],
+            "Årsmodell": rng.integers(2005, 2025, antall_biler)[bil].astype(float),
+            "Km": (rng.integers(0, 300_000, antall_biler)[bil] + time_nr * 10).astype(float),
+            "Pris": pris.astype(str).astype(object),
+            "Drivstoff": rng.choice(["Elektrisitet", "Diesel", "Bensin"], antall_biler)[bil],
+            "Forhandler type": np.array(["Privat", "Forhandler", None], dtype=object)[
+                rng.integers(0, 3, antall_biler)
+            ][bil],
+            "tidspunkt": tid,
+        }
+    )
+    # Noen rader uten gyldig tidspunkt, og en bil uten FinnKode
+    df.loc[rng.random(n) < 0.001, "tidspunkt"] = pd.NaT
+    df.loc[bil == 0, FINN_KODE_KOLONNE_NAVN] = None
+    # Timefilene leses nyeste først, så radene kommer ikke sortert
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def _gammel_losning(df_ny_solgt: pd.DataFrame) -> pd.DataFrame:
+    """Den opprinnelige bygg_visning_for_solgte, som referanse."""
+    df = df_ny_solgt.copy()
+    df["tidspunkt"] = pd.to_datetime(df["tidspunkt"], errors="coerce")
+
+    g = df.groupby(FINN_KODE_KOLONNE_NAVN)["tidspunkt"].agg(["min", "max"]).reset_index()
+    g.rename(columns={"min": "foerste_gang_sett", "max": "siste_gang_sett"}, inplace=True)
+    g["timer_til_salg"] = (
+        (g["siste_gang_sett"] - g["foerste_gang_sett"]).dt.total_seconds().div(3600).round().astype("Int64")
+    )
+
+    siste = (
+        df.sort_values(by="tidspunkt", ascending=False)
+        .drop_duplicates(subset=FINN_KODE_KOLONNE_NAVN, keep="first")
+        .copy()
+    )
+    res = pd.merge(
+        siste,
+        g[[FINN_KODE_KOLONNE_NAVN, "foerste_gang_sett", "timer_til_salg"]],
+        on=FINN_KODE_KOLONNE_NAVN,
+        how="left",
+    )
+
+    res["Pris_tekst"] = res.get("Pris", pd.Series(pd.NA)).astype(str)
+    pris_kilde = pd.to_numeric(res.get("Pris_eff", res.get("Pris")), errors="coerce")
+    res["Pris"] = pris_kilde.round(0).astype("Int64")
+    res["Km"] = pd.to_numeric(res.get("Km", pd.Series(pd.NA)), errors="coerce").astype("Int64")
+    res["Årsmodell"] = pd.to_numeric(res.get("Årsmodell", pd.Series(pd.NA)), errors="coerce").astype("Int64")
+    res["Finn"] = FINN_BASE_URL + res[FINN_KODE_KOLONNE_NAVN].astype(str)
+    res.drop(columns=["tidspunkt"], inplace=True, errors="ignore")
+
+    ønsket = [
+        FINN_KODE_KOLONNE_NAVN,
+        "Finn",
+        "Merke",
+        "Modell",
+        "Årsmodell",
+        "Km",
+        "Pris",
+        "Pris_tekst",
+        "Drivstoff",
+        "Forhandler type",
+        "foerste_gang_sett",
+        "timer_til_salg",
+        "Tittel",
+        "Info",
+    ]
+    front = [c for c in ønsket if c in res.columns]
+    rest = [c for c in res.columns if c not in front]
+    return res[front + rest]
+
+
+def _siste_tid(df_ny_solgt: pd.DataFrame, visning: pd.DataFrame) -> pd.Series:
+    tid = pd.to_datetime(df_ny_solgt["tidspunkt"], errors="coerce")
+    siste = tid.groupby(df_ny_solgt[FINN_KODE_KOLONNE_NAVN]).max()
+    return visning[FINN_KODE_KOLONNE_NAVN].map(siste)
+
+
+def main(antall_biler: int = 50_000, per_bil: int = 48):
+    df = _syntetiske_rader(antall_biler, per_bil)
+
+    t0 = time.perf_counter()
+    gammel = _gammel_losning(df)
+    t_gammel = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ny = bygg_visning_for_solgte(df)
+    t_ny = time.perf_counter() - t0
+
+    pd.testing.assert_frame_equal(
+        ny.sort_values(FINN_KODE_KOLONNE_NAVN, kind="stable").reset_index(drop=True),
+        gammel.sort_values(FINN_KODE_KOLONNE_NAVN, kind="stable").reset_index(drop=True),
+    )
+    siste = _siste_tid(df, ny).dropna()
+    assert siste.is_monotonic_decreasing, "Nyeste salg skal komme først"
+
+    print(f"Rader:            {len(df):>12,}")
+    print(f"Solgte biler:     {len(ny):>12,}")
+    print(f"Sort + merge:     {t_gammel * 1000:>9.1f} ms")
+    print(f"Én groupby:       {t_ny * 1000:>9.1f} ms")
+    print(f"Hastighet:        {t_gammel / t_ny:>9.1f}x raskere (identisk resultat)")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
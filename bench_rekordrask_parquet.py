@@ -0,0 +1,124 @@
+# bench_rekordrask_parquet.py
+"""
+Sammenligner den gamle løkken per FinnKode mot den vektoriserte
+solgt-visningen (_solgte_fra_snapshots) på en syntetisk snapshot-tabell,
+og sjekker at resultatet er identisk.
+
+    python bench_rekordrask_parquet.py [antall_biler] [snapshots_per_bil]
+"""
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from rekordrask_parquet import (
+    FINN_BASE_URL,
+    _extract_numeric,
+    _finn_kolonner,
+    _is_sold,
+    _solgte_fra_snapshots,
+)
+
+
+def _syntetiske_snapshots(antall_biler: int, per_bil: int, seed: int = 0) -> pd.DataFrame:
+    """Timesnapshots der omtrent halvparten av bilene ender som 'Solgt' (eller pris 0)."""
+    rng = np.random.default_rng(seed)
+    n = antall_biler * per_bil
+
+    bil = np.repeat(np.arange(antall_biler), per_bil)
+    time_nr = np.tile(np.arange(per_bil), antall_biler)
+    forste = rng.integers(0, 24 * 30, antall_biler)
+    solgt_fra = np.where(rng.random(antall_biler) < 0.5, rng.integers(1, per_bil, antall_biler), per_bil)
+
+    pris = (rng.integers(50_000, 900_000, antall_biler)[bil] - time_nr * 100).astype(str).astype(object)
+    pris[time_nr >= solgt_fra[bil]] = "Solgt"
+    pris[rng.random(n) < 0.002] = "0"
+
+    tid = (
+        pd.Timestamp("2025-10-01")
+        + pd.to_timedelta(forste[bil] + time_nr, unit="h")
+        + pd.to_timedelta(rng.integers(0, 59, n), unit="min")
+    )
+    df = pd.DataFrame(
+        {
+            "FinnKode": (100_000_000 + rng.permutation(antall_biler))[bil].astype(str),
+            "Merke": rng.choice(["Tesla", "Volvo", "Toyota", "BMW"], antall_biler)[bil],
+            "Modell": rng.choice(["Model 3", "XC60", "RAV4", "i4"], antall_biler)[bil],
+            "Årstall": rng.integers(2005, 2025, antall_biler)[bil].astype(str),
+            "Kjørelengde": rng.integers(0, 300_000, antall_biler)[bil].astype(str),
+            "Drivstoff": rng.choice(["Elektrisitet", "Diesel", "Bensin"], antall_biler)[bil],
+            "Pris": pris,
+            "Forhandler type": np.array(["Privat", "Forhandler", None], dtype=object)[
+                rng.integers(0, 3, antall_biler)
+            ][bil],
+            "snapshot_time": tid,
+        }
+    )
+    # Snapshots kommer ikke nødvendigvis sortert fra Parquet-filen
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def _gammel_losning(df: pd.DataFrame, colmap: dict, startdato: date) -> pd.DataFrame:
+    """Den opprinnelige løkken per FinnKode, som referanse."""
+    records = []
+    for finnkode, grp in df.groupby("FinnKode"):
+        g = grp.sort_values("snapshot_time")
+        first_time = g.iloc[0]["snapshot_time"]
+        sold_rows = g[g[colmap["Pris"]].apply(_is_sold)]
+        if sold_rows.empty:
+            continue
+        sale_row = sold_rows.iloc[0]
+        sale_time = sale_row["snapshot_time"]
+        if sale_time.date() < startdato:
+            continue
+        timer_til_salg = (sale_time - first_time).total_seconds() / 3600.0
+        if timer_til_salg < 0:
+            continue
+        records.append(
+            {
+                "FinnKode": str(finnkode),
+                "Finn": FINN_BASE_URL + str(finnkode),
+                "Merke": sale_row.get(colmap["Merke"]) or "",
+                "Modell": sale_row.get(colmap["Modell"]) or "",
+                "Årsmodell": _extract_numeric(sale_row.get(colmap["Årstall"])),
+                "Km": _extract_numeric(sale_row.get(colmap["Kjørelengde"])),
+                "Pris": _extract_numeric(sale_row.get(colmap["Pris"])),
+                "Drivstoff": sale_row.get(colmap["Drivstoff"]) or "",
+                "Forhandler type": sale_row.get(colmap["Forhandler type"]) or "",
+                "timer_til_salg": float(timer_til_salg),
+                "foerste_gang_sett": first_time.isoformat(),
+            }
+        )
+    if not records:
+        return pd.DataFrame()
+    vis_df = pd.DataFrame.from_records(records)
+    return vis_df.sort_values("timer_til_salg", ascending=True).reset_index(drop=True)
+
+
+def main(antall_biler: int = 20_000, per_bil: int = 50):
+    df = _syntetiske_snapshots(antall_biler, per_bil)
+    colmap = _finn_kolonner(df)
+    startdato = date(2025, 10, 10)
+
+    t0 = time.perf_counter()
+    gammel = _gammel_losning(df, colmap, startdato)
+    t_gammel = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ny = _solgte_fra_snapshots(df, colmap, startdato)
+    t_ny = time.perf_counter() - t0
+
+    pd.testing.assert_frame_equal(ny, gammel)
+
+    print(f"Snapshots:        {len(df):>12,}")
+    print(f"Solgte biler:     {len(ny):>12,}")
+    print(f"Løkke per bil:    {t_gammel * 1000:>9.1f} ms")
+    print(f"Vektorisert:      {t_ny * 1000:>9.1f} ms")
+    print(f"Hastighet:        {t_gammel / t_ny:>9.1f}x raskere (identisk resultat)")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
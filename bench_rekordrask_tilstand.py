@@ -0,0 +1,120 @@
+# bench_rekordrask_tilstand.py
+"""
+Sammenligner de to veiene til solgt-visningen på syntetiske timefiler:
+radene fra timefilene i vinduet (_bygg_datasets) mot den inkrementelle
+tilstanden per FinnKode (_bygg_datasets_fra_tilstand, REKORDRASK_TILSTAND),
+og sjekker at visningen er identisk for flere startdatoer. Sjekker også at
+tilstanden blir den samme når timefilene foldes inn i to omganger.
+
+Timefilene ligger i minnet i stedet for i S3. Hver bil er med i alle
+timefilene fra den dukker opp til den forsvinner (eller er med i nyeste).
+
+    python bench_rekordrask_tilstand.py [antall_biler] [antall_timer]
+"""
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+import rekordrask_logic
+from rekordrask_logic import (
+    FINN_KODE_KOLONNE_NAVN,
+    _bygg_datasets,
+    _bygg_datasets_fra_tilstand,
+    _fold_nye,
+    _nyere_enn,
+    _tilstand_cache,
+    _tom_tilstand,
+    bygg_visning_for_solgte,
+)
+
+START = datetime(2025, 11, 1, tzinfo=timezone.utc)
+
+
+def _syntetiske_timefiler(antall_biler: int, antall_timer: int, seed: int = 0) -> tuple[list[dict], dict]:
+    """
+    (time_filer nyeste først, {key: frame}) der noen biler ender med "Solgt"
+    i prisen noen timer før de forsvinner, og resten bare forsvinner.
+    """
+    rng = np.random.default_rng(seed)
+    forste = rng.integers(0, antall_timer, antall_biler)
+    siste = np.minimum(forste + rng.integers(1, 200, antall_biler), antall_timer)
+    solgt_fra = np.where(rng.random(antall_biler) < 0.4, siste - rng.integers(1, 6, antall_biler), antall_timer)
+    biler = pd.DataFrame(
+        {
+            FINN_KODE_KOLONNE_NAVN: (100_000_000 + rng.permutation(antall_biler)).astype(str),
+            "Merke": rng.choice(["Tesla", "Volvo", "Toyota", "BMW"], antall_biler),
+            "Modell": rng.choice(["Model 3", "XC60", "RAV4", "i4"], antall_biler),
+            "Årsmodell": rng.integers(2005, 2025, antall_biler).astype(float),
+            "Drivstoff": rng.choice(["Elektrisitet", "Diesel", "Bensin"], antall_biler),
+            "Forhandler type": np.array(["Privat", "Forhandler", None], dtype=object)[
+                rng.integers(0, 3, antall_biler)
+            ],
+        }
+    )
+    biler["Info"] = biler["Merke"] + " " + biler["Modell"]
+    biler["Tittel"] = biler["Info"]
+    pris = rng.integers(50_000, 900_000, antall_biler)
+    km = rng.integers(0, 300_000, antall_biler)
+
+    time_filer, frames = [], {}
+    for t in range(antall_timer):
+        med = (forste <= t) & (t < siste)
+        df = biler[med].reset_index(drop=True)
+        df["Km"] = (km[med] + (t - forste[med]) * 10).astype(float)
+        df["Pris"] = (pris[med] - (t - forste[med]) // 24 * 1_000).astype(str).astype(object)
+        df.loc[t >= solgt_fra[med], "Pris"] = "Solgt"
+        key = f"raw/bil-time/bil-time-{t:05d}.csv"
+        frames[key] = df
+        time_filer.append({"Key": key, "LastModified": START + timedelta(hours=t, minutes=5), "ETag": str(t)})
+    return time_filer[::-1], frames
+
+
+def _sammenlignbar(visning: pd.DataFrame) -> pd.DataFrame:
+    # Verdiene må være like; typene følger kilden (tidsoppløsning, object/str/category
+    # for tekst, None/NaN for manglende tekst), så alt sammenlignes som objekter
+    visning = visning.astype({"foerste_gang_sett": "datetime64[ns, UTC]"}).astype(object)
+    return visning.where(visning.notna(), None)
+
+
+def main(antall_biler: int = 20_000, antall_timer: int = 24 * 14):
+    time_filer, frames = _syntetiske_timefiler(antall_biler, antall_timer)
+    rekordrask_logic._read_csv_from_s3 = lambda key, etag=None: frames[key].copy()
+    daglig_filer = [{"Key": time_filer[0]["Key"], "ETag": "daglig"}]
+
+    t0 = time.perf_counter()
+    nye = _nyere_enn(time_filer, None)
+    tilstand, grense = _fold_nye(_tom_tilstand(), nye)
+    t_fold = time.perf_counter() - t0
+
+    halv, _ = _fold_nye(_tom_tilstand(), nye[: len(nye) // 2])
+    halv, _ = _fold_nye(halv, nye[len(nye) // 2:])
+    pd.testing.assert_frame_equal(halv.sort_index(), tilstand.sort_index())
+    _tilstand_cache.lagre("tilstand", (tilstand, grense))
+
+    print(f"Timefiler:        {len(time_filer):>12,}")
+    print(f"Biler:            {len(tilstand):>12,}")
+    print(f"Kald fold:        {t_fold * 1000:>9.1f} ms")
+    for dager in (1, 3, 7, 30):
+        startdato = (START + timedelta(hours=antall_timer) - timedelta(days=dager)).date()
+
+        t0 = time.perf_counter()
+        rader = bygg_visning_for_solgte(_bygg_datasets(startdato, daglig_filer, time_filer)[2])
+        t_rader = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        fra_tilstand = bygg_visning_for_solgte(_bygg_datasets_fra_tilstand(startdato, daglig_filer, time_filer)[2])
+        t_tilstand = time.perf_counter() - t0
+
+        pd.testing.assert_frame_equal(_sammenlignbar(fra_tilstand), _sammenlignbar(rader), check_like=True)
+        print(
+            f"{dager:>2} dager: {len(rader):>7,} solgte | rader {t_rader * 1000:>8.1f} ms"
+            f" | tilstand {t_tilstand * 1000:>7.1f} ms | {t_rader / t_tilstand:>5.1f}x (identisk resultat)"
+        )
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -1,22 +1,21 @@
 # bil_routes.py
 import json
 from datetime import datetime, timedelta, date
-from rekordrask_parquet import bygg_visning_for_solgte_fra_parquet
+from rekordrask_parquet import hent_rekordrask_indeks
 
-import boto3
 import awswrangler as wr
 import pandas as pd
 from flask import Blueprint, render_template, jsonify, request
 
+from aws_clients import get_s3_client, get_boto3_session
 from config import (
-    AWS_KEY,
-    AWS_SECRET,
-    AWS_REGION,
     S3_BUCKET_NAME,
     ATHENA_DATABASE,
     DEFAULT_STARTDATE,
     ATHENA_TABLE,          # 👈 legg til denne
 )
+from helpers import UgyldigeSideParametre, les_side_parametre, hent_side
+from json_respons import json_svar
 
 
 FINN_BASE_URL = "https://www.finn.no/mobility/item/"
@@ -32,12 +31,7 @@ from svv_app import fetch_svv_data, flatten_svv_data, compute_eu_status
 def _get_metadata():
     """Henter metadata for produsenter/modeller mv. fra S3."""
     try:
-        s3_client = boto3.client(
-            's3',
-            region_name=AWS_REGION,
-            aws_access_key_id=AWS_KEY,
-            aws_secret_access_key=AWS_SECRET
-        )
+        s3_client = get_s3_client()
         meta_obj = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key='calc/metadata.json')
         metadata = json.loads(meta_obj['Body'].read().decode('utf-8'))
     except Exception as e:
@@ -47,11 +41,7 @@ def _get_metadata():
 
 def _hent_bil_data_fra_athena(filters: dict) -> pd.DataFrame:
     """Kjører Athena-spørring mot database_biler_parquet basert på filtrene."""
-    my_session = boto3.Session(
-        aws_access_key_id=AWS_KEY,
-        aws_secret_access_key=AWS_SECRET,
-        region_name=AWS_REGION
-    )
+    my_session = get_boto3_session()
 
     # --------- Startdato (tåler dd.mm.yyyy og yyyy-mm-dd) ---------
     start_str = filters.get("startdato")
@@ -223,7 +213,9 @@ def bil_solgt_analyse_side():
 @bil_bp.route('/solgt/data', methods=['POST'])
 def get_bil_solgt_data():
     try:
-        filters = request.get_json().get('filters', {})
+        payload = request.get_json()
+        filters = payload.get('filters', {})
+        side_params = les_side_parametre(payload)
         df = _hent_bil_data_fra_athena(filters)
         if df.empty:
             return jsonify({'historikk': [], 'daily_stats': [], 'kpis': {}})
@@ -264,12 +256,18 @@ def get_bil_solgt_data():
         ).reset_index()
         daily_stats_df['Dato'] = pd.to_datetime(daily_stats_df['dato']).dt.strftime('%Y-%m-%d')
 
-        daily_stats = json.loads(daily_stats_df.to_json(orient='records')) if not daily_stats_df.empty else []
-        historikk_df = historikk_df.where(pd.notna(historikk_df), None)
-        historikk = json.loads(historikk_df.to_json(orient='records')) if not historikk_df.empty else []
+        # KPI-er og dagsstatistikk over hele utvalget; bare historikk-tabellen pagineres
+        side_meta = None
+        if side_params:
+            historikk_df, side_meta = hent_side(historikk_df, side_params)
 
-        return jsonify({'historikk': historikk, 'daily_stats': daily_stats, 'kpis': kpis})
+        svar = {'historikk': historikk_df, 'daily_stats': daily_stats_df, 'kpis': kpis}
+        if side_meta:
+            svar['historikk_side'] = side_meta
+        return json_svar(**svar)
 
+    except UgyldigeSideParametre as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Feil i /bil/solgt/data: {e}")
         return jsonify({"error": str(e)}), 500
@@ -309,77 +307,19 @@ def get_bil_rekordrask_data():
             # default: 3 siste dager
             startdato = date.today() - timedelta(days=3)
 
-        # Bygg visning fra Parquet
-        vis_solgte = bygg_visning_for_solgte_fra_parquet(startdato)
-
-        if vis_solgte.empty:
-            return jsonify({'rows': [], 'kpis': {}})
-
-        # ---- Pandas-filtre tilsvarende UI ----
-        # Produsent / Merke
-        prod = filters.get('produsent')
-        if prod:
-            vis_solgte = vis_solgte[vis_solgte['Merke'] == prod]
-
-        # Modell
-        mod = filters.get('modell')
-        if mod:
-            vis_solgte = vis_solgte[vis_solgte['Modell'] == mod]
-
-        # Pris
-        if filters.get('pris_min'):
-            vis_solgte = vis_solgte[
-                vis_solgte['Pris'].fillna(0) >= int(filters['pris_min'])
-            ]
-        if filters.get('pris_max'):
-            vis_solgte = vis_solgte[
-                vis_solgte['Pris'].fillna(0) <= int(filters['pris_max'])
-            ]
-
-        # Km maks
-        if filters.get('km_max'):
-            vis_solgte = vis_solgte[
-                vis_solgte['Km'].fillna(10**9) <= int(filters['km_max'])
-            ]
-
-        # Min år
-        if filters.get('year_min'):
-            vis_solgte = vis_solgte[
-                vis_solgte['Årsmodell'].fillna(0) >= int(filters['year_min'])
-            ]
-
-        # Maks dager til salg (UI: max_dager, backend: timer_til_salg)
-        if filters.get('max_timer') or filters.get('max_dager'):
-            # I HTML-en heter det max_dager, men vi brukte max_timer i backend før
-            val = filters.get('max_timer') or filters.get('max_dager')
-            max_dager = int(val)
-            max_timer = max_dager * 24
-            vis_solgte = vis_solgte[
-                vis_solgte['timer_til_salg'] <= max_timer
-            ]
+        # Filtrene (produsent/modell/pris/km/år/maks dager) evalueres som én
+        # maske over forhåndsberegnede kolonner; de 500 raskeste går til frontend
+        indeks = hent_rekordrask_indeks(startdato)
+        if indeks is None:
+            # Kald start: hendelsestabellen lastes i bakgrunnen
+            svar = jsonify({'error': "Dataene lastes inn – prøv igjen om litt.", 'rows': [], 'kpis': {}})
+            return svar, 503, {'Retry-After': '10'}
+        vis_solgte, kpis = indeks.sok(filters, antall=500)
 
         if vis_solgte.empty:
             return jsonify({'rows': [], 'kpis': {}})
 
-        # ---- KPIs ----
-        min_timer = float(vis_solgte['timer_til_salg'].min())
-        median_timer = float(vis_solgte['timer_til_salg'].median())
-        avg_timer = float(vis_solgte['timer_til_salg'].mean())
-
-        kpis = {
-            'min_timer': int(round(min_timer)),
-            'median_timer': median_timer,
-            'avg_timer': avg_timer,
-        }
-
-        # Begrens antall rader litt (f.eks. 500) for frontend
-        vis_solgte = vis_solgte.sort_values('timer_til_salg', ascending=True).head(500)
-
-        # Sørg for at NaN -> None før JSON
-        vis_solgte = vis_solgte.where(pd.notna(vis_solgte), None)
-        rows = json.loads(vis_solgte.to_json(orient='records'))
-
-        return jsonify({'rows': rows, 'kpis': kpis})
+        return json_svar(rows=vis_solgte, kpis=kpis)
 
     except Exception as e:
         print(f"Feil i /bil/rekordrask/data: {e}")
@@ -10,3 +10,62 @@ ATHENA_DATABASE = "database_biler_parquet"
 # Startdato fallback
 from datetime import date
 DEFAULT_STARTDATE = date(2025, 6, 1)
+
+# Hvor lenge (sekunder) et cachet S3-datasett brukes før ETag revalideres
+DATASET_REVALIDATE_SECONDS = 60
+
+# Hvor lenge (sekunder) listingen av datofiler i en S3-mappe gjenbrukes
+FILE_MANIFEST_TTL_SECONDS = 60
+
+# Connection-pool og retry for de delte boto3-klientene (aws_clients.py)
+AWS_MAX_POOL_CONNECTIONS = 32
+AWS_MAX_ATTEMPTS = 5
+
+# Maks antall rader per side når data-endepunktene pagineres
+MAX_PAGE_SIZE = 5000
+
+# Last bolig/fritidsbolig i bakgrunnen ved oppstart av hver worker, og frisk opp jevnlig
+LISTING_PRELOAD = True
+LISTING_REFRESH_SECONDS = 60
+
+# Lokal mappe der store S3-filer (bil_time.parquet) speiles per ETag og leses minnemappet.
+# Deles av alle prosesser på maskinen. Tom verdi (standard) slår speilet av; da leses bare
+# kolonnene og radgruppene som trengs rett fra S3. Eksempel: /tmp/prisanalyse-speil
+LOCAL_MIRROR_DIR = ""
+# Maks størrelse på speilet; de minst nylig brukte filene slettes over grensen, men
+# aldri filer som er brukt de siste LOCAL_MIRROR_MIN_AGE_SECONDS
+LOCAL_MIRROR_MAX_MB = 4096
+LOCAL_MIRROR_MIN_AGE_SECONDS = 600
+
+# Les snapshot-historikken for bil fra datopartisjonene (calc/bil/snapshots/dato=YYYY-MM-DD/)
+# i stedet for enkeltfilen calc/bil/bil_time.parquet. Se snapshot_partisjoner.py.
+SNAPSHOT_PARTISJONERT = False
+
+# Antall timefiler rekordrask_logic henter og parser samtidig (1 = sekvensielt).
+# Bør ikke overstige AWS_MAX_POOL_CONNECTIONS.
+HISTORY_FETCH_WORKERS = 8
+
+# Ferdig parsede timefiler (rekordrask_logic) caches per S3-nøkkel + ETag: i minnet
+# (maks MB per prosess) og som Parquet i denne mappen. Tom mappe slår disknivået av.
+PARSED_CACHE_DIR = "/tmp/prisanalyse-parset"
+PARSED_CACHE_MAX_MB = 512
+# Disknivået holdes under PARSED_CACHE_DISK_MAX_MB (minst nylig brukte slettes først), og filer
+# som ikke er brukt på PARSED_CACHE_MAX_AGE_DAYS dager (lengre enn noe analysevindu) slettes
+PARSED_CACHE_DISK_MAX_MB = 2048
+PARSED_CACHE_MAX_AGE_DAYS = 60
+
+# Ferdige rekordrask-datasett (bygg_datasets) caches per startdato: maks MB per prosess,
+# og maks alder i sekunder (de bygges uansett på nytt når en nyere fil dukker opp i S3)
+RESULT_CACHE_MAX_MB = 1024
+RESULT_CACHE_TTL_SECONDS = 3600
+
+# Bygg rekordrask-datasettene fra den inkrementelle tilstanden per FinnKode
+# (calc/bil/csv_tilstand.parquet) i stedet for alle timefilene i vinduet. Tilstanden
+# skrives bare av `python rekordrask_logic.py` (kjøres etter hver opplasting av timefiler);
+# hver prosess holder sin egen kopi i minnet, maks CSV_TILSTAND_CACHE_MAX_MB
+REKORDRASK_TILSTAND = False
+CSV_TILSTAND_CACHE_MAX_MB = 256
+
+# Nøkkelmanifestene per S3-mappe (helpers.S3FilResolver) oppdateres inkrementelt;
+# så ofte (sekunder) listes hele mappen likevel på nytt
+MANIFEST_FULL_RELIST_SECONDS = 3600
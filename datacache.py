@@ -0,0 +1,171 @@
+# datacache.py
+import os
+import threading
+import time
+
+from config import DATASET_REVALIDATE_SECONDS
+
+_MANGLER = object()
+
+
+class DatasettCache:
+    """
+    Prosess-lokal cache for parsede S3-objekter (typisk DataFrames).
+
+    Hver oppføring er nøklet på (bucket, key) og husker ETag-en den ble
+    lastet fra. Innenfor `revalider_sekunder` returneres cachet verdi uten
+    kall mot S3. Etter det gjøres en HEAD: uendret ETag gir ingen
+    nedlasting, endret objekt lastes og parses på nytt via `laster`.
+
+    Trådsikker: én lås per nøkkel, slik at samtidige forespørsler i samme
+    gunicorn-worker ikke laster ned samme fil flere ganger. En ny versjon
+    (med tilhørende avledede verdier) byttes inn som én oppføring, så
+    lesere ser enten gammel eller ny versjon, aldri en blanding.
+    """
+
+    def __init__(
+        self,
+        revalider_sekunder: float = DATASET_REVALIDATE_SECONDS,
+        maks_oppforinger: int = 8,
+        maks_avledede: int = 16,
+    ):
+        self.revalider_sekunder = revalider_sekunder
+        self.maks_oppforinger = maks_oppforinger
+        self.maks_avledede = maks_avledede
+        self._lock = threading.Lock()
+        self._nokkel_locks: dict = {}
+        self._oppforinger: dict = {}
+        self._pagaende: set = set()
+
+    def _lock_for(self, nokkel):
+        with self._lock:
+            lock = self._nokkel_locks.get(nokkel)
+            if lock is None:
+                lock = self._nokkel_locks[nokkel] = threading.Lock()
+            return lock
+
+    def hent(self, s3_client, bucket: str, key: str, laster, bakgrunn: bool = False):
+        """
+        Returnerer `laster(s3_client, bucket, key, etag)` for objektet `key`,
+        fra cache hvis ETag-en fortsatt stemmer. Verdien som returneres deles
+        mellom forespørsler og må ikke muteres av kalleren.
+
+        Med `bakgrunn=True` svarer en utløpt oppføring straks med versjonen i
+        minnet, mens revalideringen (og ev. ny nedlasting) gjøres i en
+        bakgrunnstråd som bytter inn ny versjon når den er ferdig. Finnes
+        ingen oppføring ennå, lastes den i bakgrunnen og det returneres None.
+        """
+        nokkel = (bucket, key)
+        oppf = self._oppforinger.get(nokkel)
+        if oppf and time.monotonic() - oppf["sjekket"] < self.revalider_sekunder:
+            return oppf["data"]
+
+        if bakgrunn:
+            self._revalider_i_bakgrunnen(s3_client, bucket, key, laster)
+            return oppf["data"] if oppf else None
+
+        with self._lock_for(nokkel):
+            # En annen tråd kan ha lastet/revalidert mens vi ventet på låsen
+            oppf = self._oppforinger.get(nokkel)
+            if oppf and time.monotonic() - oppf["sjekket"] < self.revalider_sekunder:
+                return oppf["data"]
+            return self._revalider(s3_client, bucket, key, laster)["data"]
+
+    def _revalider(self, s3_client, bucket: str, key: str, laster) -> dict:
+        # Kalles med nøkkel-låsen holdt
+        nokkel = (bucket, key)
+        oppf = self._oppforinger.get(nokkel)
+        etag = s3_client.head_object(Bucket=bucket, Key=key).get("ETag")
+        if oppf and oppf["etag"] == etag:
+            oppf["sjekket"] = time.monotonic()
+            return oppf
+
+        ny = {"etag": etag, "data": laster(s3_client, bucket, key, etag), "avledet": {}}
+        # Avledede verdier som var i bruk bygges for ny versjon før den byttes inn,
+        # slik at første forespørsel etter byttet ikke må vente på dem
+        funksjoner = dict(oppf.get("funksjoner", {})) if oppf else {}
+        for navn, fn in funksjoner.items():
+            ny["avledet"][navn] = fn(ny["data"])
+        ny["funksjoner"] = funksjoner
+        ny["sjekket"] = time.monotonic()
+
+        self._oppforinger[nokkel] = ny
+        self._rydd()
+        return ny
+
+    def _revalider_i_bakgrunnen(self, s3_client, bucket: str, key: str, laster):
+        nokkel = (bucket, key)
+        with self._lock:
+            if nokkel in self._pagaende:
+                return
+            self._pagaende.add(nokkel)
+
+        def _kjor():
+            try:
+                with self._lock_for(nokkel):
+                    self._revalider(s3_client, bucket, key, laster)
+            except Exception as e:
+                # Gammel versjon brukes videre; neste forespørsel prøver igjen
+                print(f"[datacache] Revalidering av {key} feilet: {e}")
+            finally:
+                with self._lock:
+                    self._pagaende.discard(nokkel)
+
+        threading.Thread(target=_kjor, name=f"revalider-{key}", daemon=True).start()
+
+    def _rydd(self):
+        # Gårsdagens filer (nye nøkler hver dag) skal ikke bli liggende i minnet
+        with self._lock:
+            while len(self._oppforinger) > self.maks_oppforinger:
+                eldste = min(self._oppforinger, key=lambda k: self._oppforinger[k]["sjekket"])
+                del self._oppforinger[eldste]
+
+    def avledet(self, bucket: str, key: str, navn: str, fn, data=None):
+        """
+        Returnerer `fn(data)` for versjonen som ligger i cache, beregnet én
+        gang per versjon (f.eks. filterlister eller indekser). Kall `hent`
+        først og send med det den returnerte som `data`: er oppføringen
+        kastet i mellomtiden (maks `maks_oppforinger`), beregnes `fn(data)`
+        direkte uten å caches. Uten `data` returneres da None. Holdes maks
+        `maks_avledede` per versjon (de eldste kastes først).
+        """
+        oppf = self._oppforinger.get((bucket, key))
+        if oppf is None:
+            return None if data is None else fn(data)
+        avledet = oppf.setdefault("avledet", {})
+        verdi = avledet.get(navn, _MANGLER)
+        if verdi is not _MANGLER:
+            return verdi
+
+        with self._lock_for((bucket, key)):
+            verdi = avledet.get(navn, _MANGLER)
+            if verdi is _MANGLER:
+                verdi = fn(oppf["data"])
+                funksjoner = oppf.setdefault("funksjoner", {})
+                while len(avledet) >= self.maks_avledede:
+                    eldste = next(iter(avledet))
+                    del avledet[eldste]
+                    funksjoner.pop(eldste, None)
+                avledet[navn] = verdi
+                funksjoner[navn] = fn
+            return verdi
+
+    def etag(self, bucket: str, key: str):
+        """ETag for versjonen som ligger i cache (eller None)."""
+        oppf = self._oppforinger.get((bucket, key))
+        return oppf["etag"] if oppf else None
+
+    def _etter_fork(self):
+        # Låser holdt av tråder i foreldreprosessen må ikke arves
+        self._lock = threading.Lock()
+        self._nokkel_locks = {}
+        self._pagaende = set()
+
+    def tom(self):
+        with self._lock:
+            self._oppforinger.clear()
+
+
+# Én felles instans per prosess (dvs. per gunicorn-worker)
+datasett_cache = DatasettCache()
+os.register_at_fork(after_in_child=datasett_cache._etter_fork)
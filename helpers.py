@@ -1,25 +1,438 @@
 # helpers.py
+import io
+import json
+import os
 import re
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
 from botocore.exceptions import ClientError
+from dateutil.tz import tzutc
 
-def find_latest_file_in_s3(s3_client, bucket, prefix, file_pattern):
-    """Finn siste fil i en S3-mappe basert på dato i filnavnet."""
-    try:
-        response = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix)
-        if 'Contents' not in response:
+from config import FILE_MANIFEST_TTL_SECONDS, MANIFEST_FULL_RELIST_SECONDS, MAX_PAGE_SIZE
+
+
+MANIFEST_PREFIX = "calc/manifest/"
+MANIFEST_VERSJON = 1
+
+DATO_REGEX = re.compile(r"(\d{2}-\d{2}-\d{4})")
+# Lengre opphold enn dette siden nyeste fil -> full listing i stedet for én listing per dag
+MAKS_DAGER_INKREMENTELT = 7
+
+
+def manifest_key(prefix: str) -> str:
+    """raw/bil-time/ -> calc/manifest/raw__bil-time.json"""
+    return MANIFEST_PREFIX + prefix.strip("/").replace("/", "__") + ".json"
+
+
+def _objekt(obj: dict) -> dict:
+    return {
+        "Key": obj["Key"],
+        "Size": obj.get("Size"),
+        "ETag": obj.get("ETag"),
+        "LastModified": obj["LastModified"],
+    }
+
+
+def _list(s3_client, bucket: str, prefix: str, start_after: str | None = None) -> list[dict]:
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        kwargs["StartAfter"] = start_after
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return [_objekt(obj) for side in paginator.paginate(**kwargs) for obj in side.get("Contents", [])]
+
+
+class S3FilResolver:
+    """
+    Holder et manifest per (bucket, prefix) over objektene i en S3-mappe:
+    nøkkel, størrelse, ETag og LastModified.
+
+    Manifestet lagres som JSON i S3 (MANIFEST_PREFIX) og deles av alle
+    prosesser. I stedet for å liste hele mappen hver gang oppdateres det
+    inkrementelt:
+      - StartAfter = siste kjente nøkkel (leksikalsk), paginert
+      - filnavnene har dato som dd-mm-yyyy, som ikke sorterer leksikalsk
+        (01-12-2025 < 30-11-2025). Derfor listes i tillegg prefikset for hver
+        dato fra den nyeste kjente filen til i dag, med StartAfter = nyeste
+        kjente nøkkel samme dag
+      - en full listing gjøres likevel hvert `full_listing_sekunder` (og
+        når nøklene ikke har dato), så slettede eller uventet navngitte filer
+        også fanges opp
+    Innenfor `ttl_sekunder` brukes manifestet i minnet uten S3-kall.
+
+    Manifestet skrives bare hvis det i S3 fortsatt er det oppdateringen
+    bygde på (IfMatch på ETag-en); har en annen prosess skrevet i
+    mellomtiden, leses dens manifest ved neste oppdatering. En nøkkel som
+    viser seg å være slettet (404 ved HEAD/GET) fjernes straks med `fjern`.
+
+    Oppslagene (`siste`: nyeste dato i filnavnet, `filer`: LastModified-vindu)
+    beregnes fra manifestet og gjenbrukes til det endres.
+    """
+
+    def __init__(
+        self,
+        ttl_sekunder: float = FILE_MANIFEST_TTL_SECONDS,
+        full_listing_sekunder: float = MANIFEST_FULL_RELIST_SECONDS,
+    ):
+        self.ttl_sekunder = ttl_sekunder
+        self.full_listing_sekunder = full_listing_sekunder
+        # _lock beskytter bare ordbøkene; listingen holder låsen til sitt eget prefix,
+        # så en treg listing av ett prefix ikke blokkerer oppslag i de andre
+        self._lock = threading.Lock()
+        self._prefix_laaser: dict = {}
+        # (bucket, prefix) -> {"sjekket", "full_listing", "objekter": {key: obj}, "visninger"}
+        self._manifester: dict = {}
+
+    def _prefix_laas(self, bucket, prefix) -> threading.Lock:
+        with self._lock:
+            return self._prefix_laaser.setdefault((bucket, prefix), threading.Lock())
+
+    # ---------- persistering ----------
+
+    def _last(self, s3_client, bucket: str, prefix: str) -> dict | None:
+        try:
+            obj = s3_client.get_object(Bucket=bucket, Key=manifest_key(prefix))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        innhold = json.loads(obj["Body"].read())
+        if innhold.get("versjon") != MANIFEST_VERSJON or innhold.get("prefix") != prefix:
+            # Tomt manifest med ETag-en, så det gamle kan skrives over etter en full listing
+            return {"full_listing": datetime.min.replace(tzinfo=timezone.utc), "objekter": {}, "etag": obj.get("ETag")}
+        objekter = {}
+        for o in innhold["objekter"]:
+            # Samme tidssone-type som boto3 gir, så tidspunkt-kolonnene blir like
+            o["LastModified"] = datetime.fromisoformat(o["LastModified"]).astimezone(tzutc())
+            objekter[o["Key"]] = o
+        return {
+            "full_listing": datetime.fromisoformat(innhold["full_listing"]),
+            "objekter": objekter,
+            "etag": obj.get("ETag"),
+        }
+
+    def _lagre(self, s3_client, bucket: str, prefix: str, manifest: dict) -> dict:
+        """
+        Skriver manifestet hvis det i S3 fortsatt har ETag-en det bygde på
+        (ingen ETag = skal ikke finnes ennå), og gir det med ny ETag. Har en
+        annen prosess skrevet i mellomtiden, skrives ingenting, og det
+        merkes slik at neste oppdatering starter fra det lagrede manifestet.
+        """
+        innhold = {
+            "versjon": MANIFEST_VERSJON,
+            "prefix": prefix,
+            "full_listing": manifest["full_listing"].isoformat(),
+            "objekter": [
+                {**o, "LastModified": o["LastModified"].isoformat()}
+                for o in sorted(manifest["objekter"].values(), key=lambda o: o["Key"])
+            ],
+        }
+        betingelse = {"IfMatch": manifest["etag"]} if manifest.get("etag") else {"IfNoneMatch": "*"}
+        try:
+            svar = s3_client.put_object(
+                Bucket=bucket,
+                Key=manifest_key(prefix),
+                Body=json.dumps(innhold).encode("utf-8"),
+                ContentType="application/json",
+                **betingelse,
+            )
+            return {**manifest, "etag": svar.get("ETag"), "les_paa_nytt": False}
+        except ClientError as e:
+            kode = e.response.get("Error", {}).get("Code")
+            if kode in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409"):
+                print(f"[manifest] {manifest_key(prefix)} ble oppdatert av en annen prosess – leses på nytt")
+                return {**manifest, "les_paa_nytt": True}
+            print(f"[manifest] Kunne ikke skrive {manifest_key(prefix)}: {e}")
+        except Exception as e:
+            print(f"[manifest] Kunne ikke skrive {manifest_key(prefix)}: {e}")
+        return manifest
+
+    # ---------- oppdatering ----------
+
+    def _inkrementelle_nye(self, s3_client, bucket: str, prefix: str, objekter: dict) -> list[dict] | None:
+        """Nye objekter siden forrige listing, eller None hvis full listing trengs."""
+        nye = _list(s3_client, bucket, prefix, max(objekter))
+
+        nyeste = max(objekter.values(), key=lambda o: o["LastModified"])
+        match = DATO_REGEX.search(nyeste["Key"], len(prefix))
+        if not match:
+            return None
+        try:
+            nyeste_dato = datetime.strptime(match.group(1), "%d-%m-%Y").date()
+        except ValueError:
+            return None
+        # Filnavnene kan bruke lokal tid, så ta med i morgen (UTC) også
+        siste_dato = datetime.now(timezone.utc).date() + timedelta(days=1)
+        if (siste_dato - nyeste_dato).days > MAKS_DAGER_INKREMENTELT:
             return None
 
-        latest_file, latest_date = None, None
-        for obj in response['Contents']:
-            key = obj['Key']
-            match = re.search(file_pattern, key)
-            if match:
-                file_date = datetime.strptime(match.group(1), '%d-%m-%Y')
-                if latest_date is None or file_date > latest_date:
-                    latest_date, latest_file = file_date, key
-        return latest_file
+        stamme = nyeste["Key"][: match.start()]
+        dag = nyeste_dato
+        while dag <= siste_dato:
+            dag_prefix = f"{stamme}{dag:%d-%m-%Y}"
+            start_after = nyeste["Key"] if dag == nyeste_dato else None
+            nye.extend(_list(s3_client, bucket, dag_prefix, start_after))
+            dag += timedelta(days=1)
+        return nye
+
+    def _oppdater(self, s3_client, bucket: str, prefix: str, manifest: dict | None) -> dict:
+        naa = datetime.now(timezone.utc)
+        if manifest is None or manifest.get("les_paa_nytt"):
+            # Første gang, eller en annen prosess har skrevet et nyere manifest
+            manifest = self._last(s3_client, bucket, prefix) or manifest
+
+        nye = None
+        if manifest and manifest["objekter"] and naa - manifest["full_listing"] < timedelta(
+            seconds=self.full_listing_sekunder
+        ):
+            nye = self._inkrementelle_nye(s3_client, bucket, prefix, manifest["objekter"])
+
+        if nye is None:
+            objekter = {o["Key"]: o for o in _list(s3_client, bucket, prefix)}
+            etag = manifest.get("etag") if manifest else None
+            manifest = {"full_listing": naa, "objekter": objekter, "etag": etag}
+            print(f"[manifest] {prefix}: full listing, {len(objekter):,} objekter")
+            return self._lagre(s3_client, bucket, prefix, manifest)
+
+        endret = [o for o in nye if manifest["objekter"].get(o["Key"]) != o]
+        if endret:
+            manifest = {**manifest, "objekter": {**manifest["objekter"], **{o["Key"]: o for o in endret}}}
+            print(f"[manifest] {prefix}: {len(endret)} nye/endrede objekter ({len(manifest['objekter']):,} totalt)")
+            manifest = self._lagre(s3_client, bucket, prefix, manifest)
+        return manifest
+
+    def _manifest(self, s3_client, bucket, prefix) -> dict:
+        nokkel = (bucket, prefix)
+        with self._prefix_laas(bucket, prefix):
+            oppf = self._manifester.get(nokkel)
+            if oppf and time.monotonic() - oppf["sjekket"] < self.ttl_sekunder:
+                return oppf
+
+            manifest = self._oppdater(s3_client, bucket, prefix, oppf)
+            return self._bytt_inn(nokkel, oppf, manifest)
+
+    def _bytt_inn(self, nokkel, oppf: dict | None, manifest: dict) -> dict:
+        # Kalles med prefix-låsen holdt; visningene gjenbrukes hvis objektene er de samme
+        uendret = oppf is not None and manifest["objekter"] is oppf["objekter"]
+        ny = {
+            "full_listing": manifest["full_listing"],
+            "objekter": manifest["objekter"],
+            "etag": manifest.get("etag"),
+            "les_paa_nytt": manifest.get("les_paa_nytt", False),
+            "sjekket": time.monotonic(),
+            "visninger": oppf["visninger"] if uendret else {},
+        }
+        with self._lock:
+            self._manifester[nokkel] = ny
+        return ny
+
+    def fjern(self, s3_client, bucket: str, prefix: str, key: str):
+        """
+        Fjerner `key` fra manifestet (i minnet og i S3) når den har vist seg
+        å være slettet, i stedet for å vente på neste fulle listing.
+        """
+        nokkel = (bucket, prefix)
+        with self._prefix_laas(bucket, prefix):
+            oppf = self._manifester.get(nokkel)
+            if oppf is None or key not in oppf["objekter"]:
+                return
+            objekter = {k: o for k, o in oppf["objekter"].items() if k != key}
+            print(f"[manifest] {prefix}: {key} finnes ikke lenger – fjernet")
+            manifest = self._lagre(s3_client, bucket, prefix, {**oppf, "objekter": objekter})
+            self._bytt_inn(nokkel, oppf, manifest)
+
+    # ---------- oppslag ----------
+
+    def _datert(self, oppf: dict, file_pattern: str) -> list[str]:
+        """Nøklene med dato i filnavnet (første nøkkel per dato), sortert på dato."""
+        keys = oppf["visninger"].get(file_pattern)
+        if keys is None:
+            regex = re.compile(file_pattern)
+            per_dato = {}
+            for key in sorted(oppf["objekter"]):
+                match = regex.search(key)
+                if match:
+                    file_date = datetime.strptime(match.group(1), '%d-%m-%Y')
+                    # Samme dato flere ganger: behold første nøkkel (som før)
+                    per_dato.setdefault(file_date, key)
+            keys = oppf["visninger"][file_pattern] = [per_dato[d] for d in sorted(per_dato)]
+        return keys
+
+    def siste(self, s3_client, bucket, prefix, file_pattern):
+        """Nøkkelen med nyest dato i filnavnet, eller None."""
+        keys = self._datert(self._manifest(s3_client, bucket, prefix), file_pattern)
+        return keys[-1] if keys else None
+
+    def filer(self, s3_client, bucket: str, prefix: str, fra: datetime | None = None, til: datetime | None = None):
+        """
+        Objektene under `prefix` med LastModified i [fra, til] (tidssonebevisste
+        datetime, None = åpen grense), nyeste først.
+        """
+        oppf = self._manifest(s3_client, bucket, prefix)
+        sortert = oppf["visninger"].get(None)
+        if sortert is None:
+            sortert = oppf["visninger"][None] = sorted(
+                oppf["objekter"].values(), key=lambda o: o["LastModified"], reverse=True
+            )
+        return [
+            o
+            for o in sortert
+            if (fra is None or o["LastModified"] >= fra) and (til is None or o["LastModified"] <= til)
+        ]
 
+    def _etter_fork(self):
+        self._lock = threading.Lock()
+        self._prefix_laaser = {}
+
+
+fil_resolver = S3FilResolver()
+os.register_at_fork(after_in_child=fil_resolver._etter_fork)
+
+
+def er_slettet(e: Exception) -> bool:
+    """Om `e` er S3 sitt svar på et objekt som ikke finnes (GET eller HEAD)."""
+    return isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound")
+
+
+def find_latest_file_in_s3(s3_client, bucket, prefix, file_pattern):
+    """Finn siste fil i en S3-mappe basert på dato i filnavnet."""
+    try:
+        return fil_resolver.siste(s3_client, bucket, prefix, file_pattern)
     except ClientError as e:
         print(f"Kunne ikke liste objekter i S3: {e}")
         return None
+
+
+def les_listing_csv(raw: bytes) -> pd.DataFrame:
+    """
+    Parser en daglig bolig-/fritidsbolig-CSV (UTF-16, ';'-separert) til en
+    typet DataFrame. Resultatet caches og deles mellom forespørsler, så
+    alt som ikke avhenger av tidspunktet for forespørselen gjøres her.
+    """
+    df = pd.read_csv(
+        io.BytesIO(raw),
+        sep=';',
+        encoding='utf-16',
+        on_bad_lines='skip'
+    )
+    df.columns = df.columns.str.strip()
+
+    if 'publisert_dato' in df.columns:
+        df['publisert_dato_dt'] = pd.to_datetime(df['publisert_dato'], errors='coerce', utc=True)
+
+    for col in ['totalpris', 'M2-pris']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+FACET_KOLONNER = {
+    'fylker': 'fylke',
+    'boligtyper': 'boligtype',
+    'meglere': 'broker_name',
+    'annonsepakker': 'annonsepakke',
+}
+
+
+def tomme_facetter() -> dict:
+    return {**{navn: [] for navn in FACET_KOLONNER}, 'facet_antall': {}}
+
+
+def bygg_facetter(df: pd.DataFrame) -> dict:
+    """
+    Verdier (sortert) og antall annonser per verdi for filter-dropdownene.
+    Beregnes én gang per datafil og caches sammen med DataFramen.
+    """
+    facetter = tomme_facetter()
+    for navn, col in FACET_KOLONNER.items():
+        if col in df.columns:
+            antall = df[col].value_counts(dropna=True)
+            facetter[navn] = sorted(antall.index.tolist())
+            facetter['facet_antall'][navn] = {k: int(v) for k, v in antall.items()}
+    return facetter
+
+
+def legg_til_dager_paa_markedet(df: pd.DataFrame) -> pd.DataFrame:
+    """Returnerer en kopi av df med 'dager_paa_markedet' regnet fra nå."""
+    if 'publisert_dato_dt' in df.columns:
+        now_utc = pd.Timestamp.now('UTC')
+        dager = (now_utc - df['publisert_dato_dt']).dt.days
+    else:
+        dager = pd.Series(float('nan'), index=df.index)
+    return df.assign(dager_paa_markedet=pd.to_numeric(dager, errors='coerce'))
+
+
+PAGINERING_NOKLER = ('offset', 'limit', 'sort', 'fields')
+
+
+class UgyldigeSideParametre(ValueError):
+    """offset/limit/fields i request-JSON har feil type; endepunktene svarer med 400."""
+
+
+def _heltall(payload: dict, navn: str, standard: int) -> int:
+    try:
+        return int(payload.get(navn) or standard)
+    except (TypeError, ValueError):
+        raise UgyldigeSideParametre(f"'{navn}' må være et heltall") from None
+
+
+def les_side_parametre(payload: dict) -> dict | None:
+    """
+    Leser paginering/sortering/projeksjon fra request-JSON:
+        offset: int, limit: int (maks MAX_PAGE_SIZE),
+        sort:   "kolonne" / "-kolonne" (synkende) eller liste av slike,
+        fields: liste med kolonner som skal returneres.
+    Returnerer None hvis ingen av dem er satt – da svarer endepunktene som før.
+    Kaster UgyldigeSideParametre hvis offset/limit ikke er heltall eller
+    fields ikke er en liste av strenger.
+    """
+    if not any(payload.get(k) is not None for k in PAGINERING_NOKLER):
+        return None
+
+    sort = payload.get('sort') or []
+    if isinstance(sort, str):
+        sort = [sort]
+
+    fields = payload.get('fields') or None
+    if fields is not None and not (isinstance(fields, list) and all(isinstance(f, str) for f in fields)):
+        raise UgyldigeSideParametre("'fields' må være en liste med kolonnenavn")
+
+    limit = _heltall(payload, 'limit', MAX_PAGE_SIZE)
+    return {
+        'offset': max(_heltall(payload, 'offset', 0), 0),
+        'limit': min(max(limit, 1), MAX_PAGE_SIZE),
+        'sort': [s for s in sort if isinstance(s, str) and s.lstrip('-')],
+        'fields': fields,
+    }
+
+
+def hent_side(df: pd.DataFrame, params: dict) -> tuple[pd.DataFrame, dict]:
+    """
+    Sorterer (stabilt, NaN sist), plukker ut én side og projiserer kolonner.
+    Bare sorteringsnøklene sorteres, og bare siden materialiseres.
+    Ukjente sorterings- og feltnavn ignoreres.
+    """
+    total = len(df)
+    offset, limit = params['offset'], params['limit']
+
+    nokler = [(s.lstrip('-'), not s.startswith('-')) for s in params['sort']]
+    nokler = [(col, asc) for col, asc in nokler if col in df.columns]
+    if nokler:
+        cols = [col for col, _ in nokler]
+        rekkefolge = (
+            df[cols]
+            .reset_index(drop=True)
+            .sort_values(cols, ascending=[asc for _, asc in nokler], kind='stable', na_position='last')
+            .index[offset:offset + limit]
+        )
+        side = df.iloc[rekkefolge]
+    else:
+        side = df.iloc[offset:offset + limit]
+
+    if params['fields']:
+        side = side[[c for c in params['fields'] if c in side.columns]]
+
+    neste = offset + limit if offset + limit < total else None
+    return side, {'total': total, 'offset': offset, 'limit': limit, 'next_offset': neste}
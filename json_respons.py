@@ -0,0 +1,80 @@
+# json_respons.py
+"""
+Felles JSON-svar for DataFrames.
+
+Tidligere gikk alle data-ruter via df.where(...) -> to_json -> json.loads ->
+jsonify, dvs. tre fulle passeringer og en Python-dict per celle. Her
+skrives JSON direkte fra DataFramen i én passering (to_json gir null for
+NaN/NA selv), og bare de små delene av svaret (KPI-er o.l.) går via json.
+"""
+import json
+from datetime import date, datetime
+
+import pandas as pd
+from flask import Response, request
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+NDJSON_CHUNK_ROWS = 5000
+
+
+def _default(o):
+    # numpy-skalarer, Timestamp/date osv. som kan dukke opp i KPI-dicts
+    if hasattr(o, "item"):
+        return o.item()
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if o is pd.NA or o is pd.NaT:
+        return None
+    raise TypeError(f"Kan ikke serialisere {type(o).__name__}")
+
+
+def df_til_json(df: pd.DataFrame) -> str:
+    """DataFrame -> JSON-array med ett objekt per rad (NaN/NA -> null)."""
+    if df is None or df.empty:
+        return "[]"
+    return df.to_json(orient="records", force_ascii=False)
+
+
+def _til_json(verdi) -> str:
+    if isinstance(verdi, pd.DataFrame):
+        return df_til_json(verdi)
+    return json.dumps(verdi, ensure_ascii=False, default=_default)
+
+
+def json_svar(data=None, status: int = 200, **felter) -> Response:
+    """
+    Bygger et JSON-svar der DataFrames serialiseres direkte.
+
+        json_svar(df)                            -> [ {...}, ... ]
+        json_svar(rows=df, kpis={...})           -> {"rows": [...], "kpis": {...}}
+    """
+    if data is not None:
+        body = _til_json(data)
+    else:
+        body = "{" + ",".join(f"{json.dumps(k)}:{_til_json(v)}" for k, v in felter.items()) + "}"
+    return Response(body.encode("utf-8"), status=status, mimetype="application/json")
+
+
+def ndjson_svar(df: pd.DataFrame) -> Response:
+    """Strømmer én JSON-linje per rad, i biter, uten å bygge hele svaret i minnet."""
+    def _generer():
+        for start in range(0, len(df), NDJSON_CHUNK_ROWS):
+            chunk = df.iloc[start:start + NDJSON_CHUNK_ROWS]
+            tekst = chunk.to_json(orient="records", lines=True, force_ascii=False)
+            yield (tekst.rstrip("\n") + "\n").encode("utf-8")
+
+    return Response(_generer(), mimetype=NDJSON_MIMETYPE)
+
+
+def vil_ha_ndjson(payload: dict | None = None) -> bool:
+    """Klienten ber om NDJSON via Accept-header eller {"format": "ndjson"}."""
+    if payload and payload.get("format") == "ndjson":
+        return True
+    return NDJSON_MIMETYPE in (request.headers.get("Accept") or "")
+
+
+def rader_svar(df: pd.DataFrame, payload: dict | None = None) -> Response:
+    """Liste-svar for data-endepunktene: NDJSON hvis klienten ber om det, ellers JSON."""
+    if vil_ha_ndjson(payload):
+        return ndjson_svar(df)
+    return json_svar(df)
@@ -0,0 +1,141 @@
+# listing_datasett.py
+"""
+Felles datasettmotor for annonsekategorier som leveres som daglige CSV-er
+(bolig, fritidsbolig, ...).
+
+En kategori registreres med S3-mappe og filmønster. Alt annet er felles:
+samme cache (DatasettCache), samme oppfriskingspolicy og samme
+filtermotor (ListingIndeks). Ved oppstart av hver worker lastes alle
+registrerte kilder i en bakgrunnstråd, som deretter holder dem
+oppdatert, slik at ingen forespørsel betaler kald nedlasting.
+
+Ny kategori (f.eks. næringsbolig):
+    registrer_kilde('naeringsbolig', 'raw/naeringsbolig-daglig/',
+                    r'naeringsbolig_X_(\\d{2}-\\d{2}-\\d{4})\\.csv')
+"""
+import os
+import threading
+import time
+
+from aws_clients import get_s3_client
+from config import S3_BUCKET_NAME, LISTING_PRELOAD, LISTING_REFRESH_SECONDS
+from datacache import datasett_cache
+from helpers import er_slettet, fil_resolver, find_latest_file_in_s3, les_listing_csv, bygg_facetter, tomme_facetter
+from listing_filter import ListingIndeks
+from parquet_sidecar import sidecar_laster
+
+
+class ListingKilde:
+    def __init__(self, navn: str, prefix: str, file_pattern: str):
+        self.navn = navn
+        self.prefix = prefix
+        self.file_pattern = file_pattern
+
+
+KILDER: dict[str, ListingKilde] = {}
+
+_laster = sidecar_laster(les_listing_csv)
+
+# Så mange slettede "nyeste" filer hoppes over før det gis opp
+MAKS_FORSOK_SLETTET = 3
+
+
+def registrer_kilde(navn: str, prefix: str, file_pattern: str) -> ListingKilde:
+    kilde = KILDER[navn] = ListingKilde(navn, prefix, file_pattern)
+    return kilde
+
+
+def siste_key(kilde: ListingKilde) -> str | None:
+    return find_latest_file_in_s3(get_s3_client(), S3_BUCKET_NAME, kilde.prefix, kilde.file_pattern)
+
+
+def _hent_nyeste(kilde: ListingKilde):
+    """
+    (key, data) for nyeste datafil, eller (None, None) hvis ingen finnes.
+    En fil som er slettet siden listingen fjernes fra manifestet, og den
+    nest nyeste prøves.
+    """
+    for _ in range(MAKS_FORSOK_SLETTET):
+        key = siste_key(kilde)
+        if not key:
+            return None, None
+        try:
+            return key, datasett_cache.hent(get_s3_client(), S3_BUCKET_NAME, key, _laster)
+        except Exception as e:
+            if not er_slettet(e):
+                raise
+            fil_resolver.fjern(get_s3_client(), S3_BUCKET_NAME, kilde.prefix, key)
+    return None, None
+
+
+def hent_indeks(kilde: ListingKilde) -> ListingIndeks | None:
+    """Filtermotoren for nyeste datafil (None hvis ingen fil finnes)."""
+    key, data = _hent_nyeste(kilde)
+    if key is None:
+        return None
+    return datasett_cache.avledet(S3_BUCKET_NAME, key, 'indeks', ListingIndeks, data)
+
+
+def hent_facetter(kilde: ListingKilde) -> dict:
+    """Verdier og antall for filter-dropdownene (tomme lister hvis ingen fil finnes)."""
+    key, data = _hent_nyeste(kilde)
+    if key is None:
+        return tomme_facetter()
+    return datasett_cache.avledet(S3_BUCKET_NAME, key, 'facetter', bygg_facetter, data)
+
+
+# -------------------------------------------------
+# Forhåndslasting / oppfrisking
+# -------------------------------------------------
+
+_traad = None
+_traad_lock = threading.Lock()
+_onsket = False
+_lastet = set()
+
+
+def forhaandslast():
+    """Laster (eller revaliderer) alle registrerte kilder inkl. indeks og facetter."""
+    for kilde in list(KILDER.values()):
+        try:
+            t0 = time.perf_counter()
+            hent_indeks(kilde)
+            hent_facetter(kilde)
+            if kilde.navn not in _lastet:
+                _lastet.add(kilde.navn)
+                print(f"[listing] {kilde.navn} klar ({time.perf_counter() - t0:.2f}s)")
+        except Exception as e:
+            print(f"[listing] Kunne ikke laste {kilde.navn}: {e}")
+
+
+def _oppfrisk_loop():
+    while True:
+        forhaandslast()
+        time.sleep(LISTING_REFRESH_SECONDS)
+
+
+def start_forhaandslasting():
+    """
+    Starter bakgrunnstråden (én per prosess). Tråder overlever ikke fork,
+    så ved gunicorn --preload startes den på nytt i hver worker.
+    """
+    global _traad, _onsket
+    if not LISTING_PRELOAD:
+        return
+    with _traad_lock:
+        _onsket = True
+        if _traad is not None and _traad.is_alive():
+            return
+        _traad = threading.Thread(target=_oppfrisk_loop, name="listing-preload", daemon=True)
+        _traad.start()
+
+
+def _etter_fork():
+    global _traad, _traad_lock
+    _traad = None
+    _traad_lock = threading.Lock()
+    if _onsket:
+        start_forhaandslasting()
+
+
+os.register_at_fork(after_in_child=_etter_fork)
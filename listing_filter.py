@@ -0,0 +1,134 @@
+# listing_filter.py
+"""
+Filtermotor for bolig-/fritidsboligdata.
+
+ListingIndeks bygges én gang per datafil (se DatasettCache.avledet) og
+holder det som trengs for å evaluere filtrene uten å kopiere DataFramen:
+  - kategorikoder for fylke/boligtype/megler/annonsepakke
+  - forhåndssorterte verdier + rekkefølge for intervallkolonnene
+  - trigram-indeks over full_title for nøkkelordsøk
+Alle filtrene slås sammen til én boolsk maske, og DataFramen indekseres
+bare én gang til slutt.
+"""
+import numpy as np
+import pandas as pd
+
+from helpers import legg_til_dager_paa_markedet
+from tekstindeks import TrigramIndeks
+
+# filternavn -> kolonne
+KATEGORI_FILTRE = {
+    'fylke': 'fylke',
+    'boligtype': 'boligtype',
+    'megler': 'broker_name',
+    'annonsepakke': 'annonsepakke',
+}
+
+# kolonne -> (filter fra, filter til)
+INTERVALL_FILTRE = {
+    'totalpris': ('totalpris_fra', 'totalpris_til'),
+    'M2-pris': ('m2pris_fra', 'm2pris_til'),
+}
+
+EN_DAG = np.timedelta64(1, 'D')
+
+
+class _SortertKolonne:
+    """Gyldige (ikke-NaN) verdier sortert, med radnummeret til hver verdi."""
+
+    def __init__(self, verdier: np.ndarray):
+        gyldig = np.flatnonzero(~pd.isna(verdier))
+        rekkefolge = np.argsort(verdier[gyldig], kind='stable')
+        self.rader = gyldig[rekkefolge]
+        self.verdier = verdier[self.rader]
+
+    def rader_mellom(self, fra=None, til=None, inkluder_fra=True, inkluder_til=True) -> np.ndarray:
+        lo = 0 if fra is None else np.searchsorted(self.verdier, fra, 'left' if inkluder_fra else 'right')
+        hi = len(self.verdier) if til is None else np.searchsorted(self.verdier, til, 'right' if inkluder_til else 'left')
+        return self.rader[lo:max(lo, hi)]
+
+
+class ListingIndeks:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.n = len(df)
+
+        self.kategorier = {}
+        for col in KATEGORI_FILTRE.values():
+            if col in df.columns:
+                cat = pd.Categorical(df[col])
+                self.kategorier[col] = (cat.codes, cat.categories)
+
+        self.intervaller = {}
+        for col in INTERVALL_FILTRE:
+            if col in df.columns:
+                self.intervaller[col] = _SortertKolonne(df[col].to_numpy(dtype=float, na_value=np.nan))
+
+        self.tittel = TrigramIndeks(df['full_title']) if 'full_title' in df.columns else None
+
+        # dager_paa_markedet avhenger av "nå", så vi indekserer publiseringstidspunktet
+        # og regner om dager-grensene til tidspunkt per forespørsel.
+        self.publisert = None
+        if 'publisert_dato_dt' in df.columns:
+            ts = df['publisert_dato_dt'].dt.tz_convert('UTC').dt.tz_localize(None)
+            self.publisert = _SortertKolonne(ts.to_numpy(dtype='datetime64[ns]'))
+
+    def _og_rader(self, maske: np.ndarray, rader: np.ndarray):
+        treff = np.zeros(self.n, dtype=bool)
+        treff[rader] = True
+        maske &= treff
+
+    def maske(self, filters: dict) -> np.ndarray:
+        maske = np.ones(self.n, dtype=bool)
+
+        for navn, col in KATEGORI_FILTRE.items():
+            verdi = filters.get(navn)
+            if not verdi or verdi == 'Alle':
+                continue
+            if col not in self.kategorier:
+                maske[:] = False
+                continue
+            codes, kategorier = self.kategorier[col]
+            pos = kategorier.get_indexer([verdi])[0]
+            if pos < 0:
+                maske[:] = False
+            else:
+                maske &= codes == pos
+
+        for col, (f_fra, f_til) in INTERVALL_FILTRE.items():
+            fra = int(filters[f_fra]) if filters.get(f_fra) else None
+            til = int(filters[f_til]) if filters.get(f_til) else None
+            if fra is None and til is None:
+                continue
+            if col not in self.intervaller:
+                maske[:] = False
+                continue
+            self._og_rader(maske, self.intervaller[col].rader_mellom(fra, til))
+
+        dager_fra = int(filters['dager_fra']) if filters.get('dager_fra') else None
+        dager_til = int(filters['dager_til']) if filters.get('dager_til') else None
+        if dager_fra is not None or dager_til is not None:
+            if self.publisert is None:
+                maske[:] = False
+            else:
+                naa = pd.Timestamp.now('UTC').tz_localize(None).to_datetime64().astype('datetime64[ns]')
+                # dager >= d  <=>  publisert <= naa - d
+                # dager <= d  <=>  publisert >  naa - (d + 1)
+                seneste = naa - dager_fra * EN_DAG if dager_fra is not None else None
+                tidligste = naa - (dager_til + 1) * EN_DAG if dager_til is not None else None
+                self._og_rader(
+                    maske,
+                    self.publisert.rader_mellom(tidligste, seneste, inkluder_fra=False),
+                )
+
+        return maske
+
+    def filtrer(self, filters: dict) -> pd.DataFrame:
+        """Returnerer radene som matcher filtrene, med dager_paa_markedet."""
+        rader = np.flatnonzero(self.maske(filters))
+
+        # Fritekst: trigram-oppslag, snittet med radene fra de andre filtrene
+        if filters.get('keyword') and self.tittel is not None:
+            rader = self.tittel.sok(filters['keyword'], kandidater=rader)
+
+        return legg_til_dager_paa_markedet(self.df.iloc[rader])
@@ -0,0 +1,60 @@
+# listing_routes.py
+from flask import Blueprint, render_template, jsonify, request
+
+from helpers import UgyldigeSideParametre, les_side_parametre, hent_side
+from json_respons import json_svar, rader_svar
+from listing_datasett import ListingKilde, hent_indeks, hent_facetter, tomme_facetter
+
+
+def lag_listing_blueprint(kilde: ListingKilde, url_prefix: str, tittel: str, **template_args) -> Blueprint:
+    """
+    Lager analyseside ('/') og data-endepunkt ('/data') for en registrert
+    annonsekategori. All datalogikk ligger i listing_datasett.
+    """
+    bp = Blueprint(kilde.navn, __name__, url_prefix=url_prefix)
+    data_url = f"{url_prefix}/data"
+
+    @bp.route('/')
+    def analyse_side():
+        """Viser analysesiden og fyller filtrene fra forhåndsberegnede facetter."""
+        try:
+            filter_data = hent_facetter(kilde)
+        except Exception as e:
+            print(f"Feil under forberedelse av {kilde.navn}-filtre: {e}")
+            filter_data = tomme_facetter()
+
+        return render_template(
+            'analyse_template.html',
+            tittel=tittel,
+            data_url=data_url,
+            **template_args,
+            **filter_data
+        )
+
+    @bp.route('/data', methods=['POST'])
+    def get_data():
+        """API-endepunkt som filtrerer nyeste datafil for kategorien."""
+        try:
+            indeks = hent_indeks(kilde)
+            if indeks is None:
+                return jsonify({"error": f"Ingen {kilde.navn}-datafil funnet"}), 404
+
+            payload = request.get_json()
+            filters = payload.get('filters', {})
+            df = indeks.filtrer(filters)
+
+            # Med offset/limit/sort/fields svarer vi med én side + totalt antall
+            side_params = les_side_parametre(payload)
+            if side_params:
+                df, side_meta = hent_side(df, side_params)
+                return json_svar(**side_meta, rows=df)
+
+            return rader_svar(df, payload)
+
+        except UgyldigeSideParametre as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            print(f"Feil i {data_url}: {e}")
+            return jsonify({"error": "Intern feil"}), 500
+
+    return bp
@@ -0,0 +1,188 @@
+# lokalt_speil.py
+"""
+Lokalt diskspeil av store S3-objekter (f.eks. bil_time.parquet).
+
+Objektet lastes ned én gang per ETag til LOCAL_MIRROR_DIR og åpnes
+deretter med minnemapping (pyarrow.memory_map). Alle prosesser på samme
+maskin (gunicorn-workere, Streamlit) deler da én kopi i OS-ets page cache,
+lesing er zero-copy, og en omstartet worker trenger ikke laste ned på nytt.
+
+Filnavnet inneholder en hash av ETag-en, så en ny versjon gir ny fil.
+Nedlastingen skrives til en midlertidig fil og flyttes på plass atomisk,
+under en fillås slik at bare én prosess laster ned samme versjon.
+
+Speilet er av som standard: det laster ned hele objektet før første
+lesing, mens lesing rett fra S3 bare henter kolonnene og radgruppene som
+trengs (se snapshot_parquet). Det lønner seg når mange prosesser på samme
+maskin leser store deler av filen.
+
+Speilet er begrenset til LOCAL_MIRROR_MAX_MB. Hver gang en kopi brukes,
+oppdateres mtime, og etter hver nedlasting slettes de minst nylig brukte
+filene til summen er under grensen. Kopier av samme nøkkel med en annen
+ETag enn den som nettopp ble lastet ned slettes uansett grensen. Filer som er brukt de siste
+LOCAL_MIRROR_MIN_AGE_SECONDS slettes aldri, så en annen prosess som nettopp
+har fått stien (og skal åpne eller minnemappe den) ikke mister filen.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: ingen lås, men nedlastingen er fortsatt atomisk
+    fcntl = None
+
+from config import LOCAL_MIRROR_DIR, LOCAL_MIRROR_MAX_MB, LOCAL_MIRROR_MIN_AGE_SECONDS
+
+CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def _filnavn(key: str, etag: str) -> tuple[str, str]:
+    base = key.replace("/", "__")
+    versjon = hashlib.sha1((etag or "").encode()).hexdigest()[:16]
+    return base, f"{base}.{versjon}"
+
+
+class _Laas:
+    def __init__(self, sti: str):
+        self.sti = sti
+        self.fil = None
+
+    def __enter__(self):
+        self.fil = open(self.sti, "a+b")
+        _bruk(self.sti)
+        if fcntl is not None:
+            fcntl.flock(self.fil, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fil, fcntl.LOCK_UN)
+        self.fil.close()
+
+
+def _bruk(sti: str) -> bool:
+    """Markerer filen som nylig brukt (mtime = nå). False hvis den ikke finnes."""
+    try:
+        os.utime(sti)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        # Eid av en annen bruker: kan leses, men ikke merkes
+        return os.path.exists(sti)
+    return True
+
+
+def rydd_lru(
+    katalog: str,
+    maks_bytes: float,
+    min_alder_sekunder: float,
+    versjon_av=None,
+    behold: str | None = None,
+    maks_alder_sekunder: float | None = None,
+    navn_i_logg: str = "speil",
+):
+    """
+    Sletter de minst nylig brukte filene (eldste mtime) i `katalog` til
+    summen er under `maks_bytes`. `behold` er gjeldende versjon av sin
+    nøkkel, og `versjon_av(navn)` gir nøkkel-delen av et filnavn: andre
+    versjoner (ETag-er) av samme nøkkel er utdaterte og slettes uansett
+    grensen, og det samme gjør filer som ikke er brukt på
+    `maks_alder_sekunder`. Filer brukt de siste `min_alder_sekunder` og
+    `behold` slettes aldri. Låsfiler og midlertidige filer ryddes når de er
+    gamle.
+    """
+    naa = time.time()
+    filer = []
+    try:
+        navn_liste = os.listdir(katalog)
+    except OSError:
+        return
+    for navn in navn_liste:
+        sti = os.path.join(katalog, navn)
+        try:
+            st = os.stat(sti)
+        except OSError:
+            continue
+        filer.append((st.st_mtime, st.st_size, navn, sti))
+
+    data = sorted(f for f in filer if not f[2].endswith((".lock", ".tmp")))
+    # Utdatert avgjøres av ETag-en i filnavnet, ikke mtime (som oppdateres ved bruk)
+    gjeldende = os.path.basename(behold) if behold and versjon_av is not None else None
+
+    totalt = sum(f[1] for f in data)
+    slettet = 0
+    for mtime, storrelse, navn, sti in data:
+        if sti == behold or naa - mtime < min_alder_sekunder:
+            continue
+        utdatert = gjeldende is not None and navn != gjeldende and versjon_av(navn) == versjon_av(gjeldende)
+        for_gammel = maks_alder_sekunder is not None and naa - mtime > maks_alder_sekunder
+        if totalt <= maks_bytes and not utdatert and not for_gammel:
+            continue
+        try:
+            os.remove(sti)
+        except OSError:
+            continue
+        totalt -= storrelse
+        slettet += 1
+
+    # Låser og halvferdige nedlastinger som ikke er rørt på lenge
+    gjenvaerende = {versjon_av(f[2]) for f in data if os.path.exists(f[3])} if versjon_av else set()
+    for mtime, _, navn, sti in filer:
+        if naa - mtime < min_alder_sekunder:
+            continue
+        if navn.endswith(".tmp") or (navn.endswith(".lock") and navn[: -len(".lock")] not in gjenvaerende):
+            try:
+                os.remove(sti)
+            except OSError:
+                pass
+
+    if slettet:
+        print(f"[{navn_i_logg}] {katalog}: {slettet} filer slettet, {totalt / 1e6:.1f} MB igjen")
+
+
+def _base(navn: str) -> str:
+    # <base>.<16 hex>
+    return navn[:-17]
+
+
+def speil_aktivt() -> bool:
+    return bool(LOCAL_MIRROR_DIR)
+
+
+def hent_lokal_kopi(s3_client, bucket: str, key: str, etag: str) -> tuple[str, int]:
+    """
+    Sti til lokal kopi av `key` med versjon `etag`, og antall bytes som
+    måtte lastes ned (0 hvis kopien fantes fra før).
+    """
+    os.makedirs(LOCAL_MIRROR_DIR, exist_ok=True)
+    base, navn = _filnavn(key, etag)
+    sti = os.path.join(LOCAL_MIRROR_DIR, navn)
+    if _bruk(sti):
+        return sti, 0
+
+    with _Laas(os.path.join(LOCAL_MIRROR_DIR, base + ".lock")):
+        # En annen prosess kan ha lastet ned mens vi ventet på låsen
+        if _bruk(sti):
+            return sti, 0
+
+        obj = s3_client.get_object(Bucket=bucket, Key=key, IfMatch=etag)
+        fd, tmp = tempfile.mkstemp(dir=LOCAL_MIRROR_DIR, prefix=navn + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(obj["Body"], f, CHUNK_BYTES)
+            # mkstemp gir 0600; andre prosesser (f.eks. Streamlit som annen bruker) skal kunne lese
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, sti)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        storrelse = os.path.getsize(sti)
+        print(f"[speil] {key} -> {sti} ({storrelse / 1e6:.1f} MB)")
+
+    rydd_lru(LOCAL_MIRROR_DIR, LOCAL_MIRROR_MAX_MB * 1e6, LOCAL_MIRROR_MIN_AGE_SECONDS, _base, behold=sti)
+    return sti, storrelse
@@ -0,0 +1,109 @@
+# minnecache.py
+"""
+Prosess-lokal LRU-cache begrenset i bytes og (valgfritt) alder.
+
+Hver oppføring har en `versjon` (f.eks. nyeste S3-nøkkel eller ETag).
+Et oppslag med en annen versjon enn den som ble lagret regnes som bom,
+og oppføringen kastes. Størrelsen måles med pandas' memory_usage for
+DataFrames/Series (også inni tupler/lister), så summen av oppføringene
+holdes under `maks_bytes`.
+
+Treff, bom og utkastinger telles og kan leses med `statistikk()`.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+_MANGLER = object()
+
+
+def storrelse_bytes(verdi) -> int:
+    """Omtrentlig minnebruk for DataFrames/Series, også inni tupler, lister og dicter."""
+    if isinstance(verdi, pd.DataFrame):
+        return int(verdi.memory_usage(deep=True).sum())
+    if isinstance(verdi, pd.Series):
+        return int(verdi.memory_usage(deep=True))
+    if isinstance(verdi, (tuple, list)):
+        return sum(storrelse_bytes(v) for v in verdi)
+    if isinstance(verdi, dict):
+        return sum(storrelse_bytes(v) for v in verdi.values())
+    return 0
+
+
+class MinneCache:
+    def __init__(self, navn: str, maks_bytes: float, ttl_sekunder: float | None = None):
+        self.navn = navn
+        self.maks_bytes = maks_bytes
+        self.ttl_sekunder = ttl_sekunder
+        self._lock = threading.Lock()
+        self._oppforinger: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self.treff = 0
+        self.bom = 0
+        self.utkastet = 0
+
+    def _fjern(self, nokkel):
+        oppf = self._oppforinger.pop(nokkel)
+        self._bytes -= oppf["bytes"]
+
+    def hent(self, nokkel, versjon=None, standard=None):
+        """Lagret verdi for `nokkel` hvis versjonen stemmer og den ikke er for gammel."""
+        with self._lock:
+            oppf = self._oppforinger.get(nokkel, _MANGLER)
+            if oppf is not _MANGLER:
+                utlopt = self.ttl_sekunder is not None and time.monotonic() - oppf["lagret"] > self.ttl_sekunder
+                if oppf["versjon"] == versjon and not utlopt:
+                    self._oppforinger.move_to_end(nokkel)
+                    self.treff += 1
+                    return oppf["verdi"]
+                self._fjern(nokkel)
+                self.utkastet += 1
+            self.bom += 1
+            return standard
+
+    def lagre(self, nokkel, verdi, versjon=None, storrelse: int | None = None):
+        """Lagrer `verdi` og kaster de minst nylig brukte til summen er under grensen."""
+        storrelse = storrelse_bytes(verdi) if storrelse is None else storrelse
+        if storrelse > self.maks_bytes:
+            print(f"[{self.navn}] {nokkel} er {storrelse / 1e6:.1f} MB, større enn hele cachen – lagres ikke")
+            return
+        with self._lock:
+            if nokkel in self._oppforinger:
+                self._fjern(nokkel)
+            self._oppforinger[nokkel] = {
+                "verdi": verdi,
+                "versjon": versjon,
+                "bytes": storrelse,
+                "lagret": time.monotonic(),
+            }
+            self._bytes += storrelse
+            while self._bytes > self.maks_bytes:
+                self._fjern(next(iter(self._oppforinger)))
+                self.utkastet += 1
+
+    def tom(self):
+        with self._lock:
+            self._oppforinger.clear()
+            self._bytes = 0
+
+    def statistikk(self) -> dict:
+        with self._lock:
+            return {
+                "oppforinger": len(self._oppforinger),
+                "bytes": self._bytes,
+                "treff": self.treff,
+                "bom": self.bom,
+                "utkastet": self.utkastet,
+            }
+
+    def __str__(self):
+        s = self.statistikk()
+        return (
+            f"{s['oppforinger']} oppføringer, {s['bytes'] / 1e6:.1f} MB, "
+            f"{s['treff']} treff / {s['bom']} bom, {s['utkastet']} utkastet"
+        )
+
+    def _etter_fork(self):
+        self._lock = threading.Lock()
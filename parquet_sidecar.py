@@ -0,0 +1,191 @@
+# parquet_sidecar.py
+"""
+Parquet-sidecars for de daglige/timevise UTF-16 CSV-filene i S3.
+
+Første gang en CSV leses, skrives den parsede DataFramen tilbake som en
+komprimert Parquet-fil under SIDECAR_PREFIX (samme nøkkel, .parquet).
+Senere lesinger henter sidecaren i stedet for CSV-en – færre bytes over
+nettet og ingen tekstparsing. Sidecaren er merket med CSV-ens ETag, så en
+overskrevet CSV gir automatisk ny sidecar.
+
+Kan også kjøres som skript for å konvertere en hel mappe på forhånd:
+    python parquet_sidecar.py raw/bil-time/
+"""
+import io
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+
+SIDECAR_PREFIX = "calc/sidecar/"
+# Øk denne hvis parserne endrer hva som lagres, så gamle sidecars bygges på nytt
+SIDECAR_VERSJON = "2"
+
+
+def sidecar_key(csv_key: str) -> str:
+    """raw/bil-time/x.csv -> calc/sidecar/raw/bil-time/x.parquet"""
+    base = csv_key[:-4] if csv_key.lower().endswith(".csv") else csv_key
+    return SIDECAR_PREFIX + base + ".parquet"
+
+
+def _gjor_parquet_vennlig(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    read_csv kan gi object-kolonner med blandede typer (f.eks. Pris med både
+    tall og 'Solgt'). Parquet krever én type per kolonne, så vi lagrer slike
+    verdier som tekst. Tallkolonner og rene tekstkolonner røres ikke.
+    """
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object and pd.api.types.infer_dtype(s, skipna=True) not in ("string", "empty"):
+            df[col] = s.where(s.isna(), s.astype(str))
+    return df
+
+
+def dataframe_til_parquet(df: pd.DataFrame, kilde_etag: str | None = None, metadata: dict | None = None) -> bytes:
+    df = _gjor_parquet_vennlig(df.copy())
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = dict(table.schema.metadata or {})
+    meta[b"sidecar_versjon"] = SIDECAR_VERSJON.encode()
+    if kilde_etag:
+        meta[b"kilde_etag"] = kilde_etag.encode()
+    for navn, verdi in (metadata or {}).items():
+        meta[navn.encode()] = str(verdi).encode()
+    table = table.replace_schema_metadata(meta)
+
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression="zstd")
+    return buf.getvalue()
+
+
+def put_hvis_uendret(s3_client, bucket: str, key: str, body: bytes, forrige_etag: str | None, **kwargs) -> bool:
+    """
+    PUT som bare lykkes hvis `key` fortsatt har ETag-en `forrige_etag` (None =
+    objektet skal ikke finnes ennå). Har en annen prosess skrevet i mellomtiden,
+    returneres False og ingenting skrives.
+    """
+    betingelse = {"IfMatch": forrige_etag} if forrige_etag else {"IfNoneMatch": "*"}
+    try:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=body, **betingelse, **kwargs)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409"):
+            return False
+        raise
+    return True
+
+
+def _les_sidecar(s3_client, bucket: str, key: str, etag: str | None) -> pd.DataFrame | None:
+    try:
+        obj = s3_client.get_object(Bucket=bucket, Key=sidecar_key(key))
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+
+    table = pq.read_table(pa.BufferReader(obj["Body"].read()))
+    meta = table.schema.metadata or {}
+    if meta.get(b"sidecar_versjon", b"").decode() != SIDECAR_VERSJON:
+        return None
+    if etag and meta.get(b"kilde_etag", b"").decode() != etag:
+        return None
+    return table.to_pandas()
+
+
+def les_med_sidecar(s3_client, bucket: str, key: str, csv_parser, etag: str | None = None) -> pd.DataFrame:
+    """
+    Leser CSV-en `key` som DataFrame, via Parquet-sidecar hvis den finnes.
+
+    `csv_parser(bytes) -> DataFrame` brukes bare når sidecaren mangler eller
+    er utdatert; resultatet skrives da som ny sidecar. Feil ved skriving
+    (f.eks. manglende PutObject-tilgang) logges, men stopper ikke lesingen.
+    """
+    if etag is None:
+        etag = s3_client.head_object(Bucket=bucket, Key=key).get("ETag")
+
+    try:
+        df = _les_sidecar(s3_client, bucket, key, etag)
+        if df is not None:
+            return df
+    except Exception as e:
+        print(f"[sidecar] Kunne ikke lese sidecar for {key}: {e}")
+
+    return _bygg_sidecar(s3_client, bucket, key, csv_parser, etag)
+
+
+def _bygg_sidecar(s3_client, bucket: str, key: str, csv_parser, etag: str | None) -> pd.DataFrame:
+    obj = s3_client.get_object(Bucket=bucket, Key=key)
+    df = csv_parser(obj["Body"].read())
+    etag = obj.get("ETag") or etag
+
+    try:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=sidecar_key(key),
+            Body=dataframe_til_parquet(df, kilde_etag=etag),
+            ContentType="application/vnd.apache.parquet",
+            Metadata={"kilde-etag": etag or "", "sidecar-versjon": SIDECAR_VERSJON},
+        )
+    except Exception as e:
+        print(f"[sidecar] Kunne ikke skrive sidecar for {key}: {e}")
+
+    return df
+
+
+def _har_gyldig_sidecar(s3_client, bucket: str, key: str, etag: str | None) -> bool:
+    try:
+        head = s3_client.head_object(Bucket=bucket, Key=sidecar_key(key))
+    except ClientError:
+        return False
+    meta = head.get("Metadata", {})
+    return meta.get("sidecar-versjon") == SIDECAR_VERSJON and meta.get("kilde-etag") == etag
+
+
+def sidecar_laster(csv_parser):
+    """Laster for DatasettCache.hent som går via Parquet-sidecar."""
+    def _last(s3_client, bucket, key, etag):
+        return les_med_sidecar(s3_client, bucket, key, csv_parser, etag=etag)
+    return _last
+
+
+def les_utf16_csv(raw: bytes) -> pd.DataFrame:
+    """Standard-parser for de ';'-separerte UTF-16-filene fra skraperen."""
+    return pd.read_csv(io.BytesIO(raw), encoding="utf-16", sep=";")
+
+
+def ingest_prefix(s3_client, bucket: str, prefix: str, csv_parser=les_utf16_csv) -> int:
+    """Lager sidecar for alle CSV-er under `prefix` som ikke har en gyldig fra før."""
+    antall = 0
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for side in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in side.get("Contents", []):
+            key = obj["Key"]
+            if not key.lower().endswith(".csv"):
+                continue
+            try:
+                if _har_gyldig_sidecar(s3_client, bucket, key, obj.get("ETag")):
+                    continue
+                _bygg_sidecar(s3_client, bucket, key, csv_parser, obj.get("ETag"))
+                antall += 1
+                print(f"[sidecar] {key} -> {sidecar_key(key)}")
+            except Exception as e:
+                print(f"[sidecar] Feil ved konvertering av {key}: {e}")
+    return antall
+
+
+if __name__ == "__main__":
+    from aws_clients import get_s3_client
+    from config import S3_BUCKET_NAME
+    from helpers import les_listing_csv
+    from rekordrask_logic import les_bil_csv
+
+    parsere = {
+        "raw/bil-time/": les_bil_csv,
+        "raw/bil-daglig/": les_bil_csv,
+        "raw/bolig-daglig/": les_listing_csv,
+        "raw/fritidsbolig-daglig/": les_listing_csv,
+    }
+    s3 = get_s3_client()
+    for pfx in sys.argv[1:] or list(parsere):
+        parser = parsere.get(pfx, les_utf16_csv)
+        print(f"{pfx}: {ingest_prefix(s3, S3_BUCKET_NAME, pfx, parser)} nye sidecars")
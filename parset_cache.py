@@ -0,0 +1,158 @@
+# parset_cache.py
+"""
+Cache for ferdig parsede og normaliserte S3-filer (typisk én timefil fra
+raw/bil-time/ etter _ensure_standard_cols), nøklet på S3-nøkkel + ETag.
+
+To nivåer:
+  - minne: de sist brukte DataFramene i denne prosessen, begrenset i bytes
+  - disk: én Parquet-fil per (nøkkel, ETag) i PARSED_CACHE_DIR, delt av
+    alle prosesser på maskinen og bevart over omstarter. Begrenset til
+    PARSED_CACHE_DISK_MAX_MB (minst nylig brukte slettes først, se
+    lokalt_speil.rydd_lru) og PARSED_CACHE_MAX_AGE_DAYS uten bruk
+
+Historiske timefiler endres aldri, så når analysevinduet flyttes eller en
+ny timefil kommer, er det bare filene som ikke er sett før som må lastes
+ned og parses. Øk PARSET_VERSJON når normaliseringen endres, så bygges
+disknivået på nytt.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import PARSED_CACHE_DIR, PARSED_CACHE_DISK_MAX_MB, PARSED_CACHE_MAX_AGE_DAYS, PARSED_CACHE_MAX_MB
+from lokalt_speil import rydd_lru
+from minnecache import MinneCache
+
+PARSET_VERSJON = "2"
+
+# Disknivået ryddes høyst så ofte per prosess (en kald start skriver hundrevis av filer)
+RYDD_INTERVALL_SEKUNDER = 60
+# Filer brukt nylig slettes ikke (en annen prosess kan være i ferd med å lese dem)
+MIN_ALDER_SEKUNDER = 60
+
+
+def _filnavn(key: str, etag: str) -> tuple[str, str]:
+    base = key.replace("/", "__")
+    versjon = hashlib.sha1(f"{PARSET_VERSJON}:{etag}".encode()).hexdigest()[:16]
+    return base, f"{base}.{versjon}.parquet"
+
+
+def _base(navn: str) -> str:
+    # <base>.<16 hex>.parquet
+    return navn[: -len(".0123456789abcdef.parquet")]
+
+
+def _skriv_parquet(df: pd.DataFrame, sti: str):
+    katalog = os.path.dirname(sti)
+    fd, tmp = tempfile.mkstemp(dir=katalog, prefix=os.path.basename(sti) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp, compression="zstd")
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, sti)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _les_parquet(sti: str) -> pd.DataFrame:
+    table = pq.read_table(sti)
+    df = table.to_pandas()
+    # Kolonner som var helt tomme (pd.NA) lagres som null-type; gjenopprett dem likt
+    for felt in table.schema:
+        if pa.types.is_null(felt.type):
+            df[felt.name] = pd.Series(pd.NA, index=df.index, dtype=object)
+    return df
+
+
+class ParsetCache:
+    def __init__(
+        self,
+        katalog: str = PARSED_CACHE_DIR,
+        maks_bytes: float = PARSED_CACHE_MAX_MB * 1e6,
+        disk_maks_bytes: float = PARSED_CACHE_DISK_MAX_MB * 1e6,
+        disk_maks_alder_sekunder: float = PARSED_CACHE_MAX_AGE_DAYS * 86400,
+    ):
+        self.katalog = katalog
+        self.disk_maks_bytes = disk_maks_bytes
+        self.disk_maks_alder_sekunder = disk_maks_alder_sekunder
+        self._sist_ryddet = None
+        # Versjon = ETag, så en overskrevet fil erstatter den gamle oppføringen
+        self._minne = MinneCache("parset", maks_bytes)
+
+    def _fra_disk(self, key: str, etag: str) -> pd.DataFrame | None:
+        if not self.katalog:
+            return None
+        sti = os.path.join(self.katalog, _filnavn(key, etag)[1])
+        if not os.path.exists(sti):
+            return None
+        try:
+            df = _les_parquet(sti)
+        except Exception as e:
+            print(f"[parset] Kunne ikke lese {sti}: {e}")
+            return None
+        try:
+            # Merk som nylig brukt, så den ikke ryddes bort (se _rydd)
+            os.utime(sti)
+        except OSError:
+            pass
+        return df
+
+    def _til_disk(self, key: str, etag: str, df: pd.DataFrame):
+        if not self.katalog:
+            return
+        try:
+            os.makedirs(self.katalog, exist_ok=True)
+            sti = os.path.join(self.katalog, _filnavn(key, etag)[1])
+            _skriv_parquet(df, sti)
+            self._rydd(sti)
+        except Exception as e:
+            print(f"[parset] Kunne ikke skrive {key} til disk: {e}")
+
+    def _rydd(self, behold: str):
+        """Holder disknivået under grensene; eldre versjoner av samme nøkkel går først."""
+        naa = time.monotonic()
+        if self._sist_ryddet is not None and naa - self._sist_ryddet < RYDD_INTERVALL_SEKUNDER:
+            return
+        self._sist_ryddet = naa
+        rydd_lru(
+            self.katalog,
+            self.disk_maks_bytes,
+            MIN_ALDER_SEKUNDER,
+            _base,
+            behold=behold,
+            maks_alder_sekunder=self.disk_maks_alder_sekunder,
+            navn_i_logg="parset",
+        )
+
+    def hent(self, key: str, etag: str | None, laster) -> pd.DataFrame:
+        """
+        Parset innhold av `key` med versjon `etag`; `laster()` kalles bare
+        hvis verken minnet eller disken har det. Kalleren får en grunn kopi
+        og kan legge til kolonner uten å endre det som ligger i cachen.
+        """
+        if not etag:
+            return laster()
+
+        df = self._minne.hent(key, etag)
+        if df is None:
+            df = self._fra_disk(key, etag)
+            if df is None:
+                df = laster()
+                self._til_disk(key, etag, df)
+            self._minne.lagre(key, df, etag)
+        return df.copy(deep=False)
+
+    def _etter_fork(self):
+        self._minne._etter_fork()
+
+
+# Én felles instans per prosess (dvs. per gunicorn-worker)
+parset_cache = ParsetCache()
+os.register_at_fork(after_in_child=parset_cache._etter_fork)
@@ -0,0 +1,95 @@
+# rekordrask_filter.py
+"""
+Filtermotor for solgt-visningen på /bil/rekordrask/data.
+
+RekordraskIndeks bygges én gang per solgt-visning (dvs. per datasettversjon
+og startdato, se rekordrask_parquet) og holder kolonnene som numpy-arrays
+med NaN-verdiene allerede erstattet slik filtrene forventer. Alle filtrene
+evalueres som én boolsk maske uten mellomliggende DataFrames.
+
+Solgt-visningen er sortert på timer_til_salg (raskest først), så de N
+raskeste treffene er bare de N første sanne posisjonene i masken – ingen
+sortering per forespørsel.
+"""
+import numpy as np
+import pandas as pd
+
+# filternavn -> kolonne (likhet)
+KATEGORI_FILTRE = {
+    'produsent': 'Merke',
+    'modell': 'Modell',
+}
+
+
+def _tall(df: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+
+class RekordraskIndeks:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.n = len(df)
+
+        self.kategorier = {}
+        for col in KATEGORI_FILTRE.values():
+            if col in df.columns:
+                cat = pd.Categorical(df[col])
+                self.kategorier[col] = (cat.codes, cat.categories)
+
+        # Samme NaN-erstatning som de opprinnelige pandas-filtrene
+        self.pris = np.nan_to_num(_tall(df, 'Pris'), nan=0)
+        self.km = np.nan_to_num(_tall(df, 'Km'), nan=10**9)
+        self.aar = np.nan_to_num(_tall(df, 'Årsmodell'), nan=0)
+        self.timer = _tall(df, 'timer_til_salg')
+
+    def maske(self, filters: dict) -> np.ndarray:
+        maske = np.ones(self.n, dtype=bool)
+
+        for navn, col in KATEGORI_FILTRE.items():
+            verdi = filters.get(navn)
+            if not verdi:
+                continue
+            if col not in self.kategorier:
+                maske[:] = False
+                continue
+            codes, kategorier = self.kategorier[col]
+            pos = kategorier.get_indexer([verdi])[0]
+            if pos < 0:
+                maske[:] = False
+            else:
+                maske &= codes == pos
+
+        if filters.get('pris_min'):
+            maske &= self.pris >= int(filters['pris_min'])
+        if filters.get('pris_max'):
+            maske &= self.pris <= int(filters['pris_max'])
+        if filters.get('km_max'):
+            maske &= self.km <= int(filters['km_max'])
+        if filters.get('year_min'):
+            maske &= self.aar >= int(filters['year_min'])
+
+        # I HTML-en heter det max_dager, men backend brukte max_timer før
+        max_dager = filters.get('max_timer') or filters.get('max_dager')
+        if max_dager:
+            maske &= self.timer <= int(max_dager) * 24
+
+        return maske
+
+    def sok(self, filters: dict, antall: int = 500) -> tuple[pd.DataFrame, dict]:
+        """
+        De `antall` raskeste salgene som matcher filtrene, og KPI-er over
+        alle treff (tom DataFrame og {} hvis ingen).
+        """
+        rader = np.flatnonzero(self.maske(filters))
+        if len(rader) == 0:
+            return self.df.iloc[:0], {}
+
+        timer = self.timer[rader]
+        kpis = {
+            'min_timer': int(round(float(timer.min()))),
+            'median_timer': float(np.median(timer)),
+            'avg_timer': float(timer.mean()),
+        }
+        return self.df.iloc[rader[:antall]], kpis
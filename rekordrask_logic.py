@@ -1,11 +1,29 @@
 # rekordrask_logic.py
 import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone, date
 from functools import lru_cache
 
-import boto3
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+
+from aws_clients import get_s3_client
+from config import (
+    CSV_TILSTAND_CACHE_MAX_MB,
+    HISTORY_FETCH_WORKERS,
+    REKORDRASK_TILSTAND,
+    RESULT_CACHE_MAX_MB,
+    RESULT_CACHE_TTL_SECONDS,
+)
+from helpers import er_slettet, fil_resolver
+from minnecache import MinneCache
+from parquet_sidecar import dataframe_til_parquet, les_med_sidecar, put_hvis_uendret
+from parset_cache import parset_cache
 
 BUCKET_NAME = "prisanalyse-data"
 PREFIX_DAGLIG = "raw/bil-daglig/"
@@ -13,6 +31,10 @@ PREFIX_TIME = "raw/bil-time/"
 FINN_KODE_KOLONNE_NAVN = "FinnKode"
 FINN_BASE_URL = "https://www.finn.no/mobility/item/"
 
+# Ferdige datasett per startdato, gyldige så lenge nyeste daglig-/timefil er den samme
+_datasett_cache = MinneCache("bygg_datasets", RESULT_CACHE_MAX_MB * 1e6, RESULT_CACHE_TTL_SECONDS)
+os.register_at_fork(after_in_child=_datasett_cache._etter_fork)
+
 
 # -------------------------------------------------
 # Normalisering / kolonnemapping
@@ -38,93 +60,154 @@ def _normkey(s: str) -> str:
 
 def normalize_finnkode_series(s: pd.Series) -> pd.Series:
     s = s.astype(str).str.strip()
+    # Vanligvis bare sifre (FinnKode lest som tekst); da trengs ingen regex
+    if s.str.isdecimal().all():
+        return s.str.lstrip("0")
     s = s.str.extract(r"(\d+)", expand=False)
     s = s.fillna("").str.lstrip("0")
     return s
 
 
-def _find_col(df: pd.DataFrame, candidates: list[str]) -> str | None:
-    colmap_norm = {_normkey(c): c for c in df.columns}
+@lru_cache(maxsize=256)
+def _normalisert_kolonnemap(kolonner: tuple) -> dict:
+    return {_normkey(c): c for c in kolonner}
+
+
+@lru_cache(maxsize=1024)
+def _find_col(kolonner: tuple, candidates: tuple) -> str | None:
+    colmap_norm = _normalisert_kolonnemap(kolonner)
     for cand in candidates:
         real = colmap_norm.get(_normkey(cand))
-        if real in df.columns:
+        if real in kolonner:
             return real
     return None
 
 
-def _ensure_standard_cols(df: pd.DataFrame) -> pd.DataFrame:
+FINNKODE_KANDIDATER = (
+    "finnkode",
+    "finn_kode",
+    "finnid",
+    "finnannonseid",
+    "finnannonse",
+    "finn",
+    "annonseid",
+    "annonse_id",
+    "finnkodeid",
+)
+
+# Kolonnene _ensure_standard_cols gir (de som finnes); alt annet i filene leses ikke
+STANDARD_KOLONNER = (
+    FINN_KODE_KOLONNE_NAVN,
+    "Årsmodell",
+    "Km",
+    "Pris",
+    "Merke",
+    "Modell",
+    "Drivstoff",
+    "Tittel",
+    "Info",
+    "Forhandler type",
+)
+TALL_KOLONNER = ("Årsmodell", "Km")
+KATEGORI_KOLONNER = ("Merke", "Drivstoff")
+
+
+@lru_cache(maxsize=256)
+def _kolonneplan(kolonner: tuple) -> tuple:
+    """
+    Hvordan en fil med overskriftene `kolonner` gjøres om til standard-
+    kolonnene: en sekvens av ("omdop", fra, til), ("kopi", fra, til),
+    ("tom", til) og ("fyll", til, fra). Regnes ut én gang per overskrift-
+    signatur, ikke per fil.
+    """
+    cols = list(kolonner)
+    steg = []
+
+    def finn(kandidater):
+        return _find_col(tuple(cols), tuple(kandidater))
+
+    def omdop(src, til):
+        if src and src != til:
+            steg.append(("omdop", src, til))
+            cols[cols.index(src)] = til
+
+    def tom(til):
+        if til not in cols:
+            steg.append(("tom", til))
+            cols.append(til)
+
+    def kopi(kandidater, til):
+        if til not in cols:
+            src = finn(kandidater)
+            if src:
+                steg.append(("kopi", src, til))
+                cols.append(til)
+            else:
+                tom(til)
+
     # FinnKode
-    fk_src = _find_col(
-        df,
-        [
-            "finnkode",
-            "finn_kode",
-            "finnid",
-            "finnannonseid",
-            "finnannonse",
-            "finn",
-            "annonseid",
-            "annonse_id",
-            "finnkodeid",
-        ],
-    )
-    if fk_src and fk_src != FINN_KODE_KOLONNE_NAVN:
-        df.rename(columns={fk_src: FINN_KODE_KOLONNE_NAVN}, inplace=True)
+    omdop(finn(FINNKODE_KANDIDATER), FINN_KODE_KOLONNE_NAVN)
 
     # Årsmodell
-    ym_src = _find_col(
-        df,
-        ["årsmodell", "aarsmodell", "arsmodell", "årstall", "arstall", "modellaar", "modellår"],
-    )
-    if ym_src and ym_src != "Årsmodell":
-        df.rename(columns={ym_src: "Årsmodell"}, inplace=True)
-    if "Årsmodell" not in df.columns:
-        df["Årsmodell"] = pd.NA
+    omdop(finn(["årsmodell", "aarsmodell", "arsmodell", "årstall", "arstall", "modellaar", "modellår"]), "Årsmodell")
+    tom("Årsmodell")
 
     # Km
-    km_src = _find_col(
-        df,
-        ["kjørelengde", "kjorelengde", "kjoerelengde", "km", "kilometer", "odo", "odometer"],
-    )
-    if km_src and km_src != "Km":
-        df.rename(columns={km_src: "Km"}, inplace=True)
-    if "Km" not in df.columns:
-        df["Km"] = pd.NA
+    omdop(finn(["kjørelengde", "kjorelengde", "kjoerelengde", "km", "kilometer", "odo", "odometer"]), "Km")
+    tom("Km")
 
     # Pris
-    if "Pris" not in df.columns:
-        price_src = _find_col(df, ["pris", "price", "belop", "beløp"])
-        if price_src:
-            df.rename(columns={price_src: "Pris"}, inplace=True)
-        else:
-            df["Pris"] = pd.NA
+    if "Pris" not in cols:
+        omdop(finn(["pris", "price", "belop", "beløp"]), "Pris")
+        tom("Pris")
 
     # Merke / Modell / Drivstoff
-    if "Merke" not in df.columns:
-        m_src = _find_col(df, ["merke", "brand", "make"])
-        df["Merke"] = df[m_src] if m_src else pd.NA
-    if "Modell" not in df.columns:
-        mo_src = _find_col(df, ["modell", "model"])
-        df["Modell"] = df[mo_src] if mo_src else pd.NA
-    if "Drivstoff" not in df.columns:
-        d_src = _find_col(df, ["drivstoff", "fuel"])
-        df["Drivstoff"] = df[d_src] if d_src else pd.NA
+    kopi(["merke", "brand", "make"], "Merke")
+    kopi(["modell", "model"], "Modell")
+    kopi(["drivstoff", "fuel"], "Drivstoff")
 
     # Tittel / Info
-    if "Tittel" not in df.columns:
-        t_src = _find_col(df, ["tittel", "title", "annonsetittel", "info"])
-        df["Tittel"] = df[t_src] if t_src else pd.NA
+    if "Tittel" not in cols:
+        kopi(["tittel", "title", "annonsetittel", "info"], "Tittel")
     else:
-        info_src = _find_col(df, ["info"])
+        info_src = finn(["info"])
         if info_src:
-            df["Tittel"] = df["Tittel"].fillna(df[info_src])
+            steg.append(("fyll", "Tittel", info_src))
 
     # Forhandler type
-    ftype = _find_col(df, ["Forhandler type", "Forhandlertype", "forhandler_type"])
-    if ftype and ftype != "Forhandler type":
-        df.rename(columns={ftype: "Forhandler type"}, inplace=True)
-    if "Forhandler type" not in df.columns:
-        df["Forhandler type"] = pd.NA
+    omdop(finn(["Forhandler type", "Forhandlertype", "forhandler_type"]), "Forhandler type")
+    tom("Forhandler type")
+
+    # Kildekolonnene planen bruker (alt annet kan hoppes over ved parsing)
+    kilder = {c for c in kolonner if c in {k for st in steg for k in st[1:]} or c in STANDARD_KOLONNER}
+    return tuple(steg), tuple(c for c in kolonner if c in kilder)
+
+
+def _ensure_standard_cols(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normaliserer en bil-frame til STANDARD_KOLONNER, og bare dem: andre
+    kolonner i filen (også ukjente) fjernes. Ingen kallere bruker mer enn
+    standardkolonnene, og les_bil_csv parser ikke resten i det hele tatt.
+    Trengs en ny kolonne videre, legges den til i STANDARD_KOLONNER.
+    """
+    steg, _ = _kolonneplan(tuple(df.columns))
+    for st in steg:
+        if st[0] == "omdop":
+            df.rename(columns={st[1]: st[2]}, inplace=True)
+        elif st[0] == "kopi":
+            df[st[2]] = df[st[1]]
+        elif st[0] == "tom":
+            df[st[1]] = pd.NA
+        elif st[0] == "fyll":
+            df[st[1]] = df[st[1]].fillna(df[st[2]])
+
+    df.drop(columns=[c for c in df.columns if c not in STANDARD_KOLONNER], inplace=True)
+
+    for col in TALL_KOLONNER:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    for col in KATEGORI_KOLONNER:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
 
     # Normaliser FinnKode
     if FINN_KODE_KOLONNE_NAVN in df.columns:
@@ -133,25 +216,92 @@ def _ensure_standard_cols(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def les_bil_csv(raw: bytes) -> pd.DataFrame:
+    """
+    Parser en bil-CSV (UTF-16, ';'-separert) rett til standardkolonnene;
+    andre kolonner i filen blir ikke med (se _ensure_standard_cols).
+    Overskriften leses først; kolonnemappingen for den signaturen er cachet,
+    og bare kolonnene mappingen bruker parses, med FinnKode som tekst og
+    Merke/Drivstoff som kategorier. Km/Årsmodell blir tall i
+    _ensure_standard_cols.
+    """
+    kolonner = tuple(pd.read_csv(io.BytesIO(raw), encoding="utf-16", sep=";", nrows=0).columns)
+    steg, kilder = _kolonneplan(kolonner)
+
+    dtype = {}
+    for st in steg:
+        if st[0] == "omdop" and st[2] == FINN_KODE_KOLONNE_NAVN:
+            dtype[st[1]] = str
+        if st[0] in ("omdop", "kopi") and st[2] in KATEGORI_KOLONNER:
+            dtype[st[1]] = "category"
+    for col in kilder:
+        if col == FINN_KODE_KOLONNE_NAVN:
+            dtype[col] = str
+        elif col in KATEGORI_KOLONNER:
+            dtype[col] = "category"
+
+    df = pd.read_csv(io.BytesIO(raw), encoding="utf-16", sep=";", usecols=list(kilder), dtype=dtype)
+    return _ensure_standard_cols(df)
+
+
 # -------------------------------------------------
 # S3-lesing
 # -------------------------------------------------
 
-def _read_csv_from_s3(key: str) -> pd.DataFrame:
-    s3 = boto3.client("s3")
-    obj = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-    df = pd.read_csv(io.BytesIO(obj["Body"].read()), encoding="utf-16", sep=";")
-    df = _ensure_standard_cols(df)
-    return df
+def _read_csv_from_s3(key: str, etag: str | None = None) -> pd.DataFrame:
+    def last() -> pd.DataFrame:
+        s3 = get_s3_client()
+        # Går via Parquet-sidecar (lages første gang filen leses)
+        try:
+            df = les_med_sidecar(s3, BUCKET_NAME, key, les_bil_csv, etag=etag)
+        except Exception as e:
+            if er_slettet(e):
+                # Slettet etter listingen: ut av manifestet nå, ikke ved neste fulle listing
+                fil_resolver.fjern(s3, BUCKET_NAME, key[: key.rindex("/") + 1], key)
+            raise
+        return _ensure_standard_cols(df)
 
+    # Ferdig normalisert per (key, ETag), i minnet og på lokal disk
+    return parset_cache.hent(key, etag, last)
 
-def hent_og_sorter_filer_fra_s3(bucket: str, prefix: str):
-    s3 = boto3.client("s3")
+
+def _les_historikkfil(fil_obj: dict) -> pd.DataFrame | None:
+    """Én timefil med tidspunkt = LastModified, eller None (logget) ved feil."""
+    try:
+        df = _read_csv_from_s3(fil_obj["Key"], fil_obj.get("ETag"))
+        df["tidspunkt"] = fil_obj["LastModified"]
+        return df
+    except Exception as e:
+        print(f"[bygg_datasets] Feil ved lesing av {fil_obj['Key']}: {e}")
+        return None
+
+
+def _les_historikk(time_filer: list[dict], start_aware: datetime) -> list[pd.DataFrame]:
+    """
+    Leser timefilene (nyeste først) frem til den første som er eldre enn
+    `start_aware`. Nedlasting og parsing skjer i opptil HISTORY_FETCH_WORKERS
+    tråder samtidig; rekkefølgen i resultatet er den samme som i `time_filer`.
+    """
+    aktuelle = []
+    for fil_obj in time_filer:
+        if fil_obj["LastModified"] < start_aware:
+            break
+        aktuelle.append(fil_obj)
+
+    if HISTORY_FETCH_WORKERS <= 1 or len(aktuelle) <= 1:
+        resultater = map(_les_historikkfil, aktuelle)
+        return [df for df in resultater if df is not None]
+
+    with ThreadPoolExecutor(max_workers=HISTORY_FETCH_WORKERS) as pool:
+        return [df for df in pool.map(_les_historikkfil, aktuelle) if df is not None]
+
+
+def hent_og_sorter_filer_fra_s3(bucket: str, prefix: str, fra: datetime | None = None):
+    """Objektene under `prefix` (nyeste først), ev. bare de endret fra og med `fra`."""
+    s3 = get_s3_client()
     try:
-        resp = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
-        if "Contents" not in resp:
-            return []
-        return sorted(resp["Contents"], key=lambda o: o["LastModified"], reverse=True)
+        # Persistert manifest, oppdatert inkrementelt (se helpers.S3FilResolver)
+        return fil_resolver.filer(s3, bucket, prefix, fra=fra)
     except Exception as e:
         print(f"Feil under henting av filer fra {prefix}: {e}")
         return []
@@ -161,11 +311,56 @@ def hent_og_sorter_filer_fra_s3(bucket: str, prefix: str):
 # Datasett-bygging
 # -------------------------------------------------
 
-@lru_cache(maxsize=16)
+def _aktive_annonser(df_daglig_ny: pd.DataFrame, df_time_ny: pd.DataFrame) -> pd.DataFrame:
+    """Aktive annonser i siste (daglig + time) – disse er IKKE solgt."""
+    aktive_ids = pd.Index([], dtype="object")
+    if FINN_KODE_KOLONNE_NAVN in df_daglig_ny.columns:
+        aktive_ids = aktive_ids.union(
+            df_daglig_ny[FINN_KODE_KOLONNE_NAVN].dropna().unique()
+        )
+    if FINN_KODE_KOLONNE_NAVN in df_time_ny.columns:
+        aktive_ids = aktive_ids.union(
+            df_time_ny[FINN_KODE_KOLONNE_NAVN].dropna().unique()
+        )
+
+    df_usolgt = pd.DataFrame(
+        {FINN_KODE_KOLONNE_NAVN: pd.Series(aktive_ids, dtype="object")}
+    )
+    df_usolgt[FINN_KODE_KOLONNE_NAVN] = normalize_finnkode_series(
+        df_usolgt[FINN_KODE_KOLONNE_NAVN]
+    )
+    return df_usolgt
+
+
 def bygg_datasets(startdato_for_analyse: date):
+    """
+    (df_usolgt, df_ny_usolgt, df_ny_solgt, daglig_key, time_key) for
+    analysevinduet fra `startdato_for_analyse`. Resultatet caches per
+    startdato og bygges på nytt når en nyere daglig- eller timefil dukker
+    opp, når det er eldre enn RESULT_CACHE_TTL_SECONDS, eller når cachen
+    må gi plass (RESULT_CACHE_MAX_MB). Resultatet deles og må ikke muteres.
+
+    Med REKORDRASK_TILSTAND er df_ny_usolgt/df_ny_solgt én rad per FinnKode
+    fra den inkrementelle tilstanden (se _bygg_datasets_fra_tilstand) i
+    stedet for alle radene fra timefilene i vinduet. bygg_visning_for_solgte
+    tar begge formene.
+    """
     daglig_filer = hent_og_sorter_filer_fra_s3(BUCKET_NAME, PREFIX_DAGLIG)
     time_filer = hent_og_sorter_filer_fra_s3(BUCKET_NAME, PREFIX_TIME)
+    versjon = tuple((f[0]["Key"], f[0].get("ETag")) if f else None for f in (daglig_filer, time_filer))
+
+    resultat = _datasett_cache.hent(startdato_for_analyse, versjon)
+    if resultat is None:
+        if REKORDRASK_TILSTAND:
+            resultat = _bygg_datasets_fra_tilstand(startdato_for_analyse, daglig_filer, time_filer)
+        if resultat is None:
+            resultat = _bygg_datasets(startdato_for_analyse, daglig_filer, time_filer)
+        _datasett_cache.lagre(startdato_for_analyse, resultat, versjon)
+        print(f"[bygg_datasets] cache: {_datasett_cache}")
+    return resultat
+
 
+def _bygg_datasets(startdato_for_analyse: date, daglig_filer: list[dict], time_filer: list[dict]):
     if not daglig_filer or not time_filer:
         print("[bygg_datasets] Fant ingen filer i S3 (daglig/time).")
         return (
@@ -179,8 +374,8 @@ def bygg_datasets(startdato_for_analyse: date):
     nyeste_daglig = daglig_filer[0]
     nyeste_time = time_filer[0]
 
-    df_daglig_ny = _read_csv_from_s3(nyeste_daglig["Key"])
-    df_time_ny = _read_csv_from_s3(nyeste_time["Key"])
+    df_daglig_ny = _read_csv_from_s3(nyeste_daglig["Key"], nyeste_daglig.get("ETag"))
+    df_time_ny = _read_csv_from_s3(nyeste_time["Key"], nyeste_time.get("ETag"))
 
     if (
         FINN_KODE_KOLONNE_NAVN not in df_daglig_ny.columns
@@ -199,40 +394,14 @@ def bygg_datasets(startdato_for_analyse: date):
             nyeste_time["Key"],
         )
 
-    # Aktive annonser i siste (daglig + time) – disse er IKKE solgt
-    aktive_ids = pd.Index([], dtype="object")
-    if FINN_KODE_KOLONNE_NAVN in df_daglig_ny.columns:
-        aktive_ids = aktive_ids.union(
-            df_daglig_ny[FINN_KODE_KOLONNE_NAVN].dropna().unique()
-        )
-    if FINN_KODE_KOLONNE_NAVN in df_time_ny.columns:
-        aktive_ids = aktive_ids.union(
-            df_time_ny[FINN_KODE_KOLONNE_NAVN].dropna().unique()
-        )
-
-    df_usolgt = pd.DataFrame(
-        {FINN_KODE_KOLONNE_NAVN: pd.Series(aktive_ids, dtype="object")}
-    )
-    df_usolgt[FINN_KODE_KOLONNE_NAVN] = normalize_finnkode_series(
-        df_usolgt[FINN_KODE_KOLONNE_NAVN]
-    )
+    df_usolgt = _aktive_annonser(df_daglig_ny, df_time_ny)
 
     # Historikk fra valgt dato (unntatt nyeste timefil)
-    frames = []
     start_aware = datetime.combine(
         startdato_for_analyse, datetime.min.time()
     ).replace(tzinfo=timezone.utc)
 
-    for fil_obj in time_filer[1:]:
-        if fil_obj["LastModified"] < start_aware:
-            break
-        try:
-            df = _read_csv_from_s3(fil_obj["Key"])
-            df["tidspunkt"] = fil_obj["LastModified"]
-            frames.append(df)
-        except Exception as e:
-            print(f"[bygg_datasets] Feil ved lesing av {fil_obj['Key']}: {e}")
-            continue
+    frames = _les_historikk(time_filer[1:], start_aware)
 
     if not frames:
         print("[bygg_datasets] Ingen historikkfiler innenfor periode – returnerer bare df_usolgt.")
@@ -324,37 +493,10 @@ def bygg_visning_for_solgte(df_ny_solgt: pd.DataFrame) -> pd.DataFrame:
         print("[bygg_visning_for_solgte] df_ny_solgt er tom.")
         return df_ny_solgt
 
-    df = df_ny_solgt.copy()
-    df["tidspunkt"] = pd.to_datetime(df["tidspunkt"], errors="coerce")
-
-    g = (
-        df.groupby(FINN_KODE_KOLONNE_NAVN)["tidspunkt"]
-        .agg(["min", "max"])
-        .reset_index()
-    )
-    g.rename(
-        columns={"min": "foerste_gang_sett", "max": "siste_gang_sett"}, inplace=True
-    )
-    g["timer_til_salg"] = (
-        (g["siste_gang_sett"] - g["foerste_gang_sett"])
-        .dt.total_seconds()
-        .div(3600)
-        .round()
-        .astype("Int64")
-    )
-
-    siste = (
-        df.sort_values(by="tidspunkt", ascending=False)
-        .drop_duplicates(subset=FINN_KODE_KOLONNE_NAVN, keep="first")
-        .copy()
-    )
-
-    res = pd.merge(
-        siste,
-        g[[FINN_KODE_KOLONNE_NAVN, "foerste_gang_sett", "timer_til_salg"]],
-        on=FINN_KODE_KOLONNE_NAVN,
-        how="left",
-    )
+    if "tidspunkt" not in df_ny_solgt.columns and "foerste_sett" in df_ny_solgt.columns:
+        res = _visning_fra_tilstand(df_ny_solgt)
+    else:
+        res = _visning_fra_rader(df_ny_solgt)
 
     res["Pris_tekst"] = res.get("Pris", pd.Series(pd.NA)).astype(str)
     pris_kilde = pd.to_numeric(res.get("Pris_eff", res.get("Pris")), errors="coerce")
@@ -393,3 +535,412 @@ def bygg_visning_for_solgte(df_ny_solgt: pd.DataFrame) -> pd.DataFrame:
     print("[bygg_visning_for_solgte] rader inn =", len(df_ny_solgt), "| rader ut =", len(res))
 
     return res
+
+
+def _visning_fra_rader(df_ny_solgt: pd.DataFrame) -> pd.DataFrame:
+    """Fra timefil-radene (flere per FinnKode): siste rad per FinnKode, nyeste først."""
+    tidspunkt = pd.to_datetime(df_ny_solgt["tidspunkt"], errors="coerce")
+
+    # Én groupby gir første/siste gang sett og posisjonen til siste rad per
+    # FinnKode (første rad med største tidspunkt; NaT er minste heltall)
+    koder, _ = pd.factorize(df_ny_solgt[FINN_KODE_KOLONNE_NAVN])
+    g = pd.DataFrame(
+        {"tid": tidspunkt.array, "heltall": tidspunkt.array.asi8}
+    ).groupby(koder, sort=False).agg(
+        foerste_gang_sett=("tid", "min"),
+        siste_gang_sett=("tid", "max"),
+        rad=("heltall", "idxmax"),
+    )
+
+    # Nyeste først, som før (like tidspunkt i rekkefølgen de kom inn)
+    g = g.sort_values("siste_gang_sett", ascending=False, kind="stable")
+
+    res = df_ny_solgt.iloc[g["rad"].to_numpy()].reset_index(drop=True)
+    res["foerste_gang_sett"] = g["foerste_gang_sett"].array
+    res["timer_til_salg"] = (
+        (g["siste_gang_sett"] - g["foerste_gang_sett"])
+        .dt.total_seconds()
+        .div(3600)
+        .round()
+        .astype("Int64")
+        .array
+    )
+    # Rader uten FinnKode får ingen første gang sett / timer til salg, som før
+    uten_kode = g.index.to_numpy() == -1
+    if uten_kode.any():
+        res.loc[uten_kode, ["foerste_gang_sett", "timer_til_salg"]] = pd.NA
+    return res
+
+
+def _visning_fra_tilstand(df_ny_solgt: pd.DataFrame) -> pd.DataFrame:
+    """
+    Fra tilstanden (én rad per FinnKode): som for radene regnes timer til
+    salg fra første solgte rad i vinduet (foerste_gang_sett, se
+    _bygg_datasets_fra_tilstand) til siste gang annonsen ble sett. Nyeste
+    først, som for radene.
+    """
+    # Like tidspunkt i FinnKode-rekkefølge, som radene (sortert på FinnKode før groupby)
+    res = df_ny_solgt.sort_values(FINN_KODE_KOLONNE_NAVN, kind="stable")
+    res = res.sort_values("sist_sett", ascending=False, kind="stable").reset_index(drop=True)
+    res["timer_til_salg"] = (
+        (res["sist_sett"] - res["foerste_gang_sett"]).dt.total_seconds().div(3600).round().astype("Int64")
+    )
+    res["Pris_num"] = pd.to_numeric(res["Pris"], errors="coerce")
+    return res.drop(columns=["foerste_sett", "sist_sett", "pris_sett", "solgt", "solgt_tid"])
+
+
+# -------------------------------------------------
+# Inkrementell tilstand per FinnKode
+# -------------------------------------------------
+
+# Én rad per FinnKode, oppdatert én timefil om gangen (se oppdater_tilstand).
+# Brukes av bygg_datasets når REKORDRASK_TILSTAND er slått på.
+TILSTAND_KEY = "calc/bil/csv_tilstand.parquet"
+# Øk denne hvis innholdet endres, så tilstanden bygges på nytt fra alle timefiler
+TILSTAND_VERSJON = "2"
+# Attributtene fra siste observasjon av hver annonse
+TILSTAND_ATTRIBUTTER = ["Merke", "Modell", "Årsmodell", "Km", "Drivstoff", "Tittel", "Info", "Forhandler type", "Pris"]
+
+# Prosessens egen kopi, som (tilstand, grense); grense = (LastModified, nøkkel) for siste timefil i den
+_tilstand_cache = MinneCache("csv_tilstand", CSV_TILSTAND_CACHE_MAX_MB * 1e6)
+os.register_at_fork(after_in_child=_tilstand_cache._etter_fork)
+_tilstand_lock = threading.Lock()
+_tilstand_bygges = False
+# Så mange nye timefiler foldes inn i kallet; flere enn dette (og kald start) i bakgrunnen
+_TILSTAND_BOLK = max(1, HISTORY_FETCH_WORKERS) * 4
+
+
+def _tom_tilstand() -> pd.DataFrame:
+    tilstand = pd.DataFrame(
+        {
+            "foerste_sett": pd.Series(dtype="datetime64[ns, UTC]"),
+            "sist_sett": pd.Series(dtype="datetime64[ns, UTC]"),
+            "Pris_eff": pd.Series(dtype=float),
+            "pris_sett": pd.Series(dtype="datetime64[ns, UTC]"),
+            "solgt": pd.Series(dtype=bool),
+            "solgt_tid": pd.Series(dtype="datetime64[ns, UTC]"),
+            **{c: pd.Series(dtype=float if c in TALL_KOLONNER else object) for c in TILSTAND_ATTRIBUTTER},
+        }
+    )
+    tilstand.index = pd.Index([], dtype=object, name=FINN_KODE_KOLONNE_NAVN)
+    return tilstand
+
+
+def _fold_inn(tilstand: pd.DataFrame, frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Gir `tilstand` oppdatert med timefilene `frames` (eldste først, hver med
+    kolonnen tidspunkt): første/siste gang sett, siste kjente tallpris (som
+    Pris_eff, og når den ble sett), om "Solgt" noen gang er sett (og når),
+    og attributtene fra siste rad. Filene slås sammen til én frame og
+    aggregeres per FinnKode med én groupby, som så flettes mot tilstanden.
+    """
+    # Siste rad per FinnKode i hver fil, som når filene foldes én og én
+    frames = [
+        df[df[FINN_KODE_KOLONNE_NAVN].notna() & (df[FINN_KODE_KOLONNE_NAVN] != "")].drop_duplicates(
+            FINN_KODE_KOLONNE_NAVN, keep="last"
+        )
+        for df in frames
+        if FINN_KODE_KOLONNE_NAVN in df.columns and not df.empty
+    ]
+    if not frames:
+        return tilstand
+    rader = pd.concat(frames, ignore_index=True)
+    tid = pd.to_datetime(rader["tidspunkt"], utc=True).astype("datetime64[ns, UTC]")
+    koder = rader[FINN_KODE_KOLONNE_NAVN]
+
+    attributter = pd.DataFrame(index=rader.index)
+    for c in TILSTAND_ATTRIBUTTER:
+        verdier = rader[c] if c in rader.columns else pd.Series(np.nan, index=rader.index)
+        if c in TALL_KOLONNER:
+            attributter[c] = pd.to_numeric(verdier, errors="coerce").astype(float)
+        else:
+            # Tekst (også Pris, slik den står i filen); manglende verdier som None
+            attributter[c] = verdier.astype(str).astype(object).where(verdier.notna().to_numpy(), None)
+    pris_num = pd.to_numeric(attributter["Pris"], errors="coerce")
+    solgt = (
+        attributter["Pris"].astype(str).str.replace(r"\s+", "", regex=True).str.lower().str.contains("solgt", na=False)
+    )
+
+    g = pd.DataFrame(
+        {
+            "tid": tid,
+            "pris": pris_num,
+            "pris_sett": tid.where(pris_num.notna()),
+            "solgt": solgt,
+            "solgt_tid": tid.where(solgt),
+        }
+    ).groupby(koder.to_numpy(), sort=False)
+    siste = ~koder.duplicated(keep="last").to_numpy()
+    bolk = attributter[siste].set_index(pd.Index(koder[siste].to_numpy(), dtype=object, name=FINN_KODE_KOLONNE_NAVN))
+    bolk.insert(0, "foerste_sett", g["tid"].min())
+    bolk.insert(1, "sist_sett", g["tid"].max())
+    bolk.insert(2, "Pris_eff", g["pris"].last().astype(float))
+    bolk.insert(3, "pris_sett", g["pris_sett"].max())
+    bolk.insert(4, "solgt", g["solgt"].any())
+    bolk.insert(5, "solgt_tid", g["solgt_tid"].min())
+
+    # Mot tilstanden: første gang sett, siste tallpris og første "Solgt" beholdes derfra
+    forrige = tilstand.reindex(bolk.index)
+    var_solgt = forrige["solgt"].fillna(False).astype(bool)
+    bolk["foerste_sett"] = forrige["foerste_sett"].combine_first(bolk["foerste_sett"])
+    bolk["Pris_eff"] = bolk["Pris_eff"].combine_first(forrige["Pris_eff"])
+    bolk["pris_sett"] = bolk["pris_sett"].combine_first(forrige["pris_sett"])
+    bolk["solgt_tid"] = forrige["solgt_tid"].where(var_solgt, bolk["solgt_tid"])
+    bolk["solgt"] = var_solgt | bolk["solgt"]
+
+    uberort = tilstand[~tilstand.index.isin(bolk.index)]
+    return pd.concat([uberort, bolk[tilstand.columns]]) if len(uberort) else bolk[tilstand.columns]
+
+
+def _les_tilstand(s3) -> tuple[pd.DataFrame | None, dict, str | None]:
+    """Tilstanden (None hvis den mangler eller har gammel versjon), metadata og objektets ETag."""
+    try:
+        obj = s3.get_object(Bucket=BUCKET_NAME, Key=TILSTAND_KEY)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None, {}, None
+        raise
+
+    etag = obj.get("ETag")
+    data = obj["Body"].read()
+    table = pq.read_table(pa.BufferReader(data))
+    del data
+    meta = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+    if meta.get("tilstand_versjon") != TILSTAND_VERSJON:
+        return None, {}, etag
+    tilstand = table.to_pandas().set_index(FINN_KODE_KOLONNE_NAVN)
+    del table
+    # Samme tidstype som _tom_tilstand og _fold_inn (Parquet gir en annen UTC-sone)
+    tidskolonner = ["foerste_sett", "sist_sett", "pris_sett", "solgt_tid"]
+    tilstand = tilstand.astype(dict.fromkeys(tidskolonner, "datetime64[ns, UTC]"))
+    for col in TILSTAND_ATTRIBUTTER:
+        if col not in TALL_KOLONNER:
+            tilstand[col] = tilstand[col].astype(object).where(tilstand[col].notna(), None)
+    return tilstand, meta, etag
+
+
+def _skriv_tilstand(s3, tilstand: pd.DataFrame, grense: tuple, forrige_etag: str | None):
+    """Skriver bare hvis tilstanden i S3 fortsatt er den som ble lest (`forrige_etag`)."""
+    try:
+        skrevet = put_hvis_uendret(
+            s3,
+            BUCKET_NAME,
+            TILSTAND_KEY,
+            dataframe_til_parquet(
+                tilstand.reset_index(),
+                metadata={
+                    "tilstand_versjon": TILSTAND_VERSJON,
+                    "vannmerke": grense[0].isoformat(),
+                    "siste_key": grense[1],
+                },
+            ),
+            forrige_etag,
+            ContentType="application/vnd.apache.parquet",
+        )
+        if not skrevet:
+            print(f"[csv_tilstand] {TILSTAND_KEY} ble oppdatert av en annen prosess – skriver ikke")
+    except Exception as e:
+        print(f"[csv_tilstand] Kunne ikke skrive {TILSTAND_KEY}: {e}")
+
+
+def _nyere_enn(time_filer: list[dict], grense: tuple | None) -> list[dict]:
+    """
+    Timefilene (nyeste først inn) etter `grense` (LastModified, nøkkel),
+    eldste først. None = alle. Nyeste timefil er "nå" og foldes ikke inn,
+    på samme måte som _bygg_datasets leser historikken uten den.
+    """
+    return sorted(
+        (f for f in time_filer[1:] if grense is None or (pd.Timestamp(f["LastModified"]), f["Key"]) > grense),
+        key=lambda f: (f["LastModified"], f["Key"]),
+    )
+
+
+def _fold_nye(tilstand: pd.DataFrame, nye: list[dict]) -> tuple[pd.DataFrame, tuple]:
+    """
+    Folder timefilene `nye` (eldste først) inn i `tilstand` (som ikke
+    endres), og gir resultatet sammen med den nye grensen. Filene hentes og
+    parses i bolker i parallell, så ikke hele historikken ligger i minnet
+    samtidig; hver bolk foldes inn med én groupby.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, HISTORY_FETCH_WORKERS)) as pool:
+        for i in range(0, len(nye), _TILSTAND_BOLK):
+            frames = [df for df in pool.map(_les_historikkfil, nye[i:i + _TILSTAND_BOLK]) if df is not None]
+            tilstand = _fold_inn(tilstand, frames)
+
+    print(f"[csv_tilstand] {len(nye)} timefiler foldet inn ({len(tilstand):,} FinnKoder)")
+    return tilstand, (pd.Timestamp(nye[-1]["LastModified"]), nye[-1]["Key"])
+
+
+def oppdater_tilstand() -> int:
+    """
+    Bringer tilstanden i S3 à jour med alle timefilene og skriver den
+    tilbake. Dette er den eneste som skriver tilstanden, og den kjøres av
+    jobben som laster opp timefilene:
+
+        python rekordrask_logic.py
+
+    Skrivingen er betinget på ETag-en som ble lest, så to samtidige
+    kjøringer ikke skriver over hverandre. Gir antall nye timefiler.
+    """
+    s3 = get_s3_client()
+    tilstand, meta, etag = _les_tilstand(s3)
+    grense = (pd.Timestamp(meta["vannmerke"]), meta["siste_key"]) if tilstand is not None else None
+
+    nye = _nyere_enn(hent_og_sorter_filer_fra_s3(BUCKET_NAME, PREFIX_TIME), grense)
+    if not nye:
+        return 0
+    tilstand, grense = _fold_nye(_tom_tilstand() if tilstand is None else tilstand, nye)
+    _skriv_tilstand(s3, tilstand.sort_index(), grense, etag)
+    return len(nye)
+
+
+def _bytt_inn_tilstand(fra_grense: tuple | None, resultat: tuple):
+    """
+    Lagrer `resultat` (tilstand, grense) hvis den lagrede tilstanden fortsatt
+    er den det ble foldet fra (eller er borte); har en annen tråd kommet
+    først, beholdes den som har kommet lengst. Kalles med _tilstand_lock.
+    """
+    lagret = _tilstand_cache.hent("tilstand")
+    if (
+        lagret is None
+        or lagret[1] == fra_grense
+        or (resultat[1] is not None and (lagret[1] is None or lagret[1] < resultat[1]))
+    ):
+        _tilstand_cache.lagre("tilstand", resultat)
+
+
+def _bygg_tilstand_i_bakgrunnen(lagret: tuple | None, time_filer: list[dict]):
+    global _tilstand_bygges
+    try:
+        fra_grense = lagret[1] if lagret is not None else None
+        if lagret is None:
+            # Kald start: det oppdater_tilstand sist skrev, ellers hele historikken
+            tilstand, meta, _ = _les_tilstand(get_s3_client())
+            if tilstand is None:
+                lagret = (_tom_tilstand(), None)
+            else:
+                lagret = (tilstand, (pd.Timestamp(meta["vannmerke"]), meta["siste_key"]))
+        nye = _nyere_enn(time_filer, lagret[1])
+        resultat = _fold_nye(lagret[0], nye) if nye else lagret
+        with _tilstand_lock:
+            _bytt_inn_tilstand(fra_grense, resultat)
+    except Exception as e:
+        print(f"[csv_tilstand] Bygging i bakgrunnen feilet: {e}")
+    finally:
+        with _tilstand_lock:
+            _tilstand_bygges = False
+
+
+def hent_tilstand(time_filer: list[dict]) -> pd.DataFrame | None:
+    """
+    Tilstanden per FinnKode à jour med `time_filer` (delt, må ikke muteres),
+    eller None hvis den ikke er klar ennå.
+
+    Hver prosess holder sin egen kopi i minnet og folder nye timefiler inn i
+    den; S3 leses bare ved kald start, og det skrives aldri herfra (se
+    oppdater_tilstand). Er det bare noen få nye filer, foldes de inn i
+    kallet, men utenfor låsen, så andre forespørsler ikke venter på
+    S3-lesingen; resultatet byttes inn hvis ingen andre har kommet først.
+    Ellers (kald start, eller langt bak) skjer det i en bakgrunnstråd, og
+    kalleren får None og bruker radene i mellomtiden.
+    """
+    global _tilstand_bygges
+    with _tilstand_lock:
+        lagret = _tilstand_cache.hent("tilstand")
+        nye = _nyere_enn(time_filer, lagret[1]) if lagret is not None else None
+        if lagret is not None and not nye:
+            return lagret[0]
+        i_kallet = lagret is not None and len(nye) <= _TILSTAND_BOLK and not _tilstand_bygges
+        if not i_kallet and not _tilstand_bygges:
+            _tilstand_bygges = True
+            threading.Thread(
+                target=_bygg_tilstand_i_bakgrunnen, args=(lagret, time_filer), name="csv-tilstand", daemon=True
+            ).start()
+    if not i_kallet:
+        return None
+
+    resultat = _fold_nye(lagret[0], nye)
+    with _tilstand_lock:
+        _bytt_inn_tilstand(lagret[1], resultat)
+    return resultat[0]
+
+
+def _tilstand_etter_fork():
+    # Bakgrunnstråden overlever ikke fork; neste kall starter den på nytt
+    global _tilstand_lock, _tilstand_bygges
+    _tilstand_lock = threading.Lock()
+    _tilstand_bygges = False
+
+
+os.register_at_fork(after_in_child=_tilstand_etter_fork)
+
+
+def _bygg_datasets_fra_tilstand(startdato_for_analyse: date, daglig_filer: list[dict], time_filer: list[dict]):
+    """
+    Som _bygg_datasets, men df_ny_usolgt/df_ny_solgt er oppslag i tilstanden:
+    én rad per FinnKode sett i vinduet (siste gang sett fra og med
+    startdato), med foerste_sett/sist_sett/solgt_tid over hele historikken.
+    Pris_eff er bare tallpriser sett i vinduet, og df_ny_solgt har i
+    tillegg foerste_gang_sett (første solgte rad i vinduet), slik at
+    visningen blir den samme som fra radene (se bench_rekordrask_tilstand).
+    None hvis tilstanden ikke er klar ennå.
+
+    Solgt: "Solgt" er sett i prisen, eller annonsen er borte fra nyeste
+    daglig-/timefil og var privat ved siste observasjon.
+    """
+    if not daglig_filer or not time_filer:
+        return None
+    tilstand = hent_tilstand(time_filer)
+    if tilstand is None:
+        print("[bygg_datasets] Tilstanden bygges fortsatt – bruker timefilene direkte.")
+        return None
+
+    nyeste_daglig = daglig_filer[0]
+    nyeste_time = time_filer[0]
+    df_usolgt = _aktive_annonser(
+        _read_csv_from_s3(nyeste_daglig["Key"], nyeste_daglig.get("ETag")),
+        _read_csv_from_s3(nyeste_time["Key"], nyeste_time.get("ETag")),
+    )
+
+    start_aware = pd.Timestamp(datetime.combine(startdato_for_analyse, datetime.min.time()), tz="UTC")
+    # Timefilene radene ville lest (unntatt nyeste); ingen = ingen historikk, som der
+    i_perioden = [f["LastModified"] for f in time_filer[1:] if f["LastModified"] >= start_aware]
+    if not i_perioden:
+        print("[bygg_datasets] (tilstand) Ingen historikkfiler innenfor periode – returnerer bare df_usolgt.")
+        return df_usolgt, pd.DataFrame(), pd.DataFrame(), nyeste_daglig["Key"], nyeste_time["Key"]
+    i_vindu = tilstand[tilstand["sist_sett"] >= start_aware]
+    # Pris_eff er som for radene bare tallpriser sett i vinduet
+    i_vindu = i_vindu.assign(Pris_eff=i_vindu["Pris_eff"].where(i_vindu["pris_sett"] >= start_aware))
+
+    forsvunnet = ~i_vindu.index.isin(df_usolgt[FINN_KODE_KOLONNE_NAVN])
+    er_privat = i_vindu["Forhandler type"].astype(str).str.strip().str.lower().eq("privat").to_numpy()
+    forsvunnet_privat = forsvunnet & er_privat
+    sold_mask = i_vindu["solgt"].to_numpy() | forsvunnet_privat
+    if not sold_mask.any():
+        # Samme fallback som radene: bare eksplisitt "Solgt"
+        forsvunnet_privat = np.zeros(len(i_vindu), dtype=bool)
+        sold_mask = i_vindu["solgt"].to_numpy()
+
+    # Første solgte rad i vinduet, slik radene gir den: for forsvunne private
+    # annonser første gang sett i vinduet, ellers første gang "Solgt" ble sett der
+    foerste_i_vindu = i_vindu["foerste_sett"].where(
+        i_vindu["foerste_sett"] >= start_aware, pd.Timestamp(min(i_perioden)).tz_convert("UTC")
+    )
+    solgt_i_vindu = i_vindu["solgt_tid"].where(i_vindu["solgt_tid"] >= start_aware, foerste_i_vindu)
+    foerste_solgt = foerste_i_vindu.where(forsvunnet_privat, solgt_i_vindu)
+
+    df_ny_solgt = i_vindu[sold_mask].assign(foerste_gang_sett=foerste_solgt[sold_mask]).reset_index()
+    df_ny_usolgt = i_vindu[~sold_mask].reset_index()
+
+    print(
+        "[bygg_datasets] (tilstand) startdato =", startdato_for_analyse,
+        "| i vindu =", len(i_vindu),
+        "| df_usolgt (aktive) =", len(df_usolgt),
+        "| df_ny_solgt =", len(df_ny_solgt),
+        "| df_ny_usolgt =", len(df_ny_usolgt),
+    )
+    return df_usolgt, df_ny_usolgt, df_ny_solgt, nyeste_daglig["Key"], nyeste_time["Key"]
+
+
+if __name__ == "__main__":
+    print(f"[csv_tilstand] {oppdater_tilstand()} nye timefiler foldet inn i {TILSTAND_KEY}")
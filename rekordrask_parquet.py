@@ -1,42 +1,97 @@
 # rekordrask_parquet.py
 import json
+import os
+import threading
 from datetime import datetime, date
 from typing import Tuple
 
-import boto3
+import numpy as np
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
 
-from config import AWS_KEY, AWS_SECRET, AWS_REGION, S3_BUCKET_NAME
+from aws_clients import get_s3_client
+from config import S3_BUCKET_NAME, SNAPSHOT_PARTISJONERT
+from datacache import datasett_cache
+from parquet_sidecar import dataframe_til_parquet, put_hvis_uendret
+from rekordrask_filter import RekordraskIndeks
+from snapshot_parquet import SnapshotFil
+from snapshot_partisjoner import VERSJON_KEY, SnapshotPartisjoner
 
 FINN_BASE_URL = "https://www.finn.no/mobility/item/"
 PARQUET_KEY = "calc/bil/bil_time.parquet"
 
-
-def _get_s3_client():
-    return boto3.client(
-        "s3",
-        aws_access_key_id=AWS_KEY,
-        aws_secret_access_key=AWS_SECRET,
-        region_name=AWS_REGION,
+# Materialisert tabell med første observasjon / salg per FinnKode (se oppdater_salgshendelser)
+HENDELSER_KEY = "calc/bil/salgshendelser.parquet"
+# Øk denne hvis innholdet endres, så tabellen bygges på nytt fra hele historikken
+HENDELSER_VERSJON = "2"
+
+# Kolonnenavn vi godtar for hvert felt (både store/små bokstaver og norsk/engelsk variant)
+KOLONNE_KANDIDATER = {
+    "Merke": ["Merke", "produsent", "Produsent"],
+    "Modell": ["Modell", "modell"],
+    "Årstall": ["Årstall", "årstall", "Aarstall"],
+    "Kjørelengde": ["Kjørelengde", "kjørelengde", "Km"],
+    "Drivstoff": ["Drivstoff", "drivstoff"],
+    "Pris": ["Pris", "pris", "pris_num"],
+    "Forhandler type": ["Forhandler type", "Forhandler", "forhandler_type"],
+}
+
+# Første snapshot per FinnKode, som tekst og med kolonnevalget analyse.py bruker
+# (gruppenøkler, detaljer og salgspris der tas fra første rad)
+FOERST_KANDIDATER = {
+    "foerst_Merke": ["Merke", "produsent"],
+    "foerst_Modell": ["Modell", "modell", "Info"],
+    "foerst_Årstall": ["Årstall", "årstall"],
+    "foerst_Drivstoff": ["Drivstoff", "drivstoff"],
+    "foerst_Forhandler": ["Forhandler type", "selger"],
+    "foerst_Pris": ["Pris", "pris_num"],
+}
+
+# Alt solgt-visningen og hendelsestabellen trenger fra Parquet-filen (resten leses ikke)
+SOLGT_KOLONNER = list(
+    dict.fromkeys(
+        ["FinnKode", "finnkode"]
+        + [c for navn in KOLONNE_KANDIDATER.values() for c in navn]
+        + [c for navn in FOERST_KANDIDATER.values() for c in navn]
     )
+)
+
+# Tekstfelt med mange gjentatte verdier leses som pandas-kategorier
+KATEGORI_KOLONNER = [
+    c for felt in ("Merke", "Modell", "Drivstoff", "Forhandler type", "Pris") for c in KOLONNE_KANDIDATER[felt]
+]
+
+
+def _snapshot_key() -> str:
+    """Nøkkelen hvis ETag er versjonen av snapshot-historikken."""
+    return VERSJON_KEY if SNAPSHOT_PARTISJONERT else PARQUET_KEY
+
 
+def _snapshot_kilde(s3_client, bucket: str, etag=None) -> SnapshotFil | SnapshotPartisjoner:
+    """Datopartisjonene eller enkeltfilen, avhengig av SNAPSHOT_PARTISJONERT."""
+    if SNAPSHOT_PARTISJONERT:
+        return SnapshotPartisjoner(s3_client, bucket, etag)
+    return SnapshotFil(s3_client, bucket, PARQUET_KEY, etag)
 
-def _les_parquet_fra_s3() -> pd.DataFrame:
+
+def _les_parquet_fra_s3(
+    fil: SnapshotFil | SnapshotPartisjoner | None = None, kolonner=None, fra=None, til=None
+) -> pd.DataFrame:
     """
     Leser Parquet-filen med time-snapshots av Finn-annonser fra S3.
     Forventer at den minst inneholder:
       - FinnKode (eller finnkode)
       - Merke / Modell / Årstall / Kjørelengde / Drivstoff / Pris / Forhandler type
       - enten 'snapshot_time' (ISO) eller 'dato' (YYYY-MM-DD)
-    """
-    s3 = _get_s3_client()
-    obj = s3.get_object(Bucket=S3_BUCKET_NAME, Key=PARQUET_KEY)
-    data = obj["Body"].read()
 
-    table = pq.read_table(pa.BufferReader(data))
-    df = table.to_pandas()
+    Bare `kolonner` (None = alle) og radgrupper (og partisjoner) med
+    snapshots i vinduet [fra, til] leses, se snapshot_parquet og
+    snapshot_partisjoner.
+    """
+    fil = fil or _snapshot_kilde(get_s3_client(), S3_BUCKET_NAME)
+    df, _ = fil.les(kolonner, fra, kategorier=KATEGORI_KOLONNER, til=til)
 
     # Normaliser kolonnenavn litt (f.eks. fra CSV -> Parquet)
     df.columns = [str(c) for c in df.columns]
@@ -116,6 +171,387 @@ def _extract_numeric(val):
         return None
 
 
+def _per_unik_verdi(fn, verdier: pd.Series, mangler) -> pd.Series:
+    """Kjører `fn` bare på kategoriene for kategoriske kolonner, og slår opp per rad."""
+    if not isinstance(verdier.dtype, pd.CategoricalDtype):
+        return fn(verdier)
+    kategorier = verdier.cat.categories
+    koder = verdier.cat.codes.to_numpy()
+    if len(kategorier) == 0:
+        return pd.Series(mangler, index=verdier.index)
+    per_kategori = fn(pd.Series(kategorier)).to_numpy()
+    return pd.Series(np.where(koder >= 0, per_kategori[koder], mangler), index=verdier.index)
+
+
+def _fra_kategori(verdier: pd.Series) -> pd.Series:
+    """Kategorisk tekstkolonne -> samme verdier/dtype som en vanlig tekstkolonne fra Parquet."""
+    if not isinstance(verdier.dtype, pd.CategoricalDtype):
+        return verdier
+    tekst = pa.Array.from_pandas(verdier).dictionary_decode().to_pandas()
+    return tekst.set_axis(verdier.index)
+
+
+def _er_solgt(pris: pd.Series) -> pd.Series:
+    """Vektorisert _is_sold for en hel kolonne: 'solgt' i teksten, eller tallet 0."""
+    return _per_unik_verdi(_er_solgt_verdier, pris, False)
+
+
+def _er_solgt_verdier(pris: pd.Series) -> pd.Series:
+    tekst = pris.astype(str).str.strip().str.lower()
+    solgt = tekst.str.contains("solgt", regex=False).fillna(False).astype(bool)
+    null = tekst.str.replace(" ", "", regex=False).str.fullmatch(r"[+-]?0+(?:_0+)*").fillna(False).astype(bool)
+    return pris.notna() & (solgt | null)
+
+
+def _er_solgt_tekst(pris: pd.Series) -> pd.Series:
+    """Streng variant (analyse.py): bare 'solgt' i teksten teller."""
+    return _per_unik_verdi(_er_solgt_tekst_verdier, pris, False)
+
+
+def _er_solgt_tekst_verdier(pris: pd.Series) -> pd.Series:
+    tekst = pris.astype(str).str.lower()
+    return pris.notna() & tekst.str.contains("solgt", regex=False).fillna(False).astype(bool)
+
+
+def _heltall(verdier: pd.Series) -> pd.Series:
+    """Vektorisert _extract_numeric som float (NaN der verdien ikke er et heltall)."""
+    return _per_unik_verdi(_heltall_verdier, verdier, np.nan).astype("float64")
+
+
+def _heltall_verdier(verdier: pd.Series) -> pd.Series:
+    tekst = verdier.astype(str).str.strip().str.replace(" ", "", regex=False).str.replace("\xa0", "", regex=False)
+    gyldig = verdier.notna() & tekst.str.fullmatch(r"[+-]?[0-9]+").fillna(False).astype(bool)
+    return pd.to_numeric(tekst.where(gyldig), errors="coerce").astype("float64")
+
+
+def _hendelser_fra_snapshots(df: pd.DataFrame, colmap: dict) -> pd.DataFrame:
+    """
+    Én rad per FinnKode (indeks, sortert) for en samling snapshots:
+      - foerste_sett / sist_sett
+      - solgt_tid: første snapshot tolket som solgt ('solgt' eller pris 0)
+      - solgt_tekst_tid: første snapshot med 'solgt' i prisfeltet
+      - pris_foer_salg: siste tolkbare pris før salget
+      - attributtene (KOLONNE_KANDIDATER) fra salgsraden, ellers siste snapshot
+      - foerst_*: feltene i FOERST_KANDIDATER fra første snapshot, som tekst
+        (None når kolonnen ikke finnes)
+    Uten Python-løkke per FinnKode: én stabil sortering på (FinnKode,
+    snapshot_time) og groupby first/last.
+    """
+    df = df.sort_values(["FinnKode", "snapshot_time"], kind="stable")
+    tid = df.groupby("FinnKode", sort=True)["snapshot_time"]
+    hend = pd.DataFrame({"foerste_sett": tid.first(), "sist_sett": tid.last()})
+
+    pris_col = colmap["Pris"] if colmap["Pris"] in df.columns else None
+    if pris_col is not None:
+        solgt = _er_solgt(df[pris_col]).to_numpy()
+        solgt_tekst = _er_solgt_tekst(df[pris_col]).to_numpy()
+    else:
+        solgt = solgt_tekst = pd.Series(False, index=df.index).to_numpy()
+
+    salg = df[solgt].drop_duplicates("FinnKode", keep="first").set_index("FinnKode")
+    hend["solgt_tid"] = salg["snapshot_time"]
+    hend["solgt_tekst_tid"] = df[solgt_tekst].groupby("FinnKode")["snapshot_time"].first()
+
+    if pris_col is not None:
+        grense = df["FinnKode"].map(hend["solgt_tid"])
+        foer = (grense.isna() | (df["snapshot_time"] < grense)).to_numpy()
+        hend["pris_foer_salg"] = _heltall(df[pris_col])[foer].groupby(df["FinnKode"][foer]).last()
+    else:
+        hend["pris_foer_salg"] = float("nan")
+
+    rader = df.drop_duplicates("FinnKode", keep="last").set_index("FinnKode")
+    rader = pd.concat([rader.drop(salg.index), salg]).reindex(hend.index)
+    for felt, col in colmap.items():
+        hend[felt] = _fra_kategori(rader[col]) if col else None
+
+    forste = df.drop_duplicates("FinnKode", keep="first").set_index("FinnKode")
+    for felt, kandidater in FOERST_KANDIDATER.items():
+        col = next((c for c in kandidater if c in df.columns), None)
+        hend[felt] = _fra_kategori(forste[col]).astype(object).map(str) if col else None
+
+    hend.index.name = "FinnKode"
+    return hend
+
+
+def _slaa_sammen(gamle: pd.DataFrame, nye: pd.DataFrame) -> pd.DataFrame:
+    """
+    Oppdaterer hendelsestabellen med en ny batch (nye snapshots er senere
+    enn alt i `gamle`). Bare FinnKodene i batchen røres.
+    """
+    felles = nye.index.intersection(gamle.index)
+    if len(felles):
+        g = gamle.loc[felles]
+        n = nye.loc[felles].copy()
+        n["foerste_sett"] = g["foerste_sett"]
+        n[list(FOERST_KANDIDATER)] = g[list(FOERST_KANDIDATER)]
+        allerede_solgt = g["solgt_tid"].notna()
+        for col in ("solgt_tid", "solgt_tekst_tid"):
+            n[col] = g[col].where(g[col].notna(), n[col])
+        n["pris_foer_salg"] = n["pris_foer_salg"].where(n["pris_foer_salg"].notna(), g["pris_foer_salg"])
+        # Et salg som allerede er registrert beholder sin pris og sine attributter
+        faste = ["pris_foer_salg"] + list(KOLONNE_KANDIDATER)
+        n.loc[allerede_solgt, faste] = g.loc[allerede_solgt, faste]
+        nye = pd.concat([nye.drop(felles), n])
+
+    return pd.concat([gamle.drop(felles), nye]).sort_index()
+
+
+def _solgte_fra_hendelser(hend: pd.DataFrame, startdato: date) -> pd.DataFrame:
+    """Solgt-visningen (se bygg_visning_for_solgte_fra_parquet) fra hendelsestabellen."""
+    if hend.empty:
+        return pd.DataFrame()
+    salg = hend[hend["solgt_tid"].notna()]
+    if salg.empty:
+        return pd.DataFrame()
+
+    salgstid = salg["solgt_tid"]
+    forst = salg["foerste_sett"]
+
+    # Salg før ønsket startdato (på datonivå) og negative varigheter hoppes over
+    salgsdag = salgstid.dt.tz_localize(None) if salgstid.dt.tz is not None else salgstid
+    timer = (salgstid - forst).dt.total_seconds() / 3600.0
+    behold = (salgsdag >= pd.Timestamp(startdato)) & (timer >= 0)
+    if not behold.any():
+        return pd.DataFrame()
+
+    salg, timer, forst = salg[behold], timer[behold], forst[behold]
+
+    # Feltene konverteres bare for de solgte bilene, på samme måte som før
+    def _verdier(navn):
+        return salg[navn].tolist()
+
+    finnkode = salg.index.astype(str).tolist()
+    vis_df = pd.DataFrame(
+        {
+            "FinnKode": finnkode,
+            "Finn": [FINN_BASE_URL + k for k in finnkode],
+            "Merke": [v or "" for v in _verdier("Merke")],
+            "Modell": [v or "" for v in _verdier("Modell")],
+            "Årsmodell": [_extract_numeric(v) for v in _verdier("Årstall")],
+            "Km": [_extract_numeric(v) for v in _verdier("Kjørelengde")],
+            "Pris": [_extract_numeric(v) for v in _verdier("Pris")],
+            "Drivstoff": [v or "" for v in _verdier("Drivstoff")],
+            "Forhandler type": [v or "" for v in _verdier("Forhandler type")],
+            "timer_til_salg": timer.to_numpy(dtype=float),
+            "foerste_gang_sett": [t.isoformat() for t in forst],
+        }
+    )
+
+    # Sorter: raskest først
+    vis_df = vis_df.sort_values("timer_til_salg", ascending=True).reset_index(drop=True)
+    return vis_df
+
+
+def _solgte_fra_snapshots(df: pd.DataFrame, colmap: dict, startdato: date) -> pd.DataFrame:
+    """Solgt-visningen direkte fra snapshots (full historikk i minnet)."""
+    if df.empty or colmap["Pris"] is None or colmap["Pris"] not in df.columns:
+        return pd.DataFrame()
+    return _solgte_fra_hendelser(_hendelser_fra_snapshots(df, colmap), startdato)
+
+
+def _finn_kolonner(df: pd.DataFrame) -> dict:
+    """Hvilken kolonne i df som brukes for hvert felt (None hvis ingen finnes)."""
+    colmap = {
+        felt: next((n for n in navn if n in df.columns), None)
+        for felt, navn in KOLONNE_KANDIDATER.items()
+    }
+
+    required_keys = ["Merke", "Modell", "Årstall", "Kjørelengde", "Pris"]
+    for k in required_keys:
+        if colmap[k] is None:
+            print(f"ADVARSEL: Fant ikke kolonne for {k} i Parquet – bruker tomme verdier der.")
+            # vi lar det være None, så fylles det inn som "" senere
+    return colmap
+
+
+# -------------------------------------------------
+# Materialisert hendelsestabell (én rad per FinnKode)
+# -------------------------------------------------
+
+def _tom_hendelser() -> pd.DataFrame:
+    """Hendelsestabell uten rader, med alle kolonnene."""
+    tid = pd.Series(dtype="datetime64[ns]")
+    hend = pd.DataFrame(
+        {
+            "foerste_sett": tid,
+            "sist_sett": tid,
+            "solgt_tid": tid,
+            "solgt_tekst_tid": tid,
+            "pris_foer_salg": pd.Series(dtype="float64"),
+            **{felt: pd.Series(dtype=object) for felt in KOLONNE_KANDIDATER},
+            **{felt: pd.Series(dtype=object) for felt in FOERST_KANDIDATER},
+        },
+        index=pd.Index([], dtype=object, name="FinnKode"),
+    )
+    return hend
+
+
+def _les_hendelser(s3, bucket: str) -> tuple[pd.DataFrame | None, dict, str | None]:
+    """Tabellen (None hvis den mangler eller har gammel versjon), metadata og objektets ETag."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=HENDELSER_KEY)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None, {}, None
+        raise
+
+    etag = obj.get("ETag")
+    data = obj["Body"].read()
+    table = pq.read_table(pa.BufferReader(data))
+    del data
+    meta = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+    if meta.get("hendelser_versjon") != HENDELSER_VERSJON:
+        return None, {}, etag
+    df = table.to_pandas(self_destruct=True, split_blocks=True)
+    del table
+    return df.set_index("FinnKode"), meta, etag
+
+
+def _skriv_hendelser(s3, bucket: str, hend: pd.DataFrame, kilde_etag: str | None, vannmerke, forrige_etag):
+    """
+    Skriver bare hvis tabellen i S3 fortsatt er den som ble lest (`forrige_etag`),
+    så to samtidige kjøringer av oppdater_salgshendelser ikke skriver over
+    hverandre; den første vinner.
+    """
+    try:
+        skrevet = put_hvis_uendret(
+            s3,
+            bucket,
+            HENDELSER_KEY,
+            dataframe_til_parquet(
+                hend.reset_index(),
+                kilde_etag=kilde_etag,
+                metadata={"hendelser_versjon": HENDELSER_VERSJON, "vannmerke": vannmerke.isoformat()},
+            ),
+            forrige_etag,
+            ContentType="application/vnd.apache.parquet",
+        )
+        if not skrevet:
+            print(f"[salgshendelser] {HENDELSER_KEY} ble oppdatert av en annen prosess – skriver ikke")
+    except Exception as e:
+        print(f"[salgshendelser] Kunne ikke skrive {HENDELSER_KEY}: {e}")
+
+
+def _fold_inn_vindu(fil, hend: pd.DataFrame | None, vannmerke, fra=None, til=None):
+    """Folder snapshotene i [fra, til] som er senere enn `vannmerke` inn i `hend`."""
+    df = _les_parquet_fra_s3(fil, SOLGT_KOLONNER, fra, til)
+    df = _ensure_time_columns(df)
+    if vannmerke is not None:
+        df = df[df["snapshot_time"] > vannmerke]
+    if df.empty:
+        return hend, vannmerke
+
+    nye = _hendelser_fra_snapshots(df, _finn_kolonner(df))
+    hend = nye if hend is None else _slaa_sammen(hend, nye)
+    vannmerke = df["snapshot_time"].max() if vannmerke is None else max(vannmerke, df["snapshot_time"].max())
+    print(f"[salgshendelser] {len(nye):,} FinnKoder oppdatert fra {len(df):,} nye snapshots ({len(hend):,} totalt)")
+    return hend, vannmerke
+
+
+def _fold_inn_snapshots(fil: SnapshotFil | SnapshotPartisjoner, hend: pd.DataFrame | None, vannmerke):
+    """
+    Folder snapshotene i `fil` etter `vannmerke` inn i `hend` (None = bygg
+    fra hele historikken). Bare radgrupper (og partisjoner) etter
+    vannmerket leses, og bare FinnKodene i de nye radene røres. `hend`
+    endres ikke; gir (ny tabell, nytt vannmerke).
+
+    Datopartisjonene leses én dato om gangen, så også første bygging holder
+    bare én partisjon i minnet av gangen.
+    """
+    if isinstance(fil, SnapshotPartisjoner):
+        for dag in fil.datoer(vannmerke):
+            fra = vannmerke if vannmerke is not None and vannmerke.date() >= dag else dag
+            hend, vannmerke = _fold_inn_vindu(fil, hend, vannmerke, fra, dag)
+    else:
+        hend, vannmerke = _fold_inn_vindu(fil, hend, vannmerke, vannmerke)
+    return (hend if hend is not None else _tom_hendelser()), vannmerke
+
+
+def oppdater_salgshendelser(fil: SnapshotFil | SnapshotPartisjoner) -> pd.DataFrame:
+    """
+    Bringer hendelsestabellen i S3 à jour med snapshot-historikken `fil`
+    (enkeltfilen eller datopartisjonene) og skriver den tilbake. Dette er
+    den eneste som skriver tabellen, og den kjøres av jobben som legger til
+    snapshots:
+
+        python rekordrask_parquet.py
+
+    Tabellen husker ETag-en den sist ble oppdatert fra og et vannmerke
+    (seneste snapshot_time som er tatt med); bare snapshots etter
+    vannmerket leses. Finnes ingen tabell, bygges den fra hele historikken.
+    """
+    gamle, meta, tabell_etag = _les_hendelser(fil.s3, fil.bucket)
+    if gamle is not None and meta.get("kilde_etag") == fil.etag:
+        return gamle
+
+    vannmerke = pd.Timestamp(meta["vannmerke"]) if gamle is not None else None
+    hend, vannmerke = _fold_inn_snapshots(fil, gamle, vannmerke)
+    if vannmerke is not None:
+        _skriv_hendelser(fil.s3, fil.bucket, hend, fil.etag, vannmerke, tabell_etag)
+    return hend
+
+
+# Prosessens egen kopi av tabellen som (tabell, vannmerke); nye snapshots foldes inn i den
+_hendelser_i_minnet = None
+_hendelser_lock = threading.Lock()
+
+
+def _last_hendelser(s3_client, bucket: str, key: str, etag=None) -> pd.DataFrame:
+    """
+    Laster for DatasettCache (ny ETag på snapshot-historikken): nye
+    snapshots foldes inn i prosessens egen kopi. Tabellen i S3 leses bare
+    første gang, og den skrives aldri herfra (se oppdater_salgshendelser).
+    """
+    global _hendelser_i_minnet
+    fil = _snapshot_kilde(s3_client, bucket, etag)
+    with _hendelser_lock:
+        if _hendelser_i_minnet is None:
+            gamle, meta, _ = _les_hendelser(s3_client, bucket)
+            _hendelser_i_minnet = (gamle, pd.Timestamp(meta["vannmerke"]) if gamle is not None else None)
+            if gamle is not None and meta.get("kilde_etag") == fil.etag:
+                return gamle
+        _hendelser_i_minnet = _fold_inn_snapshots(fil, *_hendelser_i_minnet)
+        return _hendelser_i_minnet[0]
+
+
+def _hendelser_etter_fork():
+    global _hendelser_lock
+    _hendelser_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_hendelser_etter_fork)
+
+
+def hent_salgshendelser(bakgrunn: bool = True) -> pd.DataFrame | None:
+    """
+    Hendelsestabellen for nyeste snapshot-fil (indeks FinnKode), delt mellom
+    forespørsler. Må ikke muteres.
+
+    Med `bakgrunn=True` (webprosessene) lastes og oppdateres den i en
+    bakgrunnstråd; ved kald start returneres None til den er klar.
+    """
+    return datasett_cache.hent(get_s3_client(), S3_BUCKET_NAME, _snapshot_key(), _last_hendelser, bakgrunn=bakgrunn)
+
+
+def hent_rekordrask_indeks(startdato: date) -> RekordraskIndeks | None:
+    """
+    Filtermotoren over solgt-visningen for `startdato`, eller None mens
+    hendelsestabellen lastes første gang. Tabellen holdes i minnet per ETag
+    og oppdateres inkrementelt i bakgrunnen; visningen og indeksen bygges én
+    gang per versjon og startdato.
+    """
+    hend = hent_salgshendelser()
+    if hend is None:
+        return None
+    return datasett_cache.avledet(
+        S3_BUCKET_NAME,
+        _snapshot_key(),
+        f"solgte:{startdato.isoformat()}",
+        lambda hend: RekordraskIndeks(_solgte_fra_hendelser(hend, startdato)),
+        hend,
+    )
+
+
 def bygg_visning_for_solgte_fra_parquet(startdato: date) -> pd.DataFrame:
     """
     Leser Parquet med alle snapshots og bygger en tabell over biler som faktisk er solgt,
@@ -133,111 +569,14 @@ def bygg_visning_for_solgte_fra_parquet(startdato: date) -> pd.DataFrame:
       - "Forhandler type"
       - timer_til_salg
       - foerste_gang_sett (ISO)
-    """
-
-    df = _les_parquet_fra_s3()
-    df = _ensure_time_columns(df)
-
-    # Normaliser noen kolonnenavn vi trenger
-    # (både store/små bokstaver og norsk/engelsk variant)
-    colmap = {}
-
-    def _first_existing(names):
-        for n in names:
-            if n in df.columns:
-                return n
-        return None
 
-    colmap["Merke"] = _first_existing(["Merke", "produsent", "Produsent"])
-    colmap["Modell"] = _first_existing(["Modell", "modell"])
-    colmap["Årstall"] = _first_existing(["Årstall", "årstall", "Aarstall"])
-    colmap["Kjørelengde"] = _first_existing(["Kjørelengde", "kjørelengde", "Km"])
-    colmap["Drivstoff"] = _first_existing(["Drivstoff", "drivstoff"])
-    colmap["Pris"] = _first_existing(["Pris", "pris", "pris_num"])
-    colmap["Forhandler type"] = _first_existing(
-        ["Forhandler type", "Forhandler", "forhandler_type"]
-    )
-
-    required_keys = ["Merke", "Modell", "Årstall", "Kjørelengde", "Pris"]
-    for k in required_keys:
-        if colmap[k] is None:
-            print(f"ADVARSEL: Fant ikke kolonne for {k} i Parquet – bruker tomme verdier der.")
-            # vi lar det være None, så fylles det inn som "" senere
-
-    records = []
-
-    # Gruppér på FinnKode og beregn tid til salg
-    for finnkode, grp in df.groupby("FinnKode"):
-        g = grp.sort_values("snapshot_time").copy()
-        if g.empty:
-            continue
-
-        # Første gang vi så annonsen
-        first_row = g.iloc[0]
-        first_time = first_row["snapshot_time"]
-
-        # Finn første rad der vi tolker bilen som 'solgt'
-        pris_col = colmap["Pris"]
-        if pris_col is None or pris_col not in g.columns:
-            continue
-
-        sold_mask = g[pris_col].apply(_is_sold)
-        sold_rows = g[sold_mask]
-
-        if sold_rows.empty:
-            # Aldri observert som "Solgt" → hopp over (bilen er nok fortsatt aktiv)
-            continue
-
-        sale_row = sold_rows.iloc[0]
-        sale_time = sale_row["snapshot_time"]
-
-        # Hvis salget skjedde før ønsket startdato -> hopp over
-        if sale_time.date() < startdato:
-            continue
-
-        # Timer til salg
-        timer_til_salg = (sale_time - first_time).total_seconds() / 3600.0
-        if timer_til_salg < 0:
-            # Noe rart med rekkefølgen – hopp over
-            continue
-
-        # Plukk ut felter
-        merke = sale_row.get(colmap["Merke"]) if colmap["Merke"] else ""
-        modell = sale_row.get(colmap["Modell"]) if colmap["Modell"] else ""
-        aar = sale_row.get(colmap["Årstall"]) if colmap["Årstall"] else None
-        km = sale_row.get(colmap["Kjørelengde"]) if colmap["Kjørelengde"] else None
-        pris_raw = sale_row.get(colmap["Pris"]) if colmap["Pris"] else None
-        drivstoff = sale_row.get(colmap["Drivstoff"]) if colmap["Drivstoff"] else ""
-        forhandler_type = (
-            sale_row.get(colmap["Forhandler type"]) if colmap["Forhandler type"] else ""
-        )
-
-        # Konverter tall
-        aar_int = _extract_numeric(aar)
-        km_int = _extract_numeric(km)
-        pris_int = _extract_numeric(pris_raw)
-
-        records.append(
-            {
-                "FinnKode": str(finnkode),
-                "Finn": FINN_BASE_URL + str(finnkode),
-                "Merke": merke or "",
-                "Modell": modell or "",
-                "Årsmodell": aar_int,
-                "Km": km_int,
-                "Pris": pris_int,
-                "Drivstoff": drivstoff or "",
-                "Forhandler type": forhandler_type or "",
-                "timer_til_salg": float(timer_til_salg),
-                "foerste_gang_sett": first_time.isoformat(),
-            }
-        )
-
-    if not records:
-        return pd.DataFrame()
+    Tom mens hendelsestabellen lastes første gang. Resultatet deles mellom
+    forespørsler og må ikke muteres.
+    """
+    indeks = hent_rekordrask_indeks(startdato)
+    return indeks.df if indeks is not None else pd.DataFrame()
 
-    vis_df = pd.DataFrame.from_records(records)
 
-    # Sorter: raskest først
-    vis_df = vis_df.sort_values("timer_til_salg", ascending=True).reset_index(drop=True)
-    return vis_df
+if __name__ == "__main__":
+    hend = oppdater_salgshendelser(_snapshot_kilde(get_s3_client(), S3_BUCKET_NAME))
+    print(f"[salgshendelser] {HENDELSER_KEY}: {len(hend):,} FinnKoder")
@@ -0,0 +1,278 @@
+# snapshot_parquet.py
+"""
+Selektiv lesing av snapshot-Parquet (calc/bil/bil_time.parquet) direkte fra S3.
+
+I stedet for å laste ned hele filen leses footeren først, og deretter bare
+kolonnebitene (column chunks) som trengs:
+  - kolonneprojeksjon: kun kolonnene kalleren ber om
+  - radgruppe-pruning: radgrupper der snapshot_time (eller dato) ifølge
+    Parquet-statistikken slutter før analysevinduet hoppes over
+Bytene hentes med Range-GET låst til ETag-en (IfMatch), så footer og data
+alltid kommer fra samme versjon av filen. Med lokalt speil (LOCAL_MIRROR_DIR,
+se lokalt_speil) lastes filen i stedet ned én gang per ETag og leses
+minnemappet fra disk.
+
+Tekstkolonner med få unike verdier (merke, modell, drivstoff ...) kan
+leses dictionary-kodet og blir da pandas-kategorier i stedet for én
+Python-streng per rad. Konverteringen til pandas frigjør Arrow-bufferne
+underveis (self_destruct), og de hentede bytene slippes før konverteringen.
+
+Hver lesing rapporterer bytes hentet, rader dekodet og minnebruk
+(topp og etter lasting, målt som endring i prosessens RSS) i LeseStatistikk.
+"""
+import io
+import os
+import threading
+from datetime import date, datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from lokalt_speil import hent_lokal_kopi, speil_aktivt
+
+TIDSKOLONNER = ("snapshot_time", "dato")
+
+
+class LeseStatistikk:
+    def __init__(self):
+        self.bytes_lest = 0
+        self.foresporsler = 0
+        self.rader_dekodet = 0
+        self.radgrupper_lest = 0
+        self.radgrupper_totalt = 0
+        self.kolonner = []
+        self.lokalt = False
+        self.minne_topp = 0
+        self.minne_etter = 0
+        self.dataframe_bytes = 0
+
+    def __str__(self):
+        kilde = "lokalt speil" if self.lokalt else f"{self.foresporsler} forespørsler"
+        tekst = (
+            f"{self.bytes_lest / 1e6:.2f} MB lest ({kilde}), "
+            f"{self.rader_dekodet:,} rader dekodet "
+            f"({self.radgrupper_lest}/{self.radgrupper_totalt} radgrupper, {len(self.kolonner)} kolonner)"
+        )
+        if self.dataframe_bytes:
+            tekst += (
+                f", minne topp +{self.minne_topp / 1e6:.1f} MB / etter +{self.minne_etter / 1e6:.1f} MB"
+                f" (DataFrame {self.dataframe_bytes / 1e6:.1f} MB)"
+            )
+        return tekst
+
+
+def _topp_rss() -> int:
+    # resource finnes ikke på Windows; da blir minnetallene bare 0
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # ru_maxrss er i KiB på Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _rss() -> int:
+    """Nåværende RSS i bytes (Linux), ellers prosessens topp-RSS som tilnærming."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return _topp_rss()
+
+
+class _S3RangeFil(io.RawIOBase):
+    """Filobjekt for pyarrow som leser byteområder fra ett S3-objekt (én ETag)."""
+
+    def __init__(self, s3_client, bucket: str, key: str, storrelse: int, etag=None, statistikk=None):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.storrelse = storrelse
+        self.etag = etag
+        self.statistikk = statistikk or LeseStatistikk()
+        self._pos = 0
+        self._lock = threading.Lock()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.storrelse
+        self._pos = max(0, min(offset, self.storrelse))
+        return self._pos
+
+    def read(self, n=-1):
+        with self._lock:
+            slutt = self.storrelse if n is None or n < 0 else min(self.storrelse, self._pos + n)
+            if slutt <= self._pos:
+                return b""
+            kwargs = {"Bucket": self.bucket, "Key": self.key, "Range": f"bytes={self._pos}-{slutt - 1}"}
+            if self.etag:
+                kwargs["IfMatch"] = self.etag
+            data = self.s3.get_object(**kwargs)["Body"].read()
+            self._pos += len(data)
+            self.statistikk.bytes_lest += len(data)
+            self.statistikk.foresporsler += 1
+            return data
+
+
+def _tid_fra_statistikk(verdi):
+    ts = pd.Timestamp(verdi)
+    return ts.tz_localize(None) if ts.tz is not None else ts
+
+
+def _radgrupper_i_vindu(
+    metadata, fra: date | datetime | None, til: date | datetime | None = None
+) -> list[int]:
+    """
+    Radgrupper som kan inneholde rader fra og med `fra` og til og med `til`
+    (ukjent statistikk -> behold). En dato sammenlignes på datonivå, et
+    tidspunkt eksakt.
+    """
+    alle = list(range(metadata.num_row_groups))
+    if fra is None and til is None:
+        return alle
+
+    navn = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+    tidskol = next((c for c in TIDSKOLONNER if c in navn), None)
+    if tidskol is None:
+        return alle
+    idx = navn.index(tidskol)
+
+    behold = []
+    for rg in alle:
+        stats = metadata.row_group(rg).column(idx).statistics
+        if stats is None or not stats.has_min_max:
+            behold.append(rg)
+            continue
+        try:
+            if fra is not None:
+                maks = _tid_fra_statistikk(stats.max)
+                if (maks if isinstance(fra, datetime) else maks.normalize()) < _tid_fra_statistikk(fra):
+                    continue
+            if til is not None:
+                mini = _tid_fra_statistikk(stats.min)
+                if (mini if isinstance(til, datetime) else mini.normalize()) > _tid_fra_statistikk(til):
+                    continue
+        except (ValueError, TypeError):
+            pass
+        behold.append(rg)
+    return behold
+
+
+def til_dataframe(les_tabell, statistikk: LeseStatistikk) -> pd.DataFrame:
+    """
+    Kjører `les_tabell()` og gjør Arrow-tabellen om til pandas, med Arrow-
+    bufferne frigjort underveis. Minnebruken legges i `statistikk`.
+    """
+    rss_for, topp_for = _rss(), _topp_rss()
+    table = les_tabell()
+    rss_tabell = _rss()
+
+    df = table.to_pandas(self_destruct=True, split_blocks=True)
+    del table
+    rss_etter = _rss()
+
+    # Satte lastingen ny topp for prosessen, er den eksakt; ellers målt mellom stegene
+    topp_etter = _topp_rss()
+    topp = topp_etter if topp_etter > topp_for else max(rss_tabell, rss_etter)
+    statistikk.minne_topp = max(0, topp - rss_for)
+    statistikk.minne_etter = max(0, rss_etter - rss_for)
+    statistikk.dataframe_bytes = int(df.memory_usage(deep=True).sum())
+    return df
+
+
+class SnapshotFil:
+    """
+    Én versjon (ETag) av snapshot-filen: footer/metadata lest én gang,
+    deretter vilkårlig mange selektive lesinger.
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, etag=None, storrelse: int | None = None):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+        if etag is None or storrelse is None:
+            hode = s3_client.head_object(Bucket=bucket, Key=key)
+            etag = etag or hode.get("ETag")
+            storrelse = hode["ContentLength"]
+        self.etag = etag
+        self.storrelse = storrelse
+
+        self.statistikk = LeseStatistikk()
+        self.lokal_sti = None
+        if speil_aktivt():
+            try:
+                self.lokal_sti, lastet_ned = hent_lokal_kopi(s3_client, bucket, key, self.etag)
+                self.statistikk.bytes_lest = lastet_ned
+            except Exception as e:
+                print(f"[speil] Kunne ikke speile {key}, leser direkte fra S3: {e}")
+
+        self.metadata = pq.ParquetFile(self._fil(self.statistikk)).metadata
+        self.kolonner = [self.metadata.schema.column(i).name for i in range(self.metadata.num_columns)]
+
+    def _fil(self, statistikk):
+        if self.lokal_sti:
+            statistikk.lokalt = True
+            return pa.memory_map(self.lokal_sti, "r")
+        return _S3RangeFil(self.s3, self.bucket, self.key, self.storrelse, self.etag, statistikk)
+
+    def les_tabell(self, kolonner, fra, til, kategorier, statistikk: LeseStatistikk) -> pa.Table:
+        """Som `les`, men gir Arrow-tabellen og legger tallene til `statistikk`."""
+        if kolonner is None:
+            valgt = list(self.kolonner)
+        else:
+            onsket = set(kolonner) | set(TIDSKOLONNER)
+            valgt = [c for c in self.kolonner if c in onsket]
+
+        radgrupper = _radgrupper_i_vindu(self.metadata, fra, til)
+        statistikk.kolonner = valgt
+        statistikk.radgrupper_totalt += self.metadata.num_row_groups
+        statistikk.radgrupper_lest += len(radgrupper)
+
+        tekst = {
+            self.metadata.schema.column(i).name
+            for i in range(self.metadata.num_columns)
+            if self.metadata.schema.column(i).physical_type == "BYTE_ARRAY"
+        }
+        dictionary = [c for c in valgt if c in tekst and c in set(kategorier)]
+
+        # Fra S3 samles byteområdene i få forespørsler; fra minnemappet fil leses de direkte
+        pf = pq.ParquetFile(
+            self._fil(statistikk),
+            metadata=self.metadata,
+            pre_buffer=not self.lokal_sti,
+            read_dictionary=dictionary,
+        )
+        table = pf.read_row_groups(radgrupper, columns=valgt)
+        statistikk.rader_dekodet += table.num_rows
+        # De forhåndsbufrede bytene holdes av ParquetFile; de slippes når den går ut av scope
+        return table
+
+    def les(
+        self,
+        kolonner=None,
+        fra: date | datetime | None = None,
+        kategorier=(),
+        til: date | datetime | None = None,
+    ) -> tuple[pd.DataFrame, LeseStatistikk]:
+        """
+        Leser `kolonner` (de som finnes i filen; None = alle) fra radgruppene
+        som kan ha snapshots fra og med `fra` (og til og med `til`).
+        Tidskolonnen tas alltid med. Tekstkolonner i `kategorier` blir
+        pandas-kategorier.
+        """
+        statistikk = LeseStatistikk()
+        df = til_dataframe(lambda: self.les_tabell(kolonner, fra, til, kategorier, statistikk), statistikk)
+        print(f"[parquet] {self.key}: {statistikk}")
+        return df, statistikk
@@ -0,0 +1,216 @@
+# snapshot_partisjoner.py
+"""
+Snapshot-historikken for bil lagret datopartisjonert (hive-stil) i S3:
+
+    calc/bil/snapshots/dato=2025-11-01/part-20251101T130000-1a2b3c4d.parquet
+    calc/bil/snapshots/dato=2025-11-01/part-20251101T140000-5e6f7a8b.parquet
+    ...
+    calc/bil/snapshots/_versjon.json
+
+Hver ny kjøring legger til én liten del-fil per dato den har snapshots for,
+i stedet for å skrive hele bil_time.parquet på nytt. Del-filene endres
+aldri etter at de er skrevet, så det lokale speilet (lokalt_speil) laster
+ned hver av dem bare én gang.
+
+_versjon.json skrives på nytt etter hver tillegging. ETag-en dens er
+datasettets versjon (for DatasettCache og salgshendelsene), slik ETag-en
+til bil_time.parquet var det før.
+
+Lesing lister bare partisjonene som overlapper vinduet (hive-navnene
+sorterer leksikalsk, så listingen starter rett på `fra` med StartAfter),
+leser de valgte kolonnene/radgruppene fra hver del-fil med SnapshotFil og
+gjør alt om til én DataFrame til slutt.
+
+Migrering fra den gamle enkeltfilen og tillegging fra fil:
+    python snapshot_partisjoner.py migrer
+    python snapshot_partisjoner.py legg-til nye_snapshots.parquet
+"""
+import json
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import pandas as pd
+import pyarrow as pa
+
+from parquet_sidecar import dataframe_til_parquet
+from snapshot_parquet import LeseStatistikk, SnapshotFil, til_dataframe
+
+PARTISJON_PREFIX = "calc/bil/snapshots/"
+VERSJON_KEY = PARTISJON_PREFIX + "_versjon.json"
+
+# Del-filer som åpnes og leses samtidig (footer + kolonnebiter per fil)
+LESE_TRAADER = 8
+
+
+def _dato(verdi: date | datetime) -> str:
+    return pd.Timestamp(verdi).strftime("%Y-%m-%d")
+
+
+def _partisjon_av(key: str) -> str | None:
+    """'calc/bil/snapshots/dato=2025-11-01/part-....parquet' -> '2025-11-01'"""
+    rest = key[len(PARTISJON_PREFIX):]
+    if not rest.startswith("dato=") or not key.endswith(".parquet"):
+        return None
+    return rest[len("dato="):].split("/", 1)[0]
+
+
+def list_deler(s3_client, bucket: str, fra=None, til=None) -> list[dict]:
+    """
+    Del-filene i partisjonene fra og med `fra` til og med `til` (datoer;
+    None = ubegrenset), sortert på nøkkel, som S3-listingens objekter.
+    """
+    kwargs = {"Bucket": bucket, "Prefix": PARTISJON_PREFIX}
+    if fra is not None:
+        # Alt under dato=<fra>/ sorterer etter "dato=<fra>" selv
+        kwargs["StartAfter"] = f"{PARTISJON_PREFIX}dato={_dato(fra)}"
+    siste = _dato(til) if til is not None else None
+
+    deler = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for side in paginator.paginate(**kwargs):
+        for obj in side.get("Contents", []):
+            dag = _partisjon_av(obj["Key"])
+            if dag is None:
+                continue
+            if siste is not None and dag > siste:
+                return deler
+            deler.append(obj)
+    return deler
+
+
+class SnapshotPartisjoner:
+    """
+    Én versjon (ETag-en til _versjon.json) av den partisjonerte historikken.
+    Samme lesegrensesnitt som SnapshotFil.
+    """
+
+    def __init__(self, s3_client, bucket: str, etag=None):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = VERSJON_KEY
+        self.etag = etag or s3_client.head_object(Bucket=bucket, Key=VERSJON_KEY).get("ETag")
+
+    def datoer(self, fra: date | datetime | None = None, til: date | datetime | None = None) -> list[date]:
+        """Datoene som har del-filer i [fra, til], stigende."""
+        return sorted({date.fromisoformat(_partisjon_av(obj["Key"])) for obj in list_deler(self.s3, self.bucket, fra, til)})
+
+    def _les_del(self, obj: dict, kolonner, fra, til, kategorier) -> tuple[pa.Table, LeseStatistikk]:
+        fil = SnapshotFil(self.s3, self.bucket, obj["Key"], obj.get("ETag"), obj.get("Size"))
+        statistikk = LeseStatistikk()
+        table = fil.les_tabell(kolonner, fra, til, kategorier, statistikk)
+        # Footer (og ev. nedlasting til speilet) telles med
+        statistikk.bytes_lest += fil.statistikk.bytes_lest
+        statistikk.foresporsler += fil.statistikk.foresporsler
+        return table, statistikk
+
+    def les(
+        self,
+        kolonner=None,
+        fra: date | datetime | None = None,
+        kategorier=(),
+        til: date | datetime | None = None,
+    ) -> tuple[pd.DataFrame, LeseStatistikk]:
+        """
+        Som SnapshotFil.les, men åpner bare partisjonene som overlapper
+        [fra, til]. Innenfor hver del-fil hoppes radgrupper utenfor vinduet over.
+        """
+        deler = list_deler(self.s3, self.bucket, fra, til)
+        statistikk = LeseStatistikk()
+
+        def les_alle() -> pa.Table:
+            with ThreadPoolExecutor(max_workers=LESE_TRAADER) as pool:
+                resultater = list(pool.map(lambda obj: self._les_del(obj, kolonner, fra, til, kategorier), deler))
+
+            tabeller = []
+            for table, del_statistikk in resultater:
+                tabeller.append(table)
+                statistikk.bytes_lest += del_statistikk.bytes_lest
+                statistikk.foresporsler += del_statistikk.foresporsler
+                statistikk.rader_dekodet += del_statistikk.rader_dekodet
+                statistikk.radgrupper_lest += del_statistikk.radgrupper_lest
+                statistikk.radgrupper_totalt += del_statistikk.radgrupper_totalt
+                statistikk.lokalt = statistikk.lokalt or del_statistikk.lokalt
+                statistikk.kolonner = sorted(set(statistikk.kolonner) | set(del_statistikk.kolonner))
+            del resultater
+
+            if not tabeller:
+                return pa.table({"FinnKode": pa.array([], pa.string()), "snapshot_time": pa.array([], pa.timestamp("us"))})
+            # Del-filer skrevet på ulike tidspunkt kan ha litt ulike kolonner/typer
+            return pa.concat_tables(tabeller, promote_options="permissive")
+
+        df = til_dataframe(les_alle, statistikk)
+        print(f"[parquet] {PARTISJON_PREFIX}: {len(deler)} del-filer, {statistikk}")
+        return df, statistikk
+
+
+def _skriv_versjon(s3_client, bucket: str, nye_deler: list[str]):
+    innhold = {"oppdatert": datetime.now().isoformat(timespec="seconds"), "nye_deler": nye_deler}
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=VERSJON_KEY,
+        Body=json.dumps(innhold).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+
+def legg_til_snapshots(s3_client, bucket: str, df: pd.DataFrame) -> list[str]:
+    """
+    Skriver snapshotene i `df` som nye del-filer, én per dato, og oppdaterer
+    _versjon.json. Del-filene sorteres på snapshot_time, så radgruppe-
+    statistikken blir skarp. Gir nøklene som ble skrevet.
+    """
+    if "snapshot_time" in df.columns:
+        tid = pd.to_datetime(df["snapshot_time"], errors="coerce")
+    elif "dato" in df.columns:
+        tid = pd.to_datetime(df["dato"], errors="coerce")
+    else:
+        raise ValueError("Snapshots mangler kolonne 'snapshot_time' / 'dato'.")
+
+    uten_tid = int(tid.isna().sum())
+    if uten_tid:
+        print(f"[snapshots] Hopper over {uten_tid:,} rader uten gyldig tidspunkt")
+
+    dager = tid.dt.strftime("%Y-%m-%d").reset_index(drop=True)
+    nye_deler = []
+    for dag, pos in sorted(dager.groupby(dager).indices.items()):
+        del_tid = tid.iloc[pos]
+        rekkefolge = pos[del_tid.argsort(kind="stable").to_numpy()]
+        del_df = df.iloc[rekkefolge]
+        navn = f"part-{del_tid.max():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.parquet"
+        key = f"{PARTISJON_PREFIX}dato={dag}/{navn}"
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=dataframe_til_parquet(del_df, metadata={"partisjon": dag}),
+            ContentType="application/vnd.apache.parquet",
+        )
+        nye_deler.append(key)
+
+    # Versjonen oppdateres sist, så en leser aldri ser en versjon med halvskrevne deler
+    if nye_deler:
+        _skriv_versjon(s3_client, bucket, nye_deler)
+        print(f"[snapshots] {len(df) - uten_tid:,} snapshots skrevet til {len(nye_deler)} partisjon(er)")
+    return nye_deler
+
+
+def migrer_fra_enkeltfil(s3_client, bucket: str, key: str) -> list[str]:
+    """Deler opp den gamle enkeltfilen (f.eks. bil_time.parquet) i datopartisjoner."""
+    df, _ = SnapshotFil(s3_client, bucket, key).les()
+    return legg_til_snapshots(s3_client, bucket, df)
+
+
+if __name__ == "__main__":
+    from aws_clients import get_s3_client
+    from config import S3_BUCKET_NAME
+
+    kommando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if kommando == "migrer":
+        kilde = sys.argv[2] if len(sys.argv) > 2 else "calc/bil/bil_time.parquet"
+        migrer_fra_enkeltfil(get_s3_client(), S3_BUCKET_NAME, kilde)
+    elif kommando == "legg-til" and len(sys.argv) > 2:
+        legg_til_snapshots(get_s3_client(), S3_BUCKET_NAME, pd.read_parquet(sys.argv[2]))
+    else:
+        print(__doc__)
+        sys.exit(1)
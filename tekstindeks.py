@@ -0,0 +1,101 @@
+# tekstindeks.py
+"""
+Trigram-indeks for fritekstsøk (f.eks. i annonsetitler).
+
+Indeksen bygges én gang per datasettversjon og svarer på "hvilke rader
+inneholder denne teksten" (uavhengig av store/små bokstaver) som en
+sortert array med radnummer, som kan kombineres med de andre filtrene.
+
+Bygging er vektorisert: alle titler slås sammen til én array med
+tegnkoder, hvert trigram kodes som ett int64 (3 x 21 bit) og
+(trigram, rad)-parene sorteres. Et oppslag er da et binærsøk per trigram
+i søketeksten, snitt av radlistene og til slutt en eksakt kontroll av
+kandidatene (tre felles trigrammer betyr ikke nødvendigvis treff).
+Søketekster kortere enn tre tegn har ingen trigrammer; da kontrolleres
+kandidatene direkte med samme vektoriserte str.contains.
+"""
+import numpy as np
+import pandas as pd
+
+_SKILLETEGN = "\x00"
+
+
+def _trigramkoder(tegn: np.ndarray) -> np.ndarray:
+    tegn = tegn.astype(np.int64)
+    return (tegn[:-2] << 42) | (tegn[1:-1] << 21) | tegn[2:]
+
+
+def _tegnkoder(tekst: str) -> np.ndarray:
+    return np.frombuffer(tekst.encode("utf-32-le"), dtype=np.uint32)
+
+
+class TrigramIndeks:
+    def __init__(self, tekster: pd.Series):
+        lav = tekster.fillna("").astype(str).str.lower().to_numpy(dtype=object)
+        # Arrow-strenger, så den eksakte kontrollen av kandidatene går i C
+        self.tekster = pd.Series(lav, dtype="string[pyarrow]")
+        self.n = len(lav)
+
+        if self.n == 0:
+            self.koder = np.empty(0, dtype=np.int64)
+            self.starter = np.zeros(1, dtype=np.int64)
+            self.rader = np.empty(0, dtype=np.int32)
+            return
+
+        alle = _tegnkoder(_SKILLETEGN.join(lav) + _SKILLETEGN)
+        lengder = np.fromiter((len(t) for t in lav), dtype=np.int64, count=self.n)
+        rad_per_tegn = np.repeat(np.arange(self.n, dtype=np.int32), lengder + 1)
+
+        koder = _trigramkoder(alle)
+        rader = rad_per_tegn[:-2]
+        # Trigrammer som krysser skilletegnet hører ikke til noen tittel
+        gyldig = (alle[:-2] != 0) & (alle[1:-1] != 0) & (alle[2:] != 0)
+        koder, rader = koder[gyldig], rader[gyldig]
+
+        rekkefolge = np.lexsort((rader, koder))
+        koder, rader = koder[rekkefolge], rader[rekkefolge]
+        ny = np.ones(len(koder), dtype=bool)
+        ny[1:] = (koder[1:] != koder[:-1]) | (rader[1:] != rader[:-1])
+        koder, rader = koder[ny], rader[ny]
+
+        grense = np.flatnonzero(np.r_[True, koder[1:] != koder[:-1]])
+        self.koder = koder[grense]
+        self.starter = np.r_[grense, len(koder)]
+        self.rader = rader
+
+    def _rader_for(self, kode) -> np.ndarray:
+        i = np.searchsorted(self.koder, kode)
+        if i >= len(self.koder) or self.koder[i] != kode:
+            return np.empty(0, dtype=np.int32)
+        return self.rader[self.starter[i]:self.starter[i + 1]]
+
+    def sok(self, tekst: str, kandidater: np.ndarray | None = None) -> np.ndarray:
+        """
+        Sorterte radnummer der `tekst` forekommer. `kandidater` (sortert)
+        begrenser søket, f.eks. til radene som allerede matcher andre filtre.
+        """
+        term = (tekst or "").lower()
+        if not term:
+            return np.arange(self.n) if kandidater is None else kandidater
+
+        if len(term) >= 3:
+            postinger = sorted(
+                (self._rader_for(k) for k in np.unique(_trigramkoder(_tegnkoder(term)))),
+                key=len,
+            )
+            treff = postinger[0]
+            for p in postinger[1:]:
+                if len(treff) == 0:
+                    break
+                treff = np.intersect1d(treff, p, assume_unique=True)
+            if kandidater is not None:
+                treff = np.intersect1d(treff, kandidater, assume_unique=True)
+            if len(term) == 3:
+                # Ett trigram: treff i indeksen er eksakte
+                return treff.astype(np.int64)
+        else:
+            treff = np.arange(self.n) if kandidater is None else kandidater
+
+        treff = np.asarray(treff, dtype=np.int64)
+        funnet = self.tekster.iloc[treff].str.contains(term, regex=False).to_numpy(dtype=bool)
+        return treff[funnet]